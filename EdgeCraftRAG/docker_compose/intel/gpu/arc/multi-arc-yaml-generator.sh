@@ -93,6 +93,51 @@ services:
       ENABLE_BENCHMARK: \${ENABLE_BENCHMARK:-false}
       MAX_MODEL_LEN: \${MAX_MODEL_LEN:-5000}
       CHAT_HISTORY_ROUND: \${CHAT_HISTORY_ROUND:-0}
+      EMBEDDING_CACHE_SIZE_MB: \${EMBEDDING_CACHE_SIZE_MB:-1024}
+      EMBEDDING_CACHE_SAVE_INTERVAL: \${EMBEDDING_CACHE_SAVE_INTERVAL:-60}
+      INGEST_WORKERS: \${INGEST_WORKERS:-4}
+      INGEST_BATCH_SIZE: \${INGEST_BATCH_SIZE:-256}
+      STAGE_WORKERS: \${STAGE_WORKERS:-8}
+      RETRIEVER_CONCURRENCY: \${RETRIEVER_CONCURRENCY:-4}
+      POSTPROCESSOR_CONCURRENCY: \${POSTPROCESSOR_CONCURRENCY:-2}
+      GENERATOR_CONCURRENCY: \${GENERATOR_CONCURRENCY:-2}
+      RETRIEVAL_CACHE_SIZE: \${RETRIEVAL_CACHE_SIZE:-256}
+      RETRIEVAL_CACHE_TTL: \${RETRIEVAL_CACHE_TTL:-300}
+      RERANK_BATCH_SIZE: \${RERANK_BATCH_SIZE:-32}
+      RERANK_BATCH_WINDOW_MS: \${RERANK_BATCH_WINDOW_MS:-5}
+      RERANK_MAX_TOKENS: \${RERANK_MAX_TOKENS:-512}
+      EMBEDDING_BATCH_SIZE: \${EMBEDDING_BATCH_SIZE:-32}
+      EMBEDDING_BATCH_WINDOW_MS: \${EMBEDDING_BATCH_WINDOW_MS:-5}
+      ENABLE_SNAPSHOT: \${ENABLE_SNAPSHOT:-true}
+      SNAPSHOT_INTERVAL: \${SNAPSHOT_INTERVAL:-60}
+      SNAPSHOT_KEEP: \${SNAPSHOT_KEEP:-2}
+      RESIDENT_KB_MEMORY_MB: \${RESIDENT_KB_MEMORY_MB:-2048}
+      HISTORY_TOKEN_BUDGET: \${HISTORY_TOKEN_BUDGET:-1024}
+      CONTEXT_TOKEN_BUDGET: \${CONTEXT_TOKEN_BUDGET:-0}
+      LLM_QUEUE_SIZE: \${LLM_QUEUE_SIZE:-32}
+      VLLM_TIMEOUT: \${VLLM_TIMEOUT:-600}
+      VLLM_MAX_RETRIES: \${VLLM_MAX_RETRIES:-2}
+      VLLM_MAX_CONNECTIONS: \${VLLM_MAX_CONNECTIONS:-64}
+      URL_CHECK_TIMEOUT: \${URL_CHECK_TIMEOUT:-2}
+      URL_CHECK_TTL: \${URL_CHECK_TTL:-3600}
+      URL_CHECK_CONCURRENCY: \${URL_CHECK_CONCURRENCY:-16}
+      SESSION_STORE: \${SESSION_STORE:-memory}
+      SESSION_MAX_TURNS: \${SESSION_MAX_TURNS:-32}
+      SESSION_IDLE_TTL: \${SESSION_IDLE_TTL:-3600}
+      SESSION_MEMORY_MB: \${SESSION_MEMORY_MB:-64}
+      BENCHMARK_WINDOW: \${BENCHMARK_WINDOW:-1024}
+      VLLM_METRICS_INTERVAL: \${VLLM_METRICS_INTERVAL:-15}
+      SYSTEM_SAMPLE_INTERVAL: \${SYSTEM_SAMPLE_INTERVAL:-2}
+      SYSTEM_HISTORY_SIZE: \${SYSTEM_HISTORY_SIZE:-300}
+      MODEL_LOAD_WORKERS: \${MODEL_LOAD_WORKERS:-1}
+      MODEL_CACHE_DIR: \${MODEL_CACHE_DIR:-/home/user/ui_cache/ov_cache}
+      MODEL_WARMUP: \${MODEL_WARMUP:-true}
+      HYBRID_RETRIEVER_WORKERS: \${HYBRID_RETRIEVER_WORKERS:-8}
+      MILVUS_INSERT_BATCH_SIZE: \${MILVUS_INSERT_BATCH_SIZE:-512}
+      MILVUS_INSERT_CONCURRENCY: \${MILVUS_INSERT_CONCURRENCY:-4}
+      BM25_TF_CACHE_SIZE: \${BM25_TF_CACHE_SIZE:-100000}
+      BM25_SAVE_INTERVAL: \${BM25_SAVE_INTERVAL:-60}
+      FAISS_PQ_MIN_VECTORS: \${FAISS_PQ_MIN_VECTORS:-100000}
     volumes:
       - \${MODEL_PATH:-\${PWD}}:/home/user/models
       - \${DOC_PATH:-\${PWD}}:/home/user/docs
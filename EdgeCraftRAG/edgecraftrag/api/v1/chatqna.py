@@ -5,8 +5,9 @@ import requests
 from comps import GeneratedDoc
 from comps.cores.proto.api_protocol import ChatCompletionRequest
 from edgecraftrag.api_schema import RagOut
+from edgecraftrag.components.generation_scheduler import QueueFullError
 from edgecraftrag.context import ctx
-from edgecraftrag.utils import serialize_contexts, set_current_session
+from edgecraftrag.utils import serialize_contexts
 from fastapi import Body, FastAPI, File, HTTPException, UploadFile, status
 from fastapi.responses import StreamingResponse
 
@@ -17,7 +18,7 @@ chatqna_app = FastAPI()
 @chatqna_app.post(path="/v1/retrieval")
 async def retrieval(request: ChatCompletionRequest):
     try:
-        contexts = ctx.get_pipeline_mgr().run_retrieve(chat_request=request)
+        contexts = await ctx.get_pipeline_mgr().run_retrieve(chat_request=request)
         serialized_contexts = serialize_contexts(contexts)
 
         ragout = RagOut(query=request.messages, contexts=serialized_contexts, response="")
@@ -30,17 +31,19 @@ async def retrieval(request: ChatCompletionRequest):
 @chatqna_app.post(path="/v1/chatqna")
 async def chatqna(request: ChatCompletionRequest):
     try:
-        sessionid = request.user
-        set_current_session(sessionid)
+        # The session travels with the request, concurrent requests never see each other's history
+        session = ctx.get_session_mgr().get_session(request.user)
         generator = ctx.get_pipeline_mgr().get_active_pipeline().generator
         if generator:
             request.model = generator.model_id
         if request.stream:
-            ret, contexts = ctx.get_pipeline_mgr().run_pipeline(chat_request=request)
+            ret, contexts = await ctx.get_pipeline_mgr().run_pipeline(chat_request=request, session=session)
             return ret
         else:
-            ret, contexts = ctx.get_pipeline_mgr().run_pipeline(chat_request=request)
+            ret, contexts = await ctx.get_pipeline_mgr().run_pipeline(chat_request=request, session=session)
             return str(ret)
+    except QueueFullError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
@@ -49,7 +52,8 @@ async def chatqna(request: ChatCompletionRequest):
 @chatqna_app.post(path="/v1/ragqna")
 async def ragqna(request: ChatCompletionRequest):
     try:
-        res, contexts = ctx.get_pipeline_mgr().run_pipeline(chat_request=request)
+        session = ctx.get_session_mgr().get_session(request.user)
+        res, contexts = await ctx.get_pipeline_mgr().run_pipeline(chat_request=request, session=session)
         if isinstance(res, GeneratedDoc):
             res = res.text
         elif isinstance(res, StreamingResponse):
@@ -62,6 +66,8 @@ async def ragqna(request: ChatCompletionRequest):
 
         ragout = RagOut(query=request.messages, contexts=serialized_contexts, response=str(res))
         return ragout
+    except QueueFullError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
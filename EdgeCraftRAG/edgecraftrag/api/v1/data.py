@@ -1,7 +1,9 @@
 # Copyright (C) 2024 Intel Corporation
 # SPDX-License-Identifier: Apache-2.0
 
+import asyncio
 import os
+from typing import List
 
 from edgecraftrag.api_schema import DataIn, FilesIn
 from edgecraftrag.context import ctx
@@ -11,20 +13,55 @@ from werkzeug.utils import secure_filename
 data_app = FastAPI()
 
 
+# Remove the nodes of the given files from NodeMgr and the active indexer. Both backends delete
+# by node id, the ones NodeMgr tracks plus the ones the indexer lists under the files' documents.
+# Held under the ingest lock, snapshots read the indexer under it.
+async def remove_file_nodes(pl, file_keys):
+    if pl is None:
+        return
+    async with ctx.get_ingest_mgr().lock:
+        removed = ctx.get_node_mgr().del_nodes_by_file(file_keys)
+        if pl.indexer is not None:
+            await asyncio.to_thread(pl.indexer.delete_file_nodes, file_keys, removed.get(pl.node_parser.idx, []))
+
+
+# Load and parse files in the ingestion worker pool, nodes are indexed in batches as they are produced
+async def ingest_files(local_paths):
+    pl = ctx.get_pipeline_mgr().get_active_pipeline()
+    if pl is None:
+        return []
+    file_paths = ctx.get_file_mgr().list_files(local_paths)
+    return await ctx.get_ingest_mgr().ingest_files(pl, file_paths, ctx.get_file_mgr(), ctx.get_node_mgr())
+
+
+# Upsert files and directories in one ingestion job: drop the nodes of already ingested files before parsing them again
+async def upsert_files(local_paths: List[str]):
+    stale_files = [file for path in local_paths for file in ctx.get_file_mgr().get_files_by_path(path)]
+    if stale_files:
+        file_keys = [key for file in stale_files for key in file.get_file_keys()]
+        await remove_file_nodes(ctx.get_pipeline_mgr().get_active_pipeline(), file_keys)
+        for file in stale_files:
+            ctx.get_file_mgr().remove(file.idx)
+    return await ingest_files(local_paths)
+
+
 # Upload a text or files
 @data_app.post(path="/v1/data")
 async def add_data(request: DataIn):
-    docs = []
+    nodelist = []
     if request.text is not None:
-        docs.extend(ctx.get_file_mgr().add_text(text=request.text))
+        docs = ctx.get_file_mgr().add_text(text=request.text)
+        async with ctx.get_ingest_mgr().lock:
+            nodes = await asyncio.to_thread(ctx.get_pipeline_mgr().run_data_prepare, docs=docs)
+        if nodes is not None and nodes != -1 and len(nodes) > 0:
+            pl = ctx.get_pipeline_mgr().get_active_pipeline()
+            ctx.get_node_mgr().add_nodes(pl.node_parser.idx, nodes)
+            nodelist.extend(nodes)
     if request.local_path is not None:
-        docs.extend(ctx.get_file_mgr().add_files(docs=request.local_path))
+        nodelist.extend(await upsert_files([request.local_path]))
 
-    nodelist = ctx.get_pipeline_mgr().run_data_prepare(docs=docs)
-    if nodelist is None or len(nodelist) == 0:
+    if len(nodelist) == 0:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
-    pl = ctx.get_pipeline_mgr().get_active_pipeline()
-    ctx.get_node_mgr().add_nodes(pl.node_parser.idx, nodelist)
     return "Done"
 
 
@@ -32,15 +69,23 @@ async def add_data(request: DataIn):
 @data_app.post(path="/v1/data/reindex")
 async def redindex_data():
     pl = ctx.get_pipeline_mgr().get_active_pipeline()
-
-    ctx.get_node_mgr().del_nodes_by_np_idx(pl.node_parser.idx)
-    pl.indexer.reinitialize_indexer()
-    pl.update_indexer_to_retriever()
-
-    all_docs = ctx.get_file_mgr().get_all_docs()
-    nodelist = ctx.get_pipeline_mgr().run_data_prepare(docs=all_docs)
-    if nodelist is not None and len(nodelist) > 0:
-        ctx.get_node_mgr().add_nodes(pl.node_parser.idx, nodelist)
+    active_kb = ctx.knowledgemgr.get_active_knowledge_base()
+    kb_name = active_kb.name if active_kb else "default_kb"
+
+    # Snapshots and resident indexes are kept per knowledge base, the index is rebuilt for the active one.
+    # Snapshots and ingestion jobs wait on the ingest lock, retrievals wait until the index is rebuilt.
+    def reindex():
+        with pl.indexer.swapping():
+            ctx.get_node_mgr().del_nodes_by_np_idx(pl.node_parser.idx)
+            pl.indexer.reinitialize_indexer(kb_name)
+            pl.update_indexer_to_retriever()
+            all_docs = ctx.get_file_mgr().get_all_docs()
+            return ctx.get_pipeline_mgr().run_data_prepare(docs=all_docs)
+
+    async with ctx.get_ingest_mgr().lock:
+        nodelist = await asyncio.to_thread(reindex)
+        if nodelist is not None and nodelist != -1 and len(nodelist) > 0:
+            ctx.get_node_mgr().add_nodes(pl.node_parser.idx, nodelist)
 
     return "Done"
 
@@ -48,18 +93,48 @@ async def redindex_data():
 # Upload files by a list of file_path
 @data_app.post(path="/v1/data/files")
 async def add_files(request: FilesIn):
-    docs = []
+    nodelist = []
     if request.local_paths is not None:
-        docs.extend(ctx.get_file_mgr().add_files(docs=request.local_paths))
+        nodelist = await ingest_files(request.local_paths)
 
-    nodelist = ctx.get_pipeline_mgr().run_data_prepare(docs=docs)
-    if nodelist is None or len(nodelist) == 0:
+    if len(nodelist) == 0:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
-    pl = ctx.get_pipeline_mgr().get_active_pipeline()
-    ctx.get_node_mgr().add_nodes(pl.node_parser.idx, nodelist)
     return "Done"
 
 
+# GET progress and throughput of recent ingestion jobs
+@data_app.get(path="/v1/data/progress")
+async def get_ingest_progress():
+    return ctx.get_ingest_mgr().get_jobs()
+
+
+# GET progress of an ingestion job
+@data_app.get(path="/v1/data/progress/{job_id}")
+async def get_ingest_job(job_id):
+    job = ctx.get_ingest_mgr().get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job
+
+
+# GET status of the knowledge base snapshots
+@data_app.get(path="/v1/data/snapshot")
+async def get_snapshot_status():
+    return ctx.get_snapshot_mgr().get_status()
+
+
+# Snapshot the active knowledge base now
+@data_app.post(path="/v1/data/snapshot")
+async def save_snapshot():
+    try:
+        snapshot = await ctx.get_snapshot_mgr().save_active()
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+    if snapshot is None:
+        return "No changes since the last snapshot"
+    return snapshot
+
+
 # GET files
 @data_app.get(path="/v1/data/files")
 async def get_files():
@@ -75,20 +150,10 @@ async def get_file_docs(name):
 # DELETE a file
 @data_app.delete(path="/v1/data/files/{name}")
 async def delete_file(name):
-    if ctx.get_file_mgr().del_file(name):
+    file = ctx.get_file_mgr().get_file_by_name_or_id(name)
+    if file and ctx.get_file_mgr().del_file(name):
         pl = ctx.get_pipeline_mgr().get_active_pipeline()
-
-        # Current solution: reindexing all docs after deleting one file
-        # TODO: delete the nodes related to the file
-        ctx.get_node_mgr().del_nodes_by_np_idx(pl.node_parser.idx)
-        pl.indexer.reinitialize_indexer()
-        pl.update_indexer_to_retriever()
-
-        all_docs = ctx.get_file_mgr().get_all_docs()
-        nodelist = ctx.get_pipeline_mgr().run_data_prepare(docs=all_docs)
-        if nodelist is not None and len(nodelist) > 0:
-            ctx.get_node_mgr().add_nodes(pl.node_parser.idx, nodelist)
-
+        await remove_file_nodes(pl, file.get_file_keys())
         return f"File {name} is deleted"
     else:
         return f"File {name} not found"
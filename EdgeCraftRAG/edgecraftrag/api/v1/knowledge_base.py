@@ -5,8 +5,9 @@ import copy
 import json
 import os
 import re
+from typing import List
 
-from edgecraftrag.api.v1.data import add_data
+from edgecraftrag.api.v1.data import add_data, remove_file_nodes, upsert_files
 from edgecraftrag.api_schema import DataIn, KnowledgeBaseCreateIn
 from edgecraftrag.base import IndexerType
 from edgecraftrag.context import ctx
@@ -29,6 +30,12 @@ async def get_all_knowledge_bases():
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
 
 
+# Get the knowledge base indexes kept in memory
+@kb_app.get("/v1/knowledge/resident")
+async def get_resident_indexes():
+    return ctx.get_resident_index_mgr().get_status()
+
+
 # Get the specified knowledge base.
 @kb_app.get("/v1/knowledge/{knowledge_name}")
 async def get_knowledge_base(knowledge_name: str):
@@ -48,8 +55,11 @@ async def create_knowledge_base(knowledge: KnowledgeBaseCreateIn):
             )
         kb = ctx.knowledgemgr.create_knowledge_base(knowledge)
         if kb.active:
-            active_pl.indexer.reinitialize_indexer(kb.name)
-            active_pl.update_indexer_to_retriever()
+            if active_pl.indexer.comp_subtype != "milvus_vector":
+                await switch_knowledge_base_handler(active_pl, kb.name, [])
+            else:
+                active_pl.indexer.reinitialize_indexer(kb.name)
+                active_pl.update_indexer_to_retriever()
         await save_knowledge_to_file()
         return "Create knowledge base successfully"
     except Exception as e:
@@ -68,9 +78,10 @@ async def delete_knowledge_base(knowledge_name: str):
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Cannot delete a running knowledge base."
             )
         kb_file_path = rm_kb.get_file_paths()
-        if kb_file_path:
-            if active_pl.indexer.comp_subtype == "milvus_vector":
-                await remove_file_handler([], knowledge_name)
+        if active_pl.indexer.comp_subtype != "milvus_vector":
+            ctx.get_resident_index_mgr().drop(rm_kb.name)
+        elif kb_file_path:
+            await remove_file_handler([], knowledge_name)
             if active_kb:
                 active_pl.indexer.reinitialize_indexer(active_kb.name)
                 active_pl.update_indexer_to_retriever()
@@ -89,8 +100,7 @@ async def update_knowledge_base(knowledge: KnowledgeBaseCreateIn):
         active_pl = ctx.get_pipeline_mgr().get_active_pipeline()
         if active_pl.indexer.comp_subtype != "milvus_vector":
             if knowledge.active and knowledge.active != kb.active:
-                file_paths = kb.get_file_paths()
-                await update_knowledge_base_handler(file_paths, knowledge.name)
+                await switch_knowledge_base_handler(active_pl, knowledge.name, kb.get_file_paths())
             elif not knowledge.active and kb.description != knowledge.description:
                 pass
             elif not knowledge.active:
@@ -146,7 +156,9 @@ async def add_file_to_knowledge_base(knowledge_name, file_path: DataIn):
                     active_pl.update_indexer_to_retriever()
                     await update_knowledge_base_handler(file_path, knowledge_name, add_file=True)
                 else:
-                    await update_knowledge_base_handler(kb_file_path, knowledge_name)
+                    # Only ingest the new file into the target collection, then switch back
+                    active_pl.indexer.reinitialize_indexer(kb.name)
+                    await update_knowledge_base_handler(file_path, knowledge_name, add_file=True)
                     active_pl.indexer.reinitialize_indexer(active_kb.name)
                     active_pl.update_indexer_to_retriever()
             else:
@@ -176,22 +188,21 @@ async def remove_file_from_knowledge_base(knowledge_name, file_path: DataIn):
         else:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File remove failure")
 
-        kb_file_path = kb.get_file_paths()
-        if active_pl.indexer.comp_subtype == "milvus_vector":
-            if active_kb:
-                if active_kb.name == knowledge_name or active_kb.idx == knowledge_name:
-                    await remove_file_handler(kb_file_path, knowledge_name)
-                else:
-                    await remove_file_handler(kb_file_path, knowledge_name)
-                    active_pl.indexer.reinitialize_indexer(active_kb.name)
-                    active_pl.update_indexer_to_retriever()
-            else:
-                await remove_file_handler(kb_file_path, knowledge_name)
-                active_pl.indexer.reinitialize_indexer(active_kb.name)
-                active_pl.update_indexer_to_retriever()
-        elif active_kb:
-            if active_kb.name == knowledge_name or active_kb.idx == knowledge_name:
-                await update_knowledge_base_handler(kb_file_path, knowledge_name)
+        is_active_kb = active_kb is not None and (active_kb.name == knowledge_name or active_kb.idx == knowledge_name)
+        if is_active_kb:
+            for file in ctx.get_file_mgr().get_files_by_path(file_path.local_path):
+                ctx.get_file_mgr().remove(file.idx)
+            await remove_file_nodes(active_pl, [file_path.local_path])
+        elif active_pl.indexer.comp_subtype == "milvus_vector":
+            # Point the indexer at the collection of the target knowledge base, delete there and switch back
+            try:
+                async with ctx.get_ingest_mgr().lock:
+                    active_pl.indexer.reinitialize_indexer(kb.name)
+                    active_pl.indexer.delete_file_nodes([file_path.local_path])
+                    active_pl.indexer.reinitialize_indexer(active_kb.name if active_kb else "default_kb")
+            except MilvusException as e:
+                raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+            active_pl.update_indexer_to_retriever()
         await save_knowledge_to_file()
         return "File deleted successfully"
     except ValueError as e:
@@ -212,14 +223,25 @@ async def update_knowledge_base_handler(file_path=None, knowledge_name: str = "d
             pl.indexer.reinitialize_indexer(knowledge_name)
             pl.update_indexer_to_retriever()
             if file_path:
-                for file in file_path:
-                    request = DataIn(local_path=file)
-                    await add_data(request)
+                await upsert_files(file_path)
         except MilvusException as e:
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
         return "Done"
 
 
+# Switch the indexer of the pipeline to a knowledge base, a knowledge base whose index is
+# still resident is switched to without reindexing, only files added or removed since are synced
+async def switch_knowledge_base_handler(pl, knowledge_name: str, local_paths: List[str]):
+    file_paths = ctx.get_file_mgr().list_files(local_paths)
+    added_files, removed_files = await ctx.get_resident_index_mgr().switch_knowledge_base(
+        pl, knowledge_name, file_paths
+    )
+    if removed_files:
+        await remove_file_nodes(pl, removed_files)
+    if added_files:
+        await upsert_files(added_files)
+
+
 # Update knowledge base data
 async def remove_file_handler(file_path=None, knowledge_name: str = "default_kb"):
     if ctx.get_pipeline_mgr().get_active_pipeline() is None:
@@ -234,9 +256,7 @@ async def remove_file_handler(file_path=None, knowledge_name: str = "default_kb"
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
     pl.update_indexer_to_retriever()
     if file_path:
-        for file in file_path:
-            request = DataIn(local_path=file)
-            await add_data(request)
+        await upsert_files(file_path)
     return "Done"
 
 
@@ -255,10 +275,11 @@ async def load_knowledge_from_file():
                 kb = ctx.knowledgemgr.create_knowledge_base(pipeline_req)
                 if Knowledgebase_data["file_map"]:
                     if active_pl.indexer.comp_subtype != "milvus_vector" and Knowledgebase_data["active"]:
+                        # Unchanged files come back from the latest snapshot, only the others are ingested again
+                        await switch_knowledge_base_handler(
+                            active_pl, Knowledgebase_data["name"], list(Knowledgebase_data["file_map"].values())
+                        )
                         for file_path in Knowledgebase_data["file_map"].values():
-                            await update_knowledge_base_handler(
-                                DataIn(local_path=file_path), Knowledgebase_data["name"], add_file=True
-                            )
                             kb.add_file_path(file_path)
                     elif Knowledgebase_data["active"]:
                         active_pl.indexer.reinitialize_indexer(Knowledgebase_data["name"])
@@ -329,32 +350,26 @@ async def Synchronizing_vector_data(old_active_pl, new_active_pl):
             )
             # Synchronization of deleted files
             for kb_name, file_paths in deleted_files.items():
-                if file_paths:
+                if not file_paths:
+                    continue
+                if kb_name not in new_milvus_map.keys():
+                    # The knowledge base itself was deleted
                     new_active_pl.indexer.clear_milvus_collection(kb_name)
-                    if kb_name not in new_milvus_map.keys():
-                        continue
-                    kb = await get_knowledge_base(kb_name)
-                    new_active_pl.indexer.reinitialize_indexer(kb_name)
-                    file_paths = kb.get_file_paths()
-                    if file_paths:
-                        for file in file_paths:
-                            await add_data(DataIn(local_path=file))
+                    continue
+                # Only the nodes of the removed files are deleted, the rest of the collection is kept
+                new_active_pl.indexer.reinitialize_indexer(kb_name)
+                await remove_file_nodes(new_active_pl, list(file_paths.values()))
             # Synchronization of added files
             for kb_name, file_paths in added_files.items():
                 if file_paths:
-                    for file_path in file_paths.values():
-                        new_active_pl.indexer.reinitialize_indexer(kb_name)
-                        await add_data(DataIn(local_path=file_path))
+                    new_active_pl.indexer.reinitialize_indexer(kb_name)
+                    await upsert_files(list(file_paths.values()))
 
             new_active_pl.indexer.reinitialize_indexer(active_kb.name)
             new_active_pl.update_indexer_to_retriever()
             await refresh_milvus_map(milvus_name)
         else:
-            new_active_pl.indexer.reinitialize_indexer()
-            new_active_pl.update_indexer_to_retriever()
-            add_list = active_kb.get_file_paths()
-            for file in add_list:
-                await add_data(DataIn(local_path=file))
+            await switch_knowledge_base_handler(new_active_pl, active_kb.name, active_kb.get_file_paths())
             if old_active_pl:
                 if old_active_pl.indexer.comp_subtype == "milvus_vector":
                     await refresh_milvus_map(milvus_name)
@@ -1,6 +1,7 @@
 # Copyright (C) 2024 Intel Corporation
 # SPDX-License-Identifier: Apache-2.0
 
+import asyncio
 import gc
 import os
 
@@ -49,19 +50,35 @@ async def get_model_by_name(model_id):
     return ctx.get_model_mgr().get_model_by_name(model_id)
 
 
-# POST Model
+# POST Model, with wait=false the model is loaded in the background and its load job is returned
 @model_app.post(path="/v1/settings/models")
-async def add_model(request: ModelIn):
+async def add_model(request: ModelIn, wait: bool = True):
     modelmgr = ctx.get_model_mgr()
-    # Currently use asyncio.Lock() to deal with multi-requests
-    async with modelmgr._lock:
-        model = modelmgr.search_model(request)
-        if model is None:
-            model = modelmgr.load_model(request)
-            modelmgr.add(model)
+    job, future = modelmgr.submit_load(request)
+    if not wait:
+        return job
+    try:
+        model = await asyncio.wrap_future(future)
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
     return model.model_id + " model loaded"
 
 
+# GET recent model load jobs
+@model_app.get(path="/v1/settings/model-jobs")
+async def get_model_jobs():
+    return ctx.get_model_mgr().get_jobs()
+
+
+# GET status of a model load job
+@model_app.get(path="/v1/settings/model-jobs/{job_id}")
+async def get_model_job(job_id):
+    job = ctx.get_model_mgr().get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job
+
+
 # PATCH Model
 @model_app.patch(path="/v1/settings/models/{model_id:path}")
 async def update_model(model_id, request: ModelIn):
@@ -85,8 +102,7 @@ async def update_model(model_id, request: ModelIn):
                 # Clean up memory occupation
                 gc.collect()
                 # load new model
-                model = modelmgr.load_model(request)
-                modelmgr.add(model)
+                model = await modelmgr.aget_or_load_model(request)
         return model
 
 
@@ -11,6 +11,7 @@ from edgecraftrag.api.v1.knowledge_base import Synchronizing_vector_data
 from edgecraftrag.api_schema import MilvusConnectRequest, PipelineCreateIn
 from edgecraftrag.base import IndexerType, InferenceType, ModelType, NodeParserType, PostProcessorType, RetrieverType
 from edgecraftrag.components.benchmark import Benchmark
+from edgecraftrag.components.faiss_index import FAISS_INDEX_PARAMS
 from edgecraftrag.components.generator import QnAGenerator
 from edgecraftrag.components.indexer import VectorIndexer
 from edgecraftrag.components.node_parser import (
@@ -20,7 +21,12 @@ from edgecraftrag.components.node_parser import (
     UnstructedNodeParser,
 )
 from edgecraftrag.components.postprocessor import MetadataReplaceProcessor, RerankProcessor
-from edgecraftrag.components.retriever import AutoMergeRetriever, SimpleBM25Retriever, VectorSimRetriever
+from edgecraftrag.components.retriever import (
+    AutoMergeRetriever,
+    HybridRetriever,
+    SimpleBM25Retriever,
+    VectorSimRetriever,
+)
 from edgecraftrag.context import ctx
 from fastapi import FastAPI, File, HTTPException, UploadFile, status
 from pymilvus import connections
@@ -61,6 +67,7 @@ async def get_pipeline_benchmark(name):
 # POST Pipeline
 @pipeline_app.post(path="/v1/settings/pipelines")
 async def add_pipeline(request: PipelineCreateIn):
+    await preload_models(request)
     return load_pipeline(request)
 
 
@@ -74,6 +81,7 @@ async def update_pipeline(name, request: PipelineCreateIn):
     if pl == active_pl:
         if request.active:
             raise HTTPException(status_code=status.HTTP_423_LOCKED, detail="Unable to patch an active pipeline...")
+    await preload_models(request)
     async with ctx.get_pipeline_mgr()._lock:
         try:
             update_pipeline_handler(pl, request)
@@ -102,9 +110,34 @@ async def upload_file(file: UploadFile = File(...)):
     content = await file.read()
     request = json.loads(content)
     pipeline_req = PipelineCreateIn(**request)
+    await preload_models(pipeline_req)
     return load_pipeline(pipeline_req)
 
 
+async def preload_models(request):
+    # Loads the models of the pipeline concurrently in the background before the pipeline is built,
+    # so the event loop is not blocked while they compile
+    model_paras = []
+    if request.indexer is not None and request.indexer.embedding_model:
+        request.indexer.embedding_model.model_type = ModelType.EMBEDDING
+        model_paras.append(request.indexer.embedding_model)
+    for processor in request.postprocessor or []:
+        if processor.processor_type == PostProcessorType.RERANKER and processor.reranker_model:
+            processor.reranker_model.model_type = ModelType.RERANKER
+            model_paras.append(processor.reranker_model)
+    loads = [ctx.get_model_mgr().aget_or_load_model(model_para) for model_para in model_paras]
+    gen = request.generator
+    if gen and gen.model is not None and gen.inference_type:
+        # Benchmark mode loads the LLM with its tokenizer and benchmark hook
+        benchmark = os.getenv("ENABLE_BENCHMARK", "False").lower() == "true"
+        gen.model.model_type = ModelType.VLLM if gen.inference_type == InferenceType.VLLM else ModelType.LLM
+        loads.append(ctx.get_model_mgr().aget_or_load_model(gen.model, benchmark=benchmark))
+    try:
+        await asyncio.gather(*loads)
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
 def load_pipeline(request):
     pl = ctx.get_pipeline_mgr().get_pipeline_by_name_or_id(request.name)
     if pl is None:
@@ -169,16 +202,22 @@ def update_pipeline_handler(pl, req):
         else:
             embed_model = None
             if ind.embedding_model:
-                embed_model = ctx.get_model_mgr().search_model(ind.embedding_model)
-                if embed_model is None:
-                    ind.embedding_model.model_type = ModelType.EMBEDDING
-                    embed_model = ctx.get_model_mgr().load_model(ind.embedding_model)
-                    ctx.get_model_mgr().add(embed_model)
+                ind.embedding_model.model_type = ModelType.EMBEDDING
+                embed_model = ctx.get_model_mgr().get_or_load_model(ind.embedding_model)
             match ind.indexer_type:
-                case IndexerType.DEFAULT_VECTOR | IndexerType.FAISS_VECTOR | IndexerType.MILVUS_VECTOR:
+                case (
+                    IndexerType.DEFAULT_VECTOR
+                    | IndexerType.FAISS_VECTOR
+                    | IndexerType.MILVUS_VECTOR
+                    | IndexerType.FAISS_HNSW
+                    | IndexerType.FAISS_IVF_FLAT
+                    | IndexerType.FAISS_IVF_PQ
+                    | IndexerType.FAISS_IVF_SQ8
+                ):
                     # TODO: **RISK** if considering 2 pipelines with different
                     # nodes, but same indexer, what will happen?
-                    pl.indexer = VectorIndexer(embed_model, ind.indexer_type, ind.vector_uri, kb_name)
+                    index_params = ind.model_dump(include=set(FAISS_INDEX_PARAMS), exclude_none=True)
+                    pl.indexer = VectorIndexer(embed_model, ind.indexer_type, ind.vector_uri, kb_name, index_params)
                 case _:
                     pass
             ctx.get_indexer_mgr().add(pl.indexer)
@@ -200,7 +239,9 @@ def update_pipeline_handler(pl, req):
             case RetrieverType.AUTOMERGE:
                 # AutoMergeRetriever looks at a set of leaf nodes and recursively "merges" subsets of leaf nodes that reference a parent node
                 if pl.indexer is not None:
-                    pl.retriever = AutoMergeRetriever(pl.indexer, similarity_top_k=retr.retrieve_topk)
+                    pl.retriever = AutoMergeRetriever(
+                        pl.indexer, simple_ratio_thresh=retr.simple_ratio_thresh, similarity_top_k=retr.retrieve_topk
+                    )
                 else:
                     return Exception("No indexer")
             case RetrieverType.BM25:
@@ -208,6 +249,21 @@ def update_pipeline_handler(pl, req):
                     pl.retriever = SimpleBM25Retriever(pl.indexer, similarity_top_k=retr.retrieve_topk)
                 else:
                     return Exception("No indexer")
+            case RetrieverType.HYBRID:
+                # Vector and BM25 retrieval run concurrently, their results are fused
+                if pl.indexer is not None:
+                    pl.retriever = HybridRetriever(
+                        pl.indexer,
+                        retr.retrieve_topk,
+                        vector_topk=retr.vector_topk,
+                        bm25_topk=retr.bm25_topk,
+                        fusion_mode=retr.fusion_mode,
+                        vector_weight=retr.vector_weight,
+                        bm25_weight=retr.bm25_weight,
+                        rrf_k=retr.rrf_k,
+                    )
+                else:
+                    raise Exception("No indexer")
             case _:
                 pass
         # Index is updated to retriever
@@ -221,11 +277,8 @@ def update_pipeline_handler(pl, req):
                 case PostProcessorType.RERANKER:
                     if processor.reranker_model:
                         prm = processor.reranker_model
-                        reranker_model = ctx.get_model_mgr().search_model(prm)
-                        if reranker_model is None:
-                            prm.model_type = ModelType.RERANKER
-                            reranker_model = ctx.get_model_mgr().load_model(prm)
-                            ctx.get_model_mgr().add(reranker_model)
+                        prm.model_type = ModelType.RERANKER
+                        reranker_model = ctx.get_model_mgr().get_or_load_model(prm)
                         postprocessor = RerankProcessor(reranker_model, processor.top_n)
                         pl.postprocessor.append(postprocessor)
                     else:
@@ -239,25 +292,16 @@ def update_pipeline_handler(pl, req):
         if gen.model is None:
             raise Exception("No ChatQnA Model")
         if gen.inference_type:
-            model = ctx.get_model_mgr().search_model(gen.model)
-            if model is None:
-                if gen.inference_type == InferenceType.VLLM:
-                    gen.model.model_type = ModelType.VLLM
-                else:
-                    gen.model.model_type = ModelType.LLM
-                if pl.enable_benchmark:
-                    model, tokenizer, bench_hook = ctx.get_model_mgr().load_model_ben(gen.model)
-                else:
-                    model = ctx.get_model_mgr().load_model(gen.model)
-                ctx.get_model_mgr().add(model)
+            gen.model.model_type = ModelType.VLLM if gen.inference_type == InferenceType.VLLM else ModelType.LLM
+            # Loaded by preload_models() already, except for pipelines restored from file
+            model = ctx.get_model_mgr().get_or_load_model(gen.model, benchmark=pl.enable_benchmark)
             # Use weakref to achieve model deletion and memory release
             model_ref = weakref.ref(model)
             pl.generator = QnAGenerator(
                 model_ref, gen.prompt_path, gen.inference_type, gen.vllm_endpoint, gen.prompt_content
             )
             if pl.enable_benchmark:
-                if "tokenizer" not in locals() or tokenizer is None:
-                    _, tokenizer, bench_hook = ctx.get_model_mgr().load_model_ben(gen.model)
+                tokenizer, bench_hook = ctx.get_model_mgr().get_bench_tools(gen.model)
                 pl.benchmark = Benchmark(pl.enable_benchmark, gen.inference_type, tokenizer, bench_hook)
             else:
                 pl.benchmark = Benchmark(pl.enable_benchmark, gen.inference_type)
@@ -1,14 +1,20 @@
 # Copyright (C) 2024 Intel Corporation
 # SPDX-License-Identifier: Apache-2.0
 
+import asyncio
 import platform
 from datetime import datetime
+from functools import lru_cache
 
 import cpuinfo
 import distro
 import openvino.runtime as ov
-import psutil
+from edgecraftrag.components.batching import get_batching_metrics
+from edgecraftrag.components.benchmark import render_prometheus
+from edgecraftrag.components.generation_scheduler import get_generation_metrics
+from edgecraftrag.context import ctx
 from fastapi import FastAPI, HTTPException, status
+from fastapi.responses import PlainTextResponse
 
 
 def get_available_devices():
@@ -19,45 +25,35 @@ def get_available_devices():
     return avail_devices
 
 
-def get_system_status():
-    cpu_usage = psutil.cpu_percent(interval=1)
-    memory_info = psutil.virtual_memory()
-    memory_usage = memory_info.percent
-    memory_total_gb = memory_info.total / (1024**3)
-    memory_used_gb = memory_info.used / (1024**3)
-    # uptime_seconds = time.time() - psutil.boot_time()
-    # uptime_hours, uptime_minutes = divmod(uptime_seconds // 60, 60)
-    disk_usage = psutil.disk_usage("/").percent
-    # net_io = psutil.net_io_counters()
-    os_info = platform.uname()
-    kernel_version = os_info.release
-    processor = cpuinfo.get_cpu_info()["brand_raw"]
-    dist_name = distro.name(pretty=True)
-
-    now = datetime.now()
-    current_time_str = now.strftime("%Y-%m-%d %H:%M")
-    status = {
-        "cpuUsage": cpu_usage,
-        "memoryUsage": memory_usage,
-        "memoryUsed": memory_used_gb,
-        "memoryTotal": memory_total_gb,
-        "diskUsage": disk_usage,
-        "kernel": kernel_version,
-        "processor": processor,
-        "os": dist_name,
-        "currentTime": current_time_str,
+@lru_cache(maxsize=1)
+def get_platform_info():
+    # Static, and cpuinfo takes about a second to collect it
+    return {
+        "kernel": platform.uname().release,
+        "processor": cpuinfo.get_cpu_info()["brand_raw"],
+        "os": distro.name(pretty=True),
     }
+
+
+def get_system_status(history: int = 0):
+    sampler = ctx.get_system_sampler()
+    status = {key: value for key, value in sampler.get_latest().items() if key != "timestamp"}
+    status.update(get_platform_info())
+    status["currentTime"] = datetime.now().strftime("%Y-%m-%d %H:%M")
+    if history > 0:
+        status["history"] = sampler.get_history(history)
     return status
 
 
 system_app = FastAPI()
 
 
-# GET Syetem info
+# GET Syetem info, with the last history samples of the utilization when history is set
 @system_app.get(path="/v1/system/info")
-async def get_system_info():
+async def get_system_info(history: int = 0):
     try:
-        return get_system_status()
+        # The platform info is collected on the first call, it blocks for about a second
+        return await asyncio.to_thread(get_system_status, history)
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
 
@@ -69,3 +65,45 @@ async def get_device_info():
         return get_available_devices()
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=str(e))
+
+
+# GET queue and latency metrics of the pipeline stages
+@system_app.get(path="/v1/system/stages")
+async def get_stage_metrics():
+    return ctx.get_stage_mgr().get_metrics()
+
+
+# GET batch size and queueing delay metrics of the batched models
+@system_app.get(path="/v1/system/batching")
+async def get_batching_info():
+    return get_batching_metrics()
+
+
+# GET queue depth and time in queue of the local LLM generation schedulers
+@system_app.get(path="/v1/system/generation")
+async def get_generation_info():
+    return get_generation_metrics()
+
+
+# GET number, memory use and evictions of the chat history sessions
+@system_app.get(path="/v1/system/sessions")
+async def get_sessions_info():
+    return ctx.get_session_mgr().get_status()
+
+
+def get_benchmarks():
+    return {
+        pl.name: pl.benchmark for pl in ctx.get_pipeline_mgr().get_pipelines() if pl.benchmark and pl.benchmark.enabled
+    }
+
+
+# GET p50/p90/p99 stage latencies, time to first token and tokens/s of the benchmarked pipelines
+@system_app.get(path="/v1/system/benchmark")
+async def get_benchmark_summary():
+    return {name: benchmark.get_summary() for name, benchmark in get_benchmarks().items()}
+
+
+# GET the benchmark metrics in the Prometheus text format
+@system_app.get(path="/v1/system/metrics", response_class=PlainTextResponse)
+async def get_prometheus_metrics():
+    return render_prometheus(get_benchmarks())
@@ -26,11 +26,25 @@ class IndexerIn(BaseModel):
     indexer_type: str
     embedding_model: Optional[ModelIn] = None
     vector_uri: Optional[str] = None
+    # Build and search parameters of the faiss_hnsw and faiss_ivf_* indexers
+    nlist: Optional[int] = None
+    nprobe: Optional[int] = None
+    m: Optional[int] = None
+    ef_search: Optional[int] = None
 
 
 class RetrieverIn(BaseModel):
     retriever_type: str
     retrieve_topk: Optional[int] = 3
+    # Branches and fusion of the hybrid retriever, branch top-k defaults to retrieve_topk
+    vector_topk: Optional[int] = None
+    bm25_topk: Optional[int] = None
+    fusion_mode: Optional[str] = "rrf"
+    vector_weight: Optional[float] = 1.0
+    bm25_weight: Optional[float] = 1.0
+    rrf_k: Optional[int] = 60
+    # Share of the children of a node that must be retrieved to merge them into it, for auto_merge
+    simple_ratio_thresh: Optional[float] = 0.5
 
 
 class PostProcessorIn(BaseModel):
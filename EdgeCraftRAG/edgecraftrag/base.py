@@ -51,6 +51,10 @@ class IndexerType(str, Enum):
     FAISS_VECTOR = "faiss_vector"
     DEFAULT_VECTOR = "vector"
     MILVUS_VECTOR = "milvus_vector"
+    FAISS_HNSW = "faiss_hnsw"
+    FAISS_IVF_FLAT = "faiss_ivf_flat"
+    FAISS_IVF_PQ = "faiss_ivf_pq"
+    FAISS_IVF_SQ8 = "faiss_ivf_sq8"
 
 
 class RetrieverType(str, Enum):
@@ -58,6 +62,13 @@ class RetrieverType(str, Enum):
     VECTORSIMILARITY = "vectorsimilarity"
     AUTOMERGE = "auto_merge"
     BM25 = "bm25"
+    HYBRID = "hybrid"
+
+
+class FusionMode(str, Enum):
+
+    RRF = "rrf"
+    WEIGHTED = "weighted"
 
 
 class PostProcessorType(str, Enum):
@@ -0,0 +1,173 @@
+# Copyright (C) 2025 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Sequence
+
+# Upper bounds of the batch size histogram buckets
+_BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class _Request:
+
+    __slots__ = ("items", "future", "enqueued")
+
+    def __init__(self, items: Sequence[Any]):
+        self.items = list(items)
+        self.future = Future()
+        self.enqueued = time.monotonic()
+
+
+class DynamicBatcher:
+    """Coalesces the items submitted by concurrent callers into shared batches.
+
+    A worker thread takes the first pending request, then keeps collecting
+    requests for up to window_ms or until max_batch_size items are gathered,
+    and hands all their items to process_fn in one call. process_fn returns
+    one result per item and may split its input further, e.g. into length
+    buckets. Results are scattered back to the waiting callers.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        process_fn: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 32,
+        window_ms: float = 5.0,
+    ):
+        self.name = name
+        self.process_fn = process_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.window = max(0.0, window_ms) / 1000
+        self._queue: "queue.Queue[_Request]" = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self._closed = False
+
+        self.requests = 0
+        self.items = 0
+        self.batches = 0
+        self.total_queue_delay = 0.0
+        self.max_queue_delay = 0.0
+        self.batch_sizes = {bound: 0 for bound in _BATCH_SIZE_BUCKETS}
+        self.batch_sizes_overflow = 0
+
+    def _ensure_worker(self):
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name=f"batcher-{self.name}", daemon=True)
+                self._worker.start()
+
+    def submit(self, items: Sequence[Any]) -> Future:
+        if self._closed:
+            raise RuntimeError(f"{self.name}: batcher is closed")
+        request = _Request(items)
+        if not request.items:
+            request.future.set_result([])
+            return request.future
+        self._ensure_worker()
+        self._queue.put(request)
+        return request.future
+
+    def run(self, items: Sequence[Any]) -> List[Any]:
+        return self.submit(items).result()
+
+    async def arun(self, items: Sequence[Any]) -> List[Any]:
+        return await asyncio.wrap_future(self.submit(items))
+
+    def close(self):
+        # Pending requests are still processed, the worker exits afterwards
+        self._closed = True
+        self._queue.put(None)
+
+    def _collect(self) -> List[_Request]:
+        first = self._queue.get()
+        if first is None:
+            return []
+        pending = [first]
+        count = len(first.items)
+        deadline = first.enqueued + self.window
+        while count < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                request = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                self._queue.put(None)
+                break
+            pending.append(request)
+            count += len(request.items)
+        return pending
+
+    def _run(self):
+        while True:
+            pending = self._collect()
+            if not pending:
+                return
+            items = [item for request in pending for item in request.items]
+            self._record(pending, len(items))
+            try:
+                results = self.process_fn(items)
+                if len(results) != len(items):
+                    raise RuntimeError(f"{self.name}: got {len(results)} results for {len(items)} items")
+            except Exception as e:
+                for request in pending:
+                    request.future.set_exception(e)
+                continue
+            offset = 0
+            for request in pending:
+                request.future.set_result(results[offset : offset + len(request.items)])
+                offset += len(request.items)
+
+    def _record(self, pending: List[_Request], batch_size: int):
+        now = time.monotonic()
+        for request in pending:
+            delay = now - request.enqueued
+            self.total_queue_delay += delay
+            self.max_queue_delay = max(self.max_queue_delay, delay)
+        self.requests += len(pending)
+        self.items += batch_size
+        self.batches += 1
+        for bound in _BATCH_SIZE_BUCKETS:
+            if batch_size <= bound:
+                self.batch_sizes[bound] += 1
+                break
+        else:
+            self.batch_sizes_overflow += 1
+
+    def stats(self) -> Dict[str, Any]:
+        histogram = {f"<={bound}": count for bound, count in self.batch_sizes.items()}
+        histogram[f">{_BATCH_SIZE_BUCKETS[-1]}"] = self.batch_sizes_overflow
+        return {
+            "name": self.name,
+            "max_batch_size": self.max_batch_size,
+            "window_ms": self.window * 1000,
+            "requests": self.requests,
+            "items": self.items,
+            "batches": self.batches,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "avg_queue_delay_ms": round(self.total_queue_delay / self.requests * 1000, 3) if self.requests else 0.0,
+            "max_queue_delay_ms": round(self.max_queue_delay * 1000, 3),
+            "batch_size_histogram": histogram,
+        }
+
+
+# Batchers by kind and model, reported by the system API
+_batchers: Dict[str, Dict[str, DynamicBatcher]] = {}
+
+
+def register_batcher(kind: str, name: str, batcher: DynamicBatcher):
+    _batchers.setdefault(kind, {})[name] = batcher
+
+
+def unregister_batcher(kind: str, name: str):
+    _batchers.get(kind, {}).pop(name, None)
+
+
+def get_batching_metrics() -> Dict[str, Dict[str, Any]]:
+    return {kind: {name: batcher.stats() for name, batcher in batchers.items()} for kind, batchers in _batchers.items()}
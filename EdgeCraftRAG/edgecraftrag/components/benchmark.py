@@ -3,13 +3,60 @@
 
 import os
 import threading
-from typing import Any, List, Optional
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional
 
 import requests
 from edgecraftrag.base import BaseComponent, CompType, InferenceType, ModelType
 from prometheus_client.parser import text_string_to_metric_families
 from pydantic import BaseModel, Field, model_serializer
 
+# Latest samples per metric the percentiles are computed from
+BENCHMARK_WINDOW = int(os.getenv("BENCHMARK_WINDOW", "1024"))
+# Per-request records kept, the most recent one is shown by the benchmark API
+BENCHMARK_HISTORY = int(os.getenv("BENCHMARK_HISTORY", "64"))
+# Seconds between two scrapes of the vLLM /metrics endpoint
+VLLM_METRICS_INTERVAL = float(os.getenv("VLLM_METRICS_INTERVAL", "15"))
+
+_PIPELINE_STAGES = [CompType.RETRIEVER, CompType.POSTPROCESSOR, CompType.GENERATOR]
+# Branches of the hybrid retriever, timed within the retriever stage
+_RETRIEVER_BRANCHES = ["retriever_vector", "retriever_bm25"]
+_QUANTILES = (0.5, 0.9, 0.99)
+
+
+class RollingStats:
+    """Percentiles over the latest window samples, count and sum over all of them."""
+
+    def __init__(self, window: int = BENCHMARK_WINDOW):
+        self._samples = deque(maxlen=max(1, window))
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value: float):
+        with self._lock:
+            self._samples.append(value)
+            self.count += 1
+            self.total += value
+
+    def quantiles(self) -> Dict[float, float]:
+        with self._lock:
+            ordered = sorted(self._samples)
+        return {q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in _QUANTILES} if ordered else {}
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            ordered = sorted(self._samples)
+            count = self.count
+        if not ordered:
+            return {"count": count}
+        summary = {"count": count, "mean": round(sum(ordered) / len(ordered), 6)}
+        for q in _QUANTILES:
+            summary[f"p{round(q * 100)}"] = round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 6)
+        summary["max"] = round(ordered[-1], 6)
+        return summary
+
 
 class Benchmark(BaseComponent):
 
@@ -21,13 +68,23 @@ class Benchmark(BaseComponent):
         self.tokenizer = tokenizer
         self.bench_hook = bench_hook
 
-        self.benchmark_data_list = {}
-        self.llm_data_list = {}
+        # Bounded, the oldest records are dropped
+        self.benchmark_data_list = OrderedDict()
+        self.llm_data_list = OrderedDict()
+        # Stage latencies and generation speed of all requests, in seconds except tokens_per_sec
+        self.stats = {
+            stage: RollingStats() for stage in _PIPELINE_STAGES + _RETRIEVER_BRANCHES + ["ttft", "tokens_per_sec"]
+        }
 
         self._idx_lock = threading.Lock()
         self.last_idx = 0
         self.dict_idx = 0
 
+        self.retrieval_cache_hits = 0
+        self.retrieval_cache_misses = 0
+        if self.enabled and self.is_vllm:
+            get_vllm_metrics_scraper().start()
+
     def is_enabled(self):
         return self.enabled
 
@@ -49,7 +106,7 @@ class Benchmark(BaseComponent):
         return input_token_size
 
     def init_benchmark_data(self):
-        pipeline_comp = [CompType.RETRIEVER, CompType.POSTPROCESSOR, CompType.GENERATOR]
+        pipeline_comp = _PIPELINE_STAGES
         if self.is_enabled():
             with self._idx_lock:
                 self.last_idx += 1
@@ -64,18 +121,44 @@ class Benchmark(BaseComponent):
         if self.is_enabled() and idx in self.benchmark_data_list and comp_type in self.benchmark_data_list[idx]:
             self.benchmark_data_list[idx][comp_type] = end - start
 
+    @staticmethod
+    def _append(records, idx, data):
+        records[idx] = data
+        while len(records) > BENCHMARK_HISTORY:
+            records.popitem(last=False)
+
     def insert_benchmark_data(self, benchmark_data):
         idx = benchmark_data["idx"]
-        self.benchmark_data_list[idx] = benchmark_data
+        self._append(self.benchmark_data_list, idx, benchmark_data)
         self.dict_idx = idx
+        for stage in _PIPELINE_STAGES + _RETRIEVER_BRANCHES:
+            if isinstance(benchmark_data.get(stage), float):
+                self.stats[stage].add(benchmark_data[stage])
+
+    def insert_retrieval_cache_data(self, hit):
+        if hit:
+            self.retrieval_cache_hits += 1
+        else:
+            self.retrieval_cache_misses += 1
 
-    def insert_llm_data(self, idx, input_token_size):
+    def cal_output_token_size(self, output_text):
+        if not self.tokenizer or not output_text:
+            return None
+        return len(self.tokenizer(output_text, add_special_tokens=False)["input_ids"])
+
+    def insert_llm_data(self, idx, input_token_size, ttft=None, output_tokens=None, generation_time=None):
+        # ttft, output_tokens and generation_time are measured on the streamed response, if any
         if self.is_enabled():
             if self.is_vllm:
                 metrics = {}
                 if input_token_size != -1:
                     metrics["input_token_size"] = input_token_size
-                metrics = get_vllm_metrics(metrics)
+                # Scraped in the background, a request never waits for vLLM
+                vllm_metrics = get_vllm_metrics_scraper().get_latest()
+                if vllm_metrics:
+                    metrics.update(vllm_metrics)
+                if output_tokens is not None:
+                    metrics["output_token_size"] = output_tokens
             else:
                 bench_hook = self.bench_hook
                 if bench_hook:
@@ -91,10 +174,21 @@ class Benchmark(BaseComponent):
                     )
                     bench_hook.clear_time_list()
                     bench_hook.clear_time_infer_list()
+                    output_tokens = len(tm_list)
+                    generation_time = sum(tm_list)
+                    if ttft is None and tm_list:
+                        ttft = tm_list[0]
                 else:
                     metrics = None
 
-            self.llm_data_list[idx] = metrics
+            if ttft is not None:
+                self.stats["ttft"].add(ttft)
+            if output_tokens and generation_time:
+                self.stats["tokens_per_sec"].add(output_tokens / generation_time)
+            self._append(self.llm_data_list, idx, metrics)
+
+    def get_summary(self) -> Dict[str, Any]:
+        return {name: stats.summary() for name, stats in self.stats.items()}
 
     @model_serializer
     def ser_model(self):
@@ -105,6 +199,16 @@ class Benchmark(BaseComponent):
                     self.benchmark_data_list[self.dict_idx] if self.dict_idx in self.benchmark_data_list else None
                 ),
                 "llm_metrics": self.llm_data_list[self.dict_idx] if self.dict_idx in self.llm_data_list else None,
+                "latency": self.get_summary(),
+                "retrieval_cache": {
+                    "hits": self.retrieval_cache_hits,
+                    "misses": self.retrieval_cache_misses,
+                    "hit_rate": (
+                        round(self.retrieval_cache_hits / (self.retrieval_cache_hits + self.retrieval_cache_misses), 4)
+                        if self.retrieval_cache_hits + self.retrieval_cache_misses > 0
+                        else 0.0
+                    ),
+                },
             }
         else:
             set = {
@@ -116,10 +220,92 @@ class Benchmark(BaseComponent):
         pass
 
 
+class VLLMMetricsScraper:
+    """Scrapes the vLLM /metrics endpoint every interval seconds on a daemon thread."""
+
+    def __init__(self, interval: float = VLLM_METRICS_INTERVAL):
+        self.interval = max(1.0, interval)
+        self._latest = None
+        self.scraped_at = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="vllm-metrics", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self._latest = get_vllm_metrics({})
+                self.scraped_at = time.time()
+            except Exception as e:
+                print(f"Error scraping vLLM metrics: {e}")
+            time.sleep(self.interval)
+
+    def get_latest(self) -> Optional[Dict[str, Any]]:
+        latest = self._latest
+        if latest is None:
+            return None
+        return dict(latest, scraped_at=self.scraped_at)
+
+
+_vllm_metrics_scraper = None
+
+
+def get_vllm_metrics_scraper() -> VLLMMetricsScraper:
+    global _vllm_metrics_scraper
+    if _vllm_metrics_scraper is None:
+        _vllm_metrics_scraper = VLLMMetricsScraper()
+    return _vllm_metrics_scraper
+
+
+def _label(value) -> str:
+    value = getattr(value, "value", value)
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Rolling metrics of the benchmarks of every pipeline in the Prometheus text format, as summaries
+def render_prometheus(benchmarks: Dict[str, Benchmark]) -> str:
+    families = [
+        (
+            "edgecraftrag_stage_latency_seconds",
+            "Latency of a pipeline stage.",
+            _PIPELINE_STAGES + _RETRIEVER_BRANCHES,
+        ),
+        ("edgecraftrag_time_to_first_token_seconds", "Time from the start of generation to the first token.", ["ttft"]),
+        ("edgecraftrag_generation_tokens_per_second", "Generated tokens per second of a request.", ["tokens_per_sec"]),
+    ]
+    lines = []
+    for metric, help_text, names in families:
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} summary")
+        for pipeline, benchmark in benchmarks.items():
+            for name in names:
+                stats = benchmark.stats[name]
+                labels = f'pipeline="{_label(pipeline)}"'
+                if len(names) > 1:
+                    labels += f',stage="{_label(name)}"'
+                for q, value in stats.quantiles().items():
+                    lines.append(f'{metric}{{{labels},quantile="{q}"}} {value}')
+                lines.append(f"{metric}_sum{{{labels}}} {stats.total}")
+                lines.append(f"{metric}_count{{{labels}}} {stats.count}")
+    metric = "edgecraftrag_retrieval_cache_requests_total"
+    lines.append(f"# HELP {metric} Retrieval cache lookups.")
+    lines.append(f"# TYPE {metric} counter")
+    for pipeline, benchmark in benchmarks.items():
+        labels = f'pipeline="{_label(pipeline)}"'
+        lines.append(f'{metric}{{{labels},result="hit"}} {benchmark.retrieval_cache_hits}')
+        lines.append(f'{metric}{{{labels},result="miss"}} {benchmark.retrieval_cache_misses}')
+    return "\n".join(lines) + "\n"
+
+
 def get_vllm_metrics(metrics):
 
     llm_endpoint = os.getenv("vLLM_ENDPOINT", "http://localhost:8008")
-    response = requests.get(f"{llm_endpoint}/metrics", headers={"Content-Type": "application/json"})
+    response = requests.get(f"{llm_endpoint}/metrics", headers={"Content-Type": "application/json"}, timeout=10)
     if response.status_code == 200:
         metrics_data = text_string_to_metric_families(response.text)
     else:
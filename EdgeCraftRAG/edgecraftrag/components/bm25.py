@@ -0,0 +1,314 @@
+# Copyright (C) 2025 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import hashlib
+import heapq
+import json
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from llama_index.core.schema import BaseNode, MetadataMode
+
+BM25_DIR = os.path.join(os.getenv("TMPFILE_PATH", "/home/user/ui_cache"), "configs", "bm25")
+BM25_FORMAT_VERSION = 2
+# Term frequencies kept by text hash, beyond the ones of the indexed nodes
+BM25_TF_CACHE_SIZE = int(os.getenv("BM25_TF_CACHE_SIZE", "100000"))
+# Seconds between saves of the indexes changed since, also saved at shutdown
+BM25_SAVE_INTERVAL = float(os.getenv("BM25_SAVE_INTERVAL", "60"))
+
+try:
+    # Optional, the same English stemmer the bm25s based retriever used
+    import Stemmer
+
+    _stemmer = Stemmer.Stemmer("english")
+except ImportError:
+    _stemmer = None
+
+# Tokens of a persisted index must come from the same tokenizer as the ones of a query
+BM25_TOKENIZER = "unicode-words+snowball-english" if _stemmer is not None else "unicode-words"
+
+_CJK_IDEOGRAPHS = "\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"
+# Unicode words in any script (part numbers like "A12-3B" become "a12", "3b"), CJK ideographs
+# are indexed one by one since there is no whitespace segmentation
+_TOKEN_PATTERN = re.compile(rf"[{_CJK_IDEOGRAPHS}]|[^\W{_CJK_IDEOGRAPHS}]+", re.UNICODE)
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for if in into is it no not of on or such that the their then there these they "
+    "this to was will with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    # NFKC keeps precomposed accented letters in one word, casefold also folds e.g. "ß" to "ss"
+    tokens = [
+        tok for tok in _TOKEN_PATTERN.findall(unicodedata.normalize("NFKC", text).casefold()) if tok not in _STOPWORDS
+    ]
+    if _stemmer is not None:
+        tokens = _stemmer.stemWords(tokens)
+    return tokens
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def get_bm25_path(kb_name: str, persist_dir: str = BM25_DIR) -> str:
+    return os.path.join(persist_dir, f"{kb_name}.json")
+
+
+# Persist path -> index changed since it was last saved, at most one per file
+_pending: Dict[str, "BM25Index"] = {}
+_pending_lock = threading.Lock()
+# Held while a file is written, or taken over and loaded by a new index
+_save_lock = threading.RLock()
+_flusher: Optional[threading.Thread] = None
+
+
+def _mark_pending(index: "BM25Index"):
+    global _flusher
+    with _pending_lock:
+        _pending[index.persist_path] = index
+        if _flusher is None and BM25_SAVE_INTERVAL > 0:
+            _flusher = threading.Thread(target=_run_flusher, name="ecrag-bm25-save", daemon=True)
+            _flusher.start()
+
+
+def _take_pending(persist_path: str) -> Optional["BM25Index"]:
+    with _pending_lock:
+        return _pending.pop(persist_path, None)
+
+
+def _run_flusher():
+    while True:
+        time.sleep(BM25_SAVE_INTERVAL)
+        flush_bm25_indexes()
+
+
+def flush_bm25_indexes():
+    # Saves every index changed since its last save, called periodically and at shutdown
+    with _save_lock:
+        with _pending_lock:
+            indexes = list(_pending.values())
+            _pending.clear()
+        for index in indexes:
+            index.flush()
+
+
+def discard_pending(persist_path: str):
+    # Unsaved changes of a file that is reset, e.g. for a dropped Milvus collection
+    index = _take_pending(persist_path)
+    if index is not None:
+        with index._lock:
+            index._dirty = False
+
+
+class BM25Index:
+    """Incremental Okapi BM25 inverted index.
+
+    Postings map term -> {node_id: term frequency}. Document lengths, the total
+    corpus length and the document frequency of every term are maintained on
+    insert/delete so a query only touches the postings of its own terms.
+    Term frequencies are persisted per knowledge base and reused by content hash,
+    which lets a restarted server re-insert its nodes without re-tokenizing them.
+    Vector stores that keep their nodes across restarts (Milvus) never re-insert,
+    so for them restore_postings rebuilds the whole index from the persisted file.
+    Inserts and deletes only mark the index changed, the file is rewritten by
+    flush(), run every BM25_SAVE_INTERVAL seconds, at shutdown and before another
+    index loads the same file. Updating a file costs work proportional to its
+    nodes, not to the knowledge base.
+    """
+
+    def __init__(
+        self,
+        kb_name: str = "default_kb",
+        k1: float = 1.5,
+        b: float = 0.75,
+        persist_dir: str = BM25_DIR,
+        restore_postings: bool = False,
+        tf_cache_size: int = BM25_TF_CACHE_SIZE,
+    ):
+        self.kb_name = kb_name
+        self.k1 = k1
+        self.b = b
+        self.persist_path = get_bm25_path(kb_name, persist_dir) if persist_dir else None
+
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._doc_len: Dict[str, int] = {}
+        self._doc_hash: Dict[str, str] = {}
+        self._doc_tf: Dict[str, Dict[str, int]] = {}
+        self._total_len = 0
+        self._idf: Dict[str, float] = {}
+        # text hash -> term frequencies, loaded from disk and fed by every insert, least recently used first
+        self._tf_cache: "OrderedDict[str, Dict[str, int]]" = OrderedDict()
+        self._tf_cache_size = max(0, tf_cache_size)
+        self._dirty = False
+        self._lock = threading.RLock()
+        with _save_lock:
+            if self.persist_path:
+                # A previous index of the same file may hold changes not saved yet
+                previous = _take_pending(self.persist_path)
+                if previous is not None:
+                    previous.flush()
+            self.load(restore_postings)
+
+    def __len__(self) -> int:
+        return len(self._doc_len)
+
+    def __contains__(self, node_id: str) -> bool:
+        return node_id in self._doc_len
+
+    @property
+    def avgdl(self) -> float:
+        return self._total_len / len(self._doc_len) if self._doc_len else 0.0
+
+    def _cache_tf(self, digest: str, tf: Dict[str, int]):
+        self._tf_cache[digest] = tf
+        self._tf_cache.move_to_end(digest)
+        while len(self._tf_cache) > self._tf_cache_size:
+            self._tf_cache.popitem(last=False)
+
+    def _term_freqs(self, text: str, digest: str) -> Dict[str, int]:
+        tf = self._tf_cache.get(digest)
+        if tf is None:
+            tf = dict(Counter(tokenize(text)))
+        self._cache_tf(digest, tf)
+        return tf
+
+    def _add(self, node_id: str, digest: str, tf: Dict[str, int]):
+        if node_id in self._doc_len:
+            if self._doc_hash[node_id] == digest:
+                return
+            self._remove(node_id)
+        for term, freq in tf.items():
+            self._postings.setdefault(term, {})[node_id] = freq
+        length = sum(tf.values())
+        self._doc_len[node_id] = length
+        self._doc_hash[node_id] = digest
+        self._doc_tf[node_id] = tf
+        self._total_len += length
+
+    def _remove(self, node_id: str):
+        tf = self._doc_tf.pop(node_id, None)
+        if tf is None:
+            return
+        for term in tf:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(node_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_len -= self._doc_len.pop(node_id)
+        self._tf_cache.pop(self._doc_hash.pop(node_id, None), None)
+
+    def _changed(self):
+        self._idf.clear()
+        self._dirty = True
+        if self.persist_path:
+            _mark_pending(self)
+
+    def add_nodes(self, nodes: Iterable[BaseNode]):
+        with self._lock:
+            for node in nodes:
+                text = node.get_content(metadata_mode=MetadataMode.NONE)
+                digest = text_hash(text)
+                self._add(node.node_id, digest, self._term_freqs(text, digest))
+            self._changed()
+
+    def delete_nodes(self, node_ids: Iterable[str]):
+        with self._lock:
+            for node_id in node_ids:
+                self._remove(node_id)
+            self._changed()
+
+    def clear(self):
+        with self._lock:
+            self._postings.clear()
+            self._doc_len.clear()
+            self._doc_hash.clear()
+            self._doc_tf.clear()
+            self._total_len = 0
+            self._changed()
+
+    def idf(self, term: str) -> float:
+        idf = self._idf.get(term)
+        if idf is None:
+            df = len(self._postings.get(term, ()))
+            n = len(self._doc_len)
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            self._idf[term] = idf
+        return idf
+
+    def search(self, query: str, top_k: int, node_ids: Optional[set] = None) -> List[Tuple[str, float]]:
+        """Return up to top_k (node_id, score) pairs ordered by descending BM25 score."""
+        with self._lock:
+            if not self._doc_len or top_k <= 0:
+                return []
+            k1, b, avgdl = self.k1, self.b, self.avgdl
+            scores: Dict[str, float] = {}
+            for term, qf in Counter(tokenize(query)).items():
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = self.idf(term) * qf
+                for node_id, tf in postings.items():
+                    if node_ids is not None and node_id not in node_ids:
+                        continue
+                    norm = k1 * (1 - b + b * self._doc_len[node_id] / avgdl)
+                    scores[node_id] = scores.get(node_id, 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+            return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+    # Saves the changes since the last save, if any
+    def flush(self):
+        if self._dirty:
+            self.persist()
+
+    def persist(self):
+        if not self.persist_path:
+            return
+        with self._lock:
+            data = {
+                "version": BM25_FORMAT_VERSION,
+                "tokenizer": BM25_TOKENIZER,
+                "k1": self.k1,
+                "b": self.b,
+                "docs": {
+                    node_id: {"hash": self._doc_hash[node_id], "tf": self._doc_tf[node_id]} for node_id in self._doc_len
+                },
+            }
+            self._dirty = False
+        tmp_path = self.persist_path + ".tmp"
+        try:
+            with _save_lock:
+                os.makedirs(os.path.dirname(self.persist_path), exist_ok=True)
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(data, f, ensure_ascii=False)
+                os.replace(tmp_path, self.persist_path)
+        except Exception as e:
+            # Retried by the next periodic save
+            with self._lock:
+                self._dirty = True
+                _mark_pending(self)
+            print(f"Error saving BM25 index: {e}")
+
+    def load(self, restore_postings: bool = False):
+        # Unless restore_postings is set, persisted entries only warm up the term
+        # frequency cache. Postings are rebuilt from the nodes that are actually
+        # re-inserted into the indexer, so stale node ids are never returned.
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != BM25_FORMAT_VERSION or data.get("tokenizer") != BM25_TOKENIZER:
+                return
+            for node_id, doc in data.get("docs", {}).items():
+                self._cache_tf(doc["hash"], doc["tf"])
+                if restore_postings:
+                    self._add(node_id, doc["hash"], doc["tf"])
+        except Exception as e:
+            print(f"Error loading BM25 index: {e}")
@@ -0,0 +1,173 @@
+# Copyright (C) 2025 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# Token window of the LLM, shared by the prompt and the answer
+MAX_MODEL_LEN = int(os.getenv("MAX_MODEL_LEN", "5000"))
+# Tokens of the prompt kept for the chat history, the most recent rounds are kept
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1024"))
+# Tokens of the prompt kept for the retrieved context, 0 uses whatever the window leaves
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "0"))
+# Answer tokens reserved when the request does not set max_tokens
+DEFAULT_ANSWER_TOKENS = 1024
+# A node that does not fit is truncated into the remaining budget only if at least this many tokens are left
+MIN_PARTIAL_TOKENS = 64
+
+# Sentence ends of both latin and CJK text, the delimiter stays with its sentence
+_SENTENCE_END = re.compile(r"(?<=[.!?;])(?=\s)|(?<=[。！？；\n])")
+# Shorter sentences, e.g. list numbers or headings, are repeated legitimately and never dropped
+_MIN_DEDUPE_CHARS = 16
+
+
+def _split_sentences(text: str) -> List[str]:
+    return [sentence for sentence in _SENTENCE_END.split(text) if sentence.strip()]
+
+
+class ContextPacker:
+    """Assembles the retrieved context and chat history of a prompt within token budgets.
+
+    Tokens are counted with the tokenizer of the generator, text is counted
+    by characters when it is not available. The prompt template with the
+    query and the answer (max_tokens) are reserved first out of
+    MAX_MODEL_LEN, then the most recent history up to HISTORY_TOKEN_BUDGET,
+    and the rest goes to the context. Nodes are packed by descending score
+    until the context budget is used, text that overlaps nodes packed before
+    is dropped so overlapping chunks and sentence windows are not repeated.
+    """
+
+    def __init__(
+        self,
+        tokenizer=None,
+        max_model_len: int = MAX_MODEL_LEN,
+        history_budget: int = HISTORY_TOKEN_BUDGET,
+        context_budget: int = CONTEXT_TOKEN_BUDGET,
+        separator: str = "\n\n",
+    ):
+        self.tokenizer = tokenizer
+        self.max_model_len = max_model_len
+        self.history_budget = history_budget
+        self.context_budget = context_budget
+        self.separator = separator
+
+    def encode(self, text: str) -> List[Any]:
+        if not text:
+            return []
+        if self.tokenizer is None:
+            return list(text)
+        return self.tokenizer(text, add_special_tokens=False)["input_ids"]
+
+    def decode(self, tokens: List[Any]) -> str:
+        if self.tokenizer is None:
+            return "".join(tokens)
+        return self.tokenizer.decode(tokens, skip_special_tokens=True)
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.encode(text))
+
+    def truncate(self, text: str, budget: int, keep_end: bool = False) -> Tuple[str, int]:
+        tokens = self.encode(text)
+        if len(tokens) <= budget:
+            return text, len(tokens)
+        if budget <= 0:
+            return "", 0
+        tokens = tokens[-budget:] if keep_end else tokens[:budget]
+        return self.decode(tokens), len(tokens)
+
+    @staticmethod
+    def _node_text(node) -> str:
+        return node.node.get_text().strip()
+
+    @staticmethod
+    def _char_range(node) -> Optional[Tuple[str, int, int]]:
+        # Chunk offsets describe the node text only when no postprocessor replaced it, e.g. with a sentence window
+        inner = node.node
+        start, end = getattr(inner, "start_char_idx", None), getattr(inner, "end_char_idx", None)
+        if start is None or end is None or end - start != len(inner.get_text()):
+            return None
+        return inner.ref_doc_id or "", start, end
+
+    def _dedupe(self, node, text: str, ranges: Dict[str, List[Tuple[int, int]]], seen: set) -> str:
+        char_range = self._char_range(node)
+        if char_range is not None:
+            # Cut the parts of the chunk that chunks of the same document packed before already cover
+            doc_id, start, end = char_range
+            raw = node.node.get_text()
+            keep = [True] * len(raw)
+            for packed_start, packed_end in ranges.get(doc_id, []):
+                for i in range(max(start, packed_start) - start, min(end, packed_end) - start):
+                    keep[i] = False
+            ranges.setdefault(doc_id, []).append((start, end))
+            if not all(keep):
+                text = "".join(c for c, k in zip(raw, keep) if k).strip()
+        # Sentences already in the context, e.g. of overlapping sentence windows, are dropped
+        sentences = []
+        for sentence in _split_sentences(text):
+            key = sentence.strip()
+            if len(key) >= _MIN_DEDUPE_CHARS:
+                if key in seen:
+                    continue
+                seen.add(key)
+            sentences.append(sentence)
+        return "".join(sentences).strip()
+
+    def pack(self, nodes, budget: int, clean=None) -> Tuple[str, Dict[str, Any]]:
+        # Nodes without a score keep their retrieval order after the scored ones
+        ordered = sorted(nodes, key=lambda n: -n.score if n.score is not None else float("inf"))
+        ranges: Dict[str, List[Tuple[int, int]]] = {}
+        seen: set = set()
+        parts = []
+        used = 0
+        separator_tokens = self.count_tokens(self.separator)
+        stats = {"nodes_packed": 0, "nodes_deduped": 0, "nodes_dropped": 0, "truncated": False}
+        for i, node in enumerate(ordered):
+            text = self._dedupe(node, self._node_text(node), ranges, seen)
+            if clean is not None:
+                text = clean(text)
+            if not text:
+                stats["nodes_deduped"] += 1
+                continue
+            remaining = budget - used - (separator_tokens if parts else 0)
+            tokens = self.count_tokens(text)
+            if tokens > remaining:
+                if remaining >= MIN_PARTIAL_TOKENS:
+                    text, tokens = self.truncate(text, remaining)
+                    stats["truncated"] = True
+                else:
+                    stats["nodes_dropped"] += len(ordered) - i
+                    break
+            if parts:
+                used += separator_tokens
+            parts.append(text)
+            used += tokens
+            stats["nodes_packed"] += 1
+            if stats["truncated"]:
+                stats["nodes_dropped"] += len(ordered) - i - 1
+                break
+        stats["context_tokens"] = used
+        return self.separator.join(parts), stats
+
+    def assemble(self, format_prompt, history: str, nodes, max_tokens: Optional[int] = None, clean=None):
+        """Return the context, the history and the token breakdown of a prompt.
+
+        format_prompt(context, chat_history) renders the prompt with the query.
+        """
+        answer_tokens = max_tokens or DEFAULT_ANSWER_TOKENS
+        fixed_tokens = self.count_tokens(format_prompt("", ""))
+        available = max(0, self.max_model_len - answer_tokens - fixed_tokens)
+        history, history_tokens = self.truncate(history, min(self.history_budget, available), keep_end=True)
+        context_budget = available - history_tokens
+        if self.context_budget > 0:
+            context_budget = min(context_budget, self.context_budget)
+        context, stats = self.pack(nodes, context_budget, clean=clean)
+        stats.update(
+            template_tokens=fixed_tokens,
+            history_tokens=history_tokens,
+            context_budget=context_budget,
+            answer_tokens=answer_tokens,
+            prompt_tokens=fixed_tokens + history_tokens + stats["context_tokens"],
+            max_model_len=self.max_model_len,
+        )
+        return context, history, stats
@@ -14,7 +14,13 @@ class File(BaseComponent):
     comp_subtype: str = Field(default="")
     documents: List[Document] = Field(default=[])
 
-    def __init__(self, file_name: Optional[str] = None, file_path: Optional[str] = None, content: Optional[str] = None):
+    def __init__(
+        self,
+        file_name: Optional[str] = None,
+        file_path: Optional[str] = None,
+        content: Optional[str] = None,
+        documents: Optional[List[Document]] = None,
+    ):
         super().__init__(comp_type=CompType.FILE)
 
         if not file_name and not file_path:
@@ -27,11 +33,20 @@ class File(BaseComponent):
             self.name = _path.name
         self.file_path = _path
         self.comp_subtype = FileType.TEXT
-        if _path and _path.exists():
+        # Documents already loaded by an ingestion worker are taken as is
+        if documents is not None:
+            self.documents.extend(documents)
+        elif _path and _path.exists():
             self.documents.extend(convert_file_to_documents(_path))
         if content:
             self.documents.extend(convert_text_to_documents(content))
 
+    def get_file_keys(self) -> List[str]:
+        # Keys used by NodeMgr to map this file to its nodes
+        if self.file_path:
+            return [str(self.file_path)]
+        return [doc.doc_id for doc in self.documents]
+
     def run(self, **kwargs) -> Any:
         pass
 
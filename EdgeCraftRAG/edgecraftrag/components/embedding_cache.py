@@ -0,0 +1,229 @@
+# Copyright (C) 2025 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+EMBEDDING_CACHE_DIR = os.path.join(os.getenv("TMPFILE_PATH", "/home/user/ui_cache"), "embedding_cache")
+EMBEDDING_CACHE_SIZE_MB = int(os.getenv("EMBEDDING_CACHE_SIZE_MB", "1024"))
+# Seconds between two saves of the recency order of the cache, it is saved at shutdown as well
+EMBEDDING_CACHE_SAVE_INTERVAL = float(os.getenv("EMBEDDING_CACHE_SAVE_INTERVAL", "60"))
+EMBEDDING_CACHE_FORMAT_VERSION = 2
+_MIN_GROW_SLOTS = 1024
+# Key row of a slot: sha1 of the chunk text, then crc32 of the vector
+_DIGEST_BYTES = 20
+_KEY_BYTES = _DIGEST_BYTES + 4
+_EMPTY_KEY = bytes(_KEY_BYTES)
+
+
+class EmbeddingCache:
+    """On-disk embedding cache of one embedding model.
+
+    Vectors live in a memory-mapped float32 matrix (vectors.f32), one slot per
+    chunk text. keys.bin holds, for every slot, the sha1 of its chunk text and
+    the crc32 of its vector. Both are checked on read, so a slot left half
+    written by a crash is a cache miss, never a wrong embedding. The slot map
+    is rebuilt from keys.bin on load, index.json only keeps the least recently
+    used order and is saved every EMBEDDING_CACHE_SAVE_INTERVAL seconds. The
+    matrix grows on demand up to max_bytes, after which the least recently
+    used slots are reused.
+    """
+
+    def __init__(self, model_id: str, dim: int, max_bytes: int, cache_dir: str = EMBEDDING_CACHE_DIR):
+        self.model_id = model_id
+        self.dim = dim
+        self.capacity = max(1, max_bytes // (dim * 4 + _KEY_BYTES))
+        self.path = os.path.join(cache_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", model_id) + f"_{dim}")
+        self._vectors_path = os.path.join(self.path, "vectors.f32")
+        self._keys_path = os.path.join(self.path, "keys.bin")
+        self._index_path = os.path.join(self.path, "index.json")
+
+        # text hash -> slot, least recently used first
+        self._slots: "OrderedDict[str, int]" = OrderedDict()
+        self._free: List[int] = []
+        self._size = 0
+        self._vectors = None
+        self._keys = None
+        self._lock = threading.Lock()
+        self._saved_at = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def _open(self, size: int):
+        if self._vectors is not None:
+            self._vectors.flush()
+            self._keys.flush()
+            self._vectors = self._keys = None
+        for path, row_bytes in ((self._vectors_path, self.dim * 4), (self._keys_path, _KEY_BYTES)):
+            with open(path, "ab") as f:
+                f.truncate(size * row_bytes)
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(size, self.dim))
+        self._keys = np.memmap(self._keys_path, dtype=np.uint8, mode="r+", shape=(size, _KEY_BYTES))
+        self._size = size
+
+    def _load(self):
+        os.makedirs(self.path, exist_ok=True)
+        try:
+            if not (os.path.exists(self._vectors_path) and os.path.exists(self._keys_path)):
+                return
+            size = os.path.getsize(self._vectors_path) // (self.dim * 4)
+            if size == 0 or os.path.getsize(self._keys_path) != size * _KEY_BYTES:
+                return
+            self._open(size)
+            slots = {}
+            for slot in np.flatnonzero(self._keys.any(axis=1)):
+                digest = self._keys[slot, :_DIGEST_BYTES].tobytes().hex()
+                if digest in slots:
+                    self._keys[slot] = 0
+                else:
+                    slots[digest] = int(slot)
+            # Recency order of the last save, slots written after it are the most recent
+            order = []
+            if os.path.exists(self._index_path):
+                with open(self._index_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("version") == EMBEDDING_CACHE_FORMAT_VERSION and data.get("dim") == self.dim:
+                    order = data.get("lru", [])
+            for digest in order:
+                if digest in slots:
+                    self._slots[digest] = slots.pop(digest)
+            self._slots.update(slots)
+            used = set(self._slots.values())
+            self._free = [slot for slot in range(size - 1, -1, -1) if slot not in used]
+        except Exception as e:
+            print(f"Error loading embedding cache {self.path}: {e}")
+            self._slots.clear()
+            self._free = []
+            self._size = 0
+            self._vectors = self._keys = None
+
+    def _alloc_slot(self) -> int:
+        if self._free:
+            return self._free.pop()
+        if self._size < self.capacity:
+            old_size = self._size
+            self._open(min(self.capacity, max(_MIN_GROW_SLOTS, old_size * 2)))
+            self._free = list(range(self._size - 1, old_size, -1))
+            return old_size
+        # Evict the least recently used vector
+        _, slot = self._slots.popitem(last=False)
+        return slot
+
+    @staticmethod
+    def _key(digest: str, vector: np.ndarray) -> np.ndarray:
+        key = bytes.fromhex(digest) + zlib.crc32(vector.tobytes()).to_bytes(4, "little")
+        return np.frombuffer(key, dtype=np.uint8)
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        results = []
+        with self._lock:
+            for text in texts:
+                digest = self.text_hash(text)
+                slot = self._slots.get(digest)
+                vector = None if slot is None else np.array(self._vectors[slot])
+                if vector is not None and self._keys[slot].tobytes() != self._key(digest, vector).tobytes():
+                    # Torn by a crash between the writes of the vector and its key
+                    del self._slots[digest]
+                    self._keys[slot] = 0
+                    self._free.append(slot)
+                    vector = None
+                if vector is None:
+                    self.misses += 1
+                    results.append(None)
+                else:
+                    self.hits += 1
+                    self._slots.move_to_end(digest)
+                    results.append(vector.tolist())
+        return results
+
+    def put_many(self, texts: Sequence[str], embeddings: Sequence[Sequence[float]]):
+        with self._lock:
+            for text, embedding in zip(texts, embeddings):
+                if len(embedding) != self.dim:
+                    continue
+                digest = self.text_hash(text)
+                slot = self._slots.get(digest)
+                if slot is None:
+                    slot = self._alloc_slot()
+                vector = np.asarray(embedding, dtype=np.float32)
+                self._vectors[slot] = vector
+                self._keys[slot] = self._key(digest, vector)
+                self._slots[digest] = slot
+                self._slots.move_to_end(digest)
+            if self._vectors is not None:
+                self._vectors.flush()
+                self._keys.flush()
+            if time.monotonic() - self._saved_at >= EMBEDDING_CACHE_SAVE_INTERVAL:
+                self._save_index()
+
+    def save(self):
+        with self._lock:
+            if self._vectors is not None:
+                self._vectors.flush()
+                self._keys.flush()
+            self._save_index()
+
+    def _save_index(self):
+        self._saved_at = time.monotonic()
+        tmp_path = self._index_path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                data = {
+                    "version": EMBEDDING_CACHE_FORMAT_VERSION,
+                    "model_id": self.model_id,
+                    "dim": self.dim,
+                    "lru": list(self._slots),
+                }
+                json.dump(data, f)
+            os.replace(tmp_path, self._index_path)
+        except Exception as e:
+            print(f"Error saving embedding cache {self.path}: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._slots),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+_caches: Dict[Tuple[str, int], EmbeddingCache] = {}
+_caches_lock = threading.Lock()
+
+
+# Embedding caches are process wide, indexers sharing an embedding model share its cache
+def get_embedding_cache(model_id: str, dim: int) -> Optional[EmbeddingCache]:
+    if EMBEDDING_CACHE_SIZE_MB <= 0 or not model_id:
+        return None
+    with _caches_lock:
+        cache = _caches.get((model_id, dim))
+        if cache is None:
+            cache = EmbeddingCache(model_id, dim, EMBEDDING_CACHE_SIZE_MB * 1024 * 1024)
+            _caches[(model_id, dim)] = cache
+        return cache
+
+
+# Saves the recency order of every cache, called at shutdown
+def save_embedding_caches():
+    with _caches_lock:
+        caches = list(_caches.values())
+    for cache in caches:
+        cache.save()
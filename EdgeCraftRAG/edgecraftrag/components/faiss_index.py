@@ -0,0 +1,259 @@
+# Copyright (C) 2025 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+from typing import Any, Dict, List, Optional
+
+import faiss
+import numpy as np
+from edgecraftrag.base import IndexerType
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import VectorStoreQuery, VectorStoreQueryResult
+from llama_index.vector_stores.faiss import FaissMapVectorStore
+
+# Build and search parameters of the approximate FAISS indexes, settable through IndexerIn
+FAISS_INDEX_PARAMS = ("nlist", "nprobe", "m", "ef_search")
+FAISS_ANN_TYPES = (
+    IndexerType.FAISS_HNSW,
+    IndexerType.FAISS_IVF_FLAT,
+    IndexerType.FAISS_IVF_PQ,
+    IndexerType.FAISS_IVF_SQ8,
+)
+
+DEFAULT_NLIST = 256
+DEFAULT_NPROBE = 16
+DEFAULT_HNSW_M = 32
+DEFAULT_EF_SEARCH = 64
+# FAISS warns below 39 training vectors per centroid
+_TRAIN_POINTS_PER_CENTROID = 39
+# PQ codebooks have 256 centroids per sub-quantizer
+_PQ_CENTROIDS = 256
+# Vectors kept in the exact flat index before an IVF-PQ index is trained. PQ trades recall (about 0.8
+# recall@10 with one sub-quantizer per 8 dimensions) for 32x smaller vectors, worth it on large corpora only
+FAISS_PQ_MIN_VECTORS = int(os.getenv("FAISS_PQ_MIN_VECTORS", "100000"))
+FAISS_INDEX_FILE = "index.faiss"
+
+
+class FaissIDMapVectorStore(FaissMapVectorStore):
+    # FaissMapVectorStore derives new faiss ids from ntotal, which shrinks after
+    # remove_ids() and makes later inserts overwrite the ids of surviving vectors.
+    # Use a monotonic id counter instead, and add each batch with a single call.
+
+    _next_id: int = PrivateAttr(default=0)
+
+    def add(self, nodes: List[BaseNode], **add_kwargs: Any) -> List[str]:
+        if not nodes:
+            return []
+        embeddings = np.array([node.get_embedding() for node in nodes], dtype="float32")
+        faiss_ids = np.arange(self._next_id, self._next_id + len(nodes), dtype=np.int64)
+        self._next_id += len(nodes)
+        self._faiss_index.add_with_ids(embeddings, faiss_ids)
+        for node, faiss_id in zip(nodes, faiss_ids.tolist()):
+            self._node_id_to_faiss_id_map[node.node_id] = faiss_id
+            self._faiss_id_to_node_id_map[faiss_id] = node.node_id
+        return [node.node_id for node in nodes]
+
+    def memory_bytes(self) -> int:
+        return self._faiss_index.ntotal * self._faiss_index.d * 4
+
+    # The index is written as is, so trained IVF and HNSW indexes are restored without rebuilding
+    def save_state(self, directory: str) -> Dict[str, Any]:
+        faiss.write_index(self._faiss_index, os.path.join(directory, FAISS_INDEX_FILE))
+        return {"node_id_to_faiss_id": dict(self._node_id_to_faiss_id_map), "next_id": self._next_id}
+
+    def load_state(self, directory: str, state: Dict[str, Any]):
+        self._faiss_index = faiss.read_index(os.path.join(directory, FAISS_INDEX_FILE))
+        self._node_id_to_faiss_id_map = dict(state["node_id_to_faiss_id"])
+        self._faiss_id_to_node_id_map = {
+            faiss_id: node_id for node_id, faiss_id in state["node_id_to_faiss_id"].items()
+        }
+        self._next_id = state["next_id"]
+
+
+def _default_pq_m(d: int) -> int:
+    # One sub-quantizer per 8 dimensions, the dimension must be a multiple of it
+    return next(m for m in range(max(1, d // 8), 0, -1) if d % m == 0)
+
+
+def resolve_index_params(vector_type: str, d: int, index_params: Optional[Dict[str, Any]] = None) -> Dict[str, int]:
+    index_params = {key: value for key, value in (index_params or {}).items() if value is not None}
+    match vector_type:
+        case IndexerType.FAISS_HNSW:
+            return {
+                "m": index_params.get("m", DEFAULT_HNSW_M),
+                "ef_search": index_params.get("ef_search", DEFAULT_EF_SEARCH),
+            }
+        case IndexerType.FAISS_IVF_PQ:
+            m = index_params.get("m", _default_pq_m(d))
+            if d % m != 0:
+                raise ValueError(f"Vector dimension {d} is not a multiple of the PQ sub-quantizer count m={m}")
+            return {
+                "nlist": index_params.get("nlist", DEFAULT_NLIST),
+                "nprobe": index_params.get("nprobe", DEFAULT_NPROBE),
+                "m": m,
+            }
+        case IndexerType.FAISS_IVF_FLAT | IndexerType.FAISS_IVF_SQ8:
+            return {
+                "nlist": index_params.get("nlist", DEFAULT_NLIST),
+                "nprobe": index_params.get("nprobe", DEFAULT_NPROBE),
+            }
+    raise ValueError(f"Unsupported FAISS index type: {vector_type}")
+
+
+class FaissANNVectorStore(FaissIDMapVectorStore):
+    """FAISS store backed by an approximate index: HNSW, IVF-Flat, IVF-PQ or IVF-SQ8.
+
+    Vectors are kept in an exact flat index until there are enough of them to
+    train the IVF index on, which then replaces the flat one. IVF-PQ waits for
+    at least FAISS_PQ_MIN_VECTORS. HNSW graphs cannot remove vectors, deleted
+    ids are filtered from the results until half of the graph is deleted and
+    it is rebuilt.
+    """
+
+    _vector_type: str = PrivateAttr()
+    _d: int = PrivateAttr()
+    _params: Dict[str, int] = PrivateAttr()
+    _train_size: int = PrivateAttr(default=0)
+    _trained: bool = PrivateAttr(default=False)
+    _deleted: int = PrivateAttr(default=0)
+
+    def __init__(self, vector_type: str, d: int, index_params: Optional[Dict[str, Any]] = None):
+        params = resolve_index_params(vector_type, d, index_params)
+        if vector_type == IndexerType.FAISS_HNSW:
+            faiss_index = self._build_index(vector_type, d, params)
+        else:
+            faiss_index = faiss.IndexIDMap2(faiss.IndexFlatL2(d))
+        super().__init__(faiss_index=faiss_index)
+        self._vector_type = vector_type
+        self._d = d
+        self._params = params
+        if vector_type == IndexerType.FAISS_HNSW:
+            self._trained = True
+            self.set_search_params()
+        else:
+            train_size = _TRAIN_POINTS_PER_CENTROID * params["nlist"]
+            if vector_type == IndexerType.FAISS_IVF_PQ:
+                train_size = max(train_size, _TRAIN_POINTS_PER_CENTROID * _PQ_CENTROIDS, FAISS_PQ_MIN_VECTORS)
+            self._train_size = train_size
+
+    @staticmethod
+    def _build_index(vector_type: str, d: int, params: Dict[str, int]):
+        match vector_type:
+            case IndexerType.FAISS_HNSW:
+                description = f"IDMap2,HNSW{params['m']}"
+            case IndexerType.FAISS_IVF_FLAT:
+                description = f"IVF{params['nlist']},Flat"
+            case IndexerType.FAISS_IVF_PQ:
+                # Without polysemous training, which takes most of the build time and does not change recall
+                description = f"IVF{params['nlist']},PQ{params['m']}np"
+            case IndexerType.FAISS_IVF_SQ8:
+                description = f"IVF{params['nlist']},SQ8"
+        return faiss.index_factory(d, description)
+
+    @property
+    def trained(self) -> bool:
+        return self._trained
+
+    @property
+    def index_params(self) -> Dict[str, int]:
+        return dict(self._params)
+
+    def set_search_params(self, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+        # Search parameters apply right away, no rebuild needed
+        if self._vector_type == IndexerType.FAISS_HNSW:
+            if ef_search is not None:
+                self._params["ef_search"] = ef_search
+        elif nprobe is not None:
+            self._params["nprobe"] = nprobe
+        if not self._trained:
+            return
+        if self._vector_type == IndexerType.FAISS_HNSW:
+            faiss.downcast_index(self._faiss_index.index).hnsw.efSearch = self._params["ef_search"]
+        else:
+            faiss.extract_index_ivf(self._faiss_index).nprobe = self._params["nprobe"]
+
+    def memory_bytes(self) -> int:
+        ntotal = self._faiss_index.ntotal
+        if not self._trained:
+            return super().memory_bytes()
+        if self._vector_type == IndexerType.FAISS_HNSW:
+            # Vectors plus about 2 * m links per vector on the base layer
+            return ntotal * (self._d * 4 + self._params["m"] * 2 * 4)
+        return ntotal * (faiss.extract_index_ivf(self._faiss_index).code_size + 8)
+
+    def save_state(self, directory: str) -> Dict[str, Any]:
+        state = super().save_state(directory)
+        state.update(index_params=self.index_params, trained=self._trained, deleted=self._deleted)
+        return state
+
+    def load_state(self, directory: str, state: Dict[str, Any]):
+        super().load_state(directory, state)
+        self._trained = state["trained"]
+        self._deleted = state["deleted"]
+        self.set_search_params()
+
+    def _export_vectors(self):
+        ids = faiss.vector_to_array(self._faiss_index.id_map).astype(np.int64)
+        vectors = self._faiss_index.index.reconstruct_n(0, self._faiss_index.ntotal)
+        return ids, vectors
+
+    def _rebuild(self):
+        # Train a new index on the live vectors of the current one and swap it in
+        ids, vectors = self._export_vectors()
+        live = np.array([int(i) in self._faiss_id_to_node_id_map for i in ids], dtype=bool)
+        ids, vectors = ids[live], vectors[live]
+        faiss_index = self._build_index(self._vector_type, self._d, self._params)
+        if not faiss_index.is_trained:
+            faiss_index.train(vectors)
+        if len(ids):
+            faiss_index.add_with_ids(vectors, ids)
+        self._faiss_index = faiss_index
+        self._trained = True
+        self._deleted = 0
+        self.set_search_params()
+
+    def add(self, nodes: List[BaseNode], **add_kwargs: Any) -> List[str]:
+        node_ids = super().add(nodes, **add_kwargs)
+        if not self._trained and self._faiss_index.ntotal >= self._train_size:
+            self._rebuild()
+        return node_ids
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        self.delete_nodes([ref_doc_id])
+
+    def delete_nodes(self, node_ids: Optional[List[str]] = None, filters=None, **delete_kwargs: Any) -> None:
+        if self._vector_type != IndexerType.FAISS_HNSW:
+            return super().delete_nodes(node_ids, filters=filters, **delete_kwargs)
+        if filters is not None:
+            raise NotImplementedError("Metadata filters not implemented for Faiss yet.")
+        if node_ids is None:
+            raise ValueError("node_ids must be provided to delete nodes.")
+        for node_id in node_ids:
+            faiss_id = self._node_id_to_faiss_id_map.pop(node_id, None)
+            if faiss_id is not None:
+                self._faiss_id_to_node_id_map.pop(faiss_id, None)
+                self._deleted += 1
+        if self._deleted * 2 >= self._faiss_index.ntotal:
+            self._rebuild()
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.filters is not None:
+            raise ValueError("Metadata filters not implemented for Faiss yet.")
+        # Fetch extra neighbors to make up for deleted vectors still in the HNSW graph
+        k = min(query.similarity_top_k + self._deleted, self._faiss_index.ntotal)
+        if k <= 0:
+            return VectorStoreQueryResult(similarities=[], ids=[])
+        query_embedding = np.array(query.query_embedding, dtype="float32")[np.newaxis, :]
+        dists, indices = self._faiss_index.search(query_embedding, k)
+        similarities = []
+        ids = []
+        for dist, faiss_id in zip(dists[0], indices[0]):
+            node_id = self._faiss_id_to_node_id_map.get(int(faiss_id))
+            if faiss_id < 0 or node_id is None:
+                continue
+            similarities.append(float(dist))
+            ids.append(node_id)
+            if len(ids) == query.similarity_top_k:
+                break
+        return VectorStoreQueryResult(similarities=similarities, ids=ids)
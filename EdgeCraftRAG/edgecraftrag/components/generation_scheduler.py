@@ -0,0 +1,250 @@
+# Copyright (C) 2025 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional
+
+# Maximum number of generation requests waiting for the local LLM, further requests are rejected
+LLM_QUEUE_SIZE = int(os.getenv("LLM_QUEUE_SIZE", "32"))
+
+_DONE = object()
+
+
+class QueueFullError(RuntimeError):
+    pass
+
+
+class _Job:
+
+    __slots__ = ("session", "prompt", "generate_kwargs", "max_new_tokens", "emit", "future", "cancelled", "enqueued")
+
+    def __init__(self, session, prompt, generate_kwargs, max_new_tokens, emit: Optional[Callable[[str], None]]):
+        self.session = session
+        self.prompt = prompt
+        self.generate_kwargs = generate_kwargs
+        self.max_new_tokens = max_new_tokens
+        # Streaming jobs hand every delta to emit, the future gets the full text
+        self.emit = emit
+        self.future = Future()
+        self.cancelled = threading.Event()
+        self.enqueued = time.monotonic()
+
+
+def _make_cancel_criteria(event: threading.Event):
+    # transformers is only imported when the local LLM actually streams
+    import torch
+    from transformers import StoppingCriteria
+
+    class CancelCriteria(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            return torch.full((input_ids.shape[0],), event.is_set(), dtype=torch.bool, device=input_ids.device)
+
+    return CancelCriteria()
+
+
+class GenerationScheduler:
+    """Runs the generation requests of a local LLM one at a time on a worker thread.
+
+    Requests wait in a bounded queue, a request arriving while max_queue_size
+    requests are waiting is rejected with QueueFullError. Sessions are served
+    round robin, so a session sending many requests does not hold back the
+    others. Streamed tokens are bridged to the event loop of the caller, a
+    request whose client disconnected is skipped while queued and stopped at
+    the next token while generating.
+    """
+
+    def __init__(self, name: str, llm, max_queue_size: int = LLM_QUEUE_SIZE):
+        self.name = name
+        self.llm = llm
+        self.max_queue_size = max(1, max_queue_size)
+        # session -> waiting jobs, the session served next comes first
+        self._sessions: "OrderedDict[Any, deque]" = OrderedDict()
+        self._pending = 0
+        self._cond = threading.Condition()
+        self._worker = None
+        self._closed = False
+
+        self.active = 0
+        self.submitted = 0
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.rejected = 0
+        self.total_queue_time = 0.0
+        self.max_queue_time = 0.0
+        self.total_generation_time = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return self._pending
+
+    def check_capacity(self):
+        if self._pending >= self.max_queue_size:
+            self.rejected += 1
+            raise QueueFullError(f"{self.name}: {self._pending} generation requests are waiting, retry later")
+
+    def _submit(self, job: _Job):
+        with self._cond:
+            if self._closed:
+                raise RuntimeError(f"{self.name}: generation scheduler is closed")
+            self.check_capacity()
+            self._sessions.setdefault(job.session, deque()).append(job)
+            self._pending += 1
+            self.submitted += 1
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name=f"generation-{self.name}", daemon=True)
+                self._worker.start()
+            self._cond.notify()
+
+    def run(self, prompt: str, generate_kwargs: Dict[str, Any], max_new_tokens: int, session=None):
+        # Blocking completion, returns the CompletionResponse of the LLM
+        job = _Job(session, prompt, generate_kwargs, max_new_tokens, None)
+        self._submit(job)
+        return job.future.result()
+
+    async def astream(self, prompt: str, generate_kwargs: Dict[str, Any], max_new_tokens: int, session=None):
+        loop = asyncio.get_running_loop()
+        deltas: asyncio.Queue = asyncio.Queue()
+
+        def emit(delta):
+            try:
+                loop.call_soon_threadsafe(deltas.put_nowait, delta)
+            except RuntimeError:
+                # The event loop is closed, nobody reads the deltas anymore
+                job.cancelled.set()
+
+        job = _Job(session, prompt, generate_kwargs, max_new_tokens, emit)
+        job.future.add_done_callback(lambda _: emit(_DONE))
+        self._submit(job)
+        try:
+            while True:
+                delta = await deltas.get()
+                if delta is _DONE:
+                    break
+                yield delta
+            job.future.result()
+        finally:
+            # A no-op once the job is done, otherwise the client is gone
+            job.cancelled.set()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            for jobs in self._sessions.values():
+                for job in jobs:
+                    job.future.cancel()
+            self._sessions.clear()
+            self._pending = 0
+            self._cond.notify()
+
+    def _next(self) -> Optional[_Job]:
+        with self._cond:
+            while not self._pending and not self._closed:
+                self._cond.wait()
+            if self._closed:
+                return None
+            session, jobs = self._sessions.popitem(last=False)
+            job = jobs.popleft()
+            if jobs:
+                # Round robin, the session queues up behind the other waiting sessions
+                self._sessions[session] = jobs
+            self._pending -= 1
+            return job
+
+    def _run(self):
+        while True:
+            job = self._next()
+            if job is None:
+                return
+            wait = time.monotonic() - job.enqueued
+            self.total_queue_time += wait
+            self.max_queue_time = max(self.max_queue_time, wait)
+            if job.cancelled.is_set():
+                self.cancelled += 1
+                job.future.cancel()
+                continue
+            job.future.set_running_or_notify_cancel()
+            self.active += 1
+            self.started += 1
+            start = time.monotonic()
+            try:
+                result = self._generate(job)
+            except Exception as e:
+                self.failed += 1
+                job.future.set_exception(e)
+            else:
+                if job.cancelled.is_set():
+                    self.cancelled += 1
+                else:
+                    self.completed += 1
+                job.future.set_result(result)
+            finally:
+                self.active -= 1
+                self.total_generation_time += time.monotonic() - start
+
+    def _generate(self, job: _Job):
+        llm = self.llm
+        # The sampling parameters are per request, only the running job sets them
+        llm.generate_kwargs = job.generate_kwargs
+        llm.max_new_tokens = job.max_new_tokens
+        if job.emit is None:
+            return llm.complete(job.prompt)
+        stopping_criteria = getattr(llm, "_stopping_criteria", None)
+        cancel_criteria = None
+        if stopping_criteria is not None:
+            cancel_criteria = _make_cancel_criteria(job.cancelled)
+            stopping_criteria.append(cancel_criteria)
+        try:
+            collected = []
+            for r in llm.stream_complete(job.prompt):
+                # After a cancellation the remaining tokens are drained, so generate has ended before the next job
+                if job.cancelled.is_set() or not r.delta:
+                    continue
+                collected.append(r.delta)
+                job.emit(r.delta)
+            return "".join(collected)
+        finally:
+            if cancel_criteria is not None:
+                stopping_criteria.remove(cancel_criteria)
+
+    def stats(self) -> Dict[str, Any]:
+        finished = self.completed + self.failed + self.cancelled
+        return {
+            "name": self.name,
+            "max_queue_size": self.max_queue_size,
+            "queue_depth": self._pending,
+            "waiting_sessions": len(self._sessions),
+            "active": self.active,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "rejected": self.rejected,
+            "avg_queue_time_ms": round(self.total_queue_time / finished * 1000, 3) if finished else 0.0,
+            "max_queue_time_ms": round(self.max_queue_time * 1000, 3),
+            "avg_generation_time_ms": (
+                round(self.total_generation_time / self.started * 1000, 3) if self.started else 0.0
+            ),
+        }
+
+
+# Schedulers by LLM model, reported by the system API
+_schedulers: Dict[str, GenerationScheduler] = {}
+
+
+def register_scheduler(name: str, scheduler: GenerationScheduler):
+    _schedulers[name] = scheduler
+
+
+def unregister_scheduler(name: str):
+    _schedulers.pop(name, None)
+
+
+def get_generation_metrics() -> Dict[str, Dict[str, Any]]:
+    return {name: scheduler.stats() for name, scheduler in _schedulers.items()}
@@ -1,41 +1,27 @@
 # Copyright (C) 2024 Intel Corporation
 # SPDX-License-Identifier: Apache-2.0
 
-import asyncio
 import dataclasses
+import functools
 import json
 import os
-import urllib.request
-from urllib.parse import urlparse
+import threading
+from typing import Dict
 
+import httpx
 from edgecraftrag.base import BaseComponent, CompType, GeneratorType, InferenceType, NodeParserType
-from edgecraftrag.utils import concat_history, get_prompt_template, save_history
+from edgecraftrag.components.context_packer import ContextPacker
+from edgecraftrag.components.node_parser import REF_IMAGES_KEY, REF_LABEL_KEY, REF_LINKS_KEY, get_unstructured_refs
+from edgecraftrag.components.url_validator import get_url_validator
+from edgecraftrag.utils import get_prompt_template, get_tokenizer
 from fastapi.responses import StreamingResponse
 from langchain_core.prompts import PromptTemplate
 from llama_index.llms.openai_like import OpenAILike
 from pydantic import model_serializer
-from unstructured.staging.base import elements_from_base64_gzipped_json
-
-
-def extract_urls(text):
-    urls = []
-    words = text.split()
-    for word in words:
-        parsed_url = urlparse(word)
-        if parsed_url.scheme and parsed_url.netloc:
-            url = parsed_url.geturl()
-            try:
-                response = urllib.request.urlopen(url)
-                if response.status == 200:
-                    urls.append(url)
-            except (urllib.error.URLError, urllib.error.HTTPError, Exception):
-                pass
-    return urls
 
 
 def extract_unstructured_eles(retrieved_nodes=[], text_gen_context=""):
     IMAGE_NUMBER = 2
-    image_count = 0
     link_urls = []
     image_paths = []
     reference_docs = set()
@@ -43,31 +29,20 @@ def extract_unstructured_eles(retrieved_nodes=[], text_gen_context=""):
         if node.score < 0.5:
             continue
         metadata = node.node.metadata
-        # extract referenced docs
-        if "filename" in metadata:
-            reference_doc = (
-                metadata["filename"]
-                if "page_number" not in metadata
-                else metadata["filename"] + " --page" + str(metadata["page_number"])
-            )
-            reference_docs.add(reference_doc)
-        # extract hyperlinks in chunk
-        if "link_urls" in metadata:
-            if isinstance(metadata["link_urls"], str):
-                try:
-                    url_list = json.loads(metadata["link_urls"])
-                    link_urls.extend(url_list)
-                except json.JSONDecodeError:
-                    print("link_urls is not a valid JSON string.")
-        # extract images in chunk
-        if image_count < IMAGE_NUMBER and "orig_elements" in metadata:
-            elements = elements_from_base64_gzipped_json(metadata["orig_elements"])
-            for element in elements:
-                if element.metadata.image_path:
-                    image_paths.append(element.metadata.image_path)
-                    image_count += 1
-        # extract hyperlinks in chunk
-        link_urls.extend(extract_urls(text_gen_context))
+        if REF_LINKS_KEY in metadata:
+            # References precomputed when the file was parsed
+            label = metadata.get(REF_LABEL_KEY)
+            images = json.loads(metadata[REF_IMAGES_KEY])
+            links = json.loads(metadata[REF_LINKS_KEY])
+        else:
+            # Nodes indexed before references were precomputed
+            label, images, links = get_unstructured_refs(metadata, node.node.get_content())
+        if label:
+            reference_docs.add(label)
+        link_urls.extend(links)
+        image_paths.extend(images[: IMAGE_NUMBER - len(image_paths)])
+    # Links that do not respond are left out, checks are cached and run concurrently
+    link_urls = get_url_validator().filter(link_urls)
     unstructured_str = ""
     if image_paths:
         unstructured_str += "\n\n参考图片:\n\n"
@@ -84,33 +59,76 @@ def extract_unstructured_eles(retrieved_nodes=[], text_gen_context=""):
     return unstructured_str
 
 
-async def local_stream_generator(lock, llm, prompt_str, unstructured_str):
-    async with lock:
-        response = llm.stream_complete(prompt_str)
-        collected_data = []
-        for r in response:
-            collected_data.append(r.delta)
-            yield r.delta
-            await asyncio.sleep(0)
-        if unstructured_str:
-            collected_data.append(unstructured_str)
-            yield unstructured_str
-        res = "".join(collected_data)
-        save_history(res)
+async def local_stream_generator(
+    scheduler, prompt_str, generate_kwargs, max_new_tokens, session_id, unstructured_str, save_answer
+):
+    # Tokens are generated on the worker thread of the scheduler, closing the stream cancels the request
+    collected_data = []
+    async for delta in scheduler.astream(prompt_str, generate_kwargs, max_new_tokens, session=session_id):
+        collected_data.append(delta)
+        yield delta
+    if unstructured_str:
+        collected_data.append(unstructured_str)
+        yield unstructured_str
+    res = "".join(collected_data)
+    save_answer(res)
 
 
-async def stream_generator(llm, prompt_str, unstructured_str):
-    response = llm.stream_complete(prompt_str)
+async def stream_generator(llm, prompt_str, request_kwargs, unstructured_str, save_answer, usage=None):
+    # Tokens are read from the SSE stream of vLLM on the event loop, no thread is held per stream.
+    # usage, if given, receives the token counts vLLM reports in the last chunk of the stream.
+    if usage is not None:
+        request_kwargs = dict(request_kwargs, stream_options={"include_usage": True})
+    response = await llm.astream_complete(prompt_str, **request_kwargs)
     collected_data = []
-    for r in response:
-        collected_data.append(r.delta)
-        yield r.delta
-        await asyncio.sleep(0)
+    try:
+        async for r in response:
+            if usage is not None and r.additional_kwargs:
+                usage.update(r.additional_kwargs)
+            if not r.delta:
+                continue
+            collected_data.append(r.delta)
+            yield r.delta
+    finally:
+        # Closes the connection when the client is gone, so vLLM aborts the request
+        await response.aclose()
+    if usage is not None and "completion_tokens" not in usage:
+        usage["completion_text"] = "".join(collected_data)
     if unstructured_str:
         collected_data.append(unstructured_str)
         yield unstructured_str
     res = "".join(collected_data)
-    save_history(res)
+    save_answer(res)
+
+
+# Seconds a vLLM request may take and the retries of a request that failed to connect or was rejected
+VLLM_TIMEOUT = float(os.getenv("VLLM_TIMEOUT", "600"))
+VLLM_MAX_RETRIES = int(os.getenv("VLLM_MAX_RETRIES", "2"))
+# Keep-alive connections pooled per vLLM endpoint
+VLLM_MAX_CONNECTIONS = int(os.getenv("VLLM_MAX_CONNECTIONS", "64"))
+
+# One client per vLLM endpoint, shared by all generators and requests
+_vllm_clients: Dict[str, OpenAILike] = {}
+_vllm_clients_lock = threading.Lock()
+
+
+def get_vllm_client(endpoint: str, model: str) -> OpenAILike:
+    with _vllm_clients_lock:
+        llm = _vllm_clients.get(endpoint)
+        if llm is None:
+            limits = httpx.Limits(max_connections=VLLM_MAX_CONNECTIONS, max_keepalive_connections=VLLM_MAX_CONNECTIONS)
+            llm = OpenAILike(
+                api_key="fake",
+                api_base=endpoint + "/v1",
+                model=model,
+                timeout=VLLM_TIMEOUT,
+                max_retries=VLLM_MAX_RETRIES,
+                reuse_client=True,
+                http_client=httpx.Client(limits=limits, timeout=VLLM_TIMEOUT),
+                async_http_client=httpx.AsyncClient(limits=limits, timeout=VLLM_TIMEOUT),
+            )
+            _vllm_clients[endpoint] = llm
+        return llm
 
 
 class QnAGenerator(BaseComponent):
@@ -127,24 +145,23 @@ class QnAGenerator(BaseComponent):
             ("\t\n", "\n"),
         )
         self.enable_think = False
+        self._context_packer = None
         self.llm = llm_model
         if isinstance(llm_model, str):
             self.model_id = llm_model
         else:
             self.model_id = llm_model().model_id
-        if self.inference_type == InferenceType.LOCAL:
-            self.lock = asyncio.Lock()
         self.prompt_content = prompt_content
         self.prompt_template_file = prompt_template_file
-        self.prompt = self.init_prompt(self.model_id, self.prompt_content, self.prompt_template_file)
+        self._prompts = self.render_prompts(self.prompt_content, self.prompt_template_file)
+        self.prompt = self._prompts[self.enable_think]
+        self.get_context_packer()
 
         self.llm = llm_model
         if isinstance(llm_model, str):
             self.model_id = llm_model
         else:
             self.model_id = llm_model().model_id
-        if self.inference_type == InferenceType.LOCAL:
-            self.lock = asyncio.Lock()
         if self.inference_type == InferenceType.VLLM:
             self.vllm_name = llm_model().model_id
             if vllm_endpoint == "":
@@ -177,20 +194,25 @@ class QnAGenerator(BaseComponent):
             else:
                 return get_prompt_template(model_id, prompt_content, prompt_template_file, enable_think)
 
+    # Prompts with thinking off and on, rendered up front so a request only looks its variant up
+    def render_prompts(self, prompt_content=None, prompt_template_file=None):
+        return {
+            enable_think: self.init_prompt(self.model_id, prompt_content, prompt_template_file, enable_think)
+            for enable_think in (False, True)
+        }
+
     def set_prompt(self, prompt):
         if "{context}" not in prompt:
             prompt += "\n<|im_start|>{context}<|im_end|>"
         if "{chat_history}" not in prompt:
             prompt += "\n<|im_start|>{chat_history}"
         self.prompt = prompt
+        # A prompt set as is serves both thinking modes
+        self._prompts = {False: prompt, True: prompt}
 
     def reset_prompt(self):
-        prompt_template = get_prompt_template(self.model_id)
-        self.prompt = (
-            DocumentedContextRagPromptTemplate.from_template(prompt_template)
-            if self.template_enhance_on
-            else prompt_template
-        )
+        self._prompts = self.render_prompts()
+        self.prompt = self._prompts[self.enable_think]
 
     def clean_string(self, string):
         ret = string
@@ -198,42 +220,69 @@ class QnAGenerator(BaseComponent):
             ret = ret.replace(*p)
         return ret
 
-    def query_transform(self, chat_request, retrieved_nodes, sub_questions=None):
+    def get_context_packer(self):
+        if self._context_packer is None:
+            try:
+                tokenizer = get_tokenizer(self.model_id)
+            except Exception as e:
+                print(f"Error loading tokenizer of {self.model_id}, counting characters instead: {e}")
+                tokenizer = None
+            self._context_packer = ContextPacker(tokenizer)
+        return self._context_packer
+
+    def save_answer(self, session, answer):
+        if session is not None:
+            session.add_turn("assistant", answer, self.get_context_packer().count_tokens(answer))
+
+    def query_transform(self, chat_request, retrieved_nodes, sub_questions=None, token_usage=None, session=None):
         """Generate text_gen_context and prompt_str
         :param chat_request: Request object
         :param retrieved_nodes: List of retrieved nodes
         :param sub_questions: Optional sub-questions string (safe parameter)
+        :param token_usage: Optional dict filled with the token breakdown of the prompt
+        :param session: Optional SessionContext of the request, its history goes into the prompt
         :return: Generated text_gen_context and prompt_str."""
-        text_gen_context = ""
-        for n in retrieved_nodes:
-            origin_text = n.node.get_text()
-            text_gen_context += self.clean_string(origin_text.strip())
         query = chat_request.messages
-        chat_history = concat_history(chat_request.messages)
+        packer = self.get_context_packer()
+        chat_history = ""
+        if session is not None:
+            # Turns carry their token counts, the history is selected within its budget without tokenizing it
+            chat_history = session.get_history(packer.history_budget)
+            session.add_turn("user", query, packer.count_tokens(query))
         # Modify model think status
+        enable_think = self.enable_think
         if chat_request.chat_template_kwargs:
-            if self.enable_think != chat_request.chat_template_kwargs["enable_thinking"]:
-                self.prompt = self.init_prompt(
-                    self.model_id,
-                    self.prompt_content,
-                    self.prompt_template_file,
-                    chat_request.chat_template_kwargs["enable_thinking"],
-                )
-                self.enable_think = chat_request.chat_template_kwargs["enable_thinking"]
+            enable_think = bool(chat_request.chat_template_kwargs.get("enable_thinking", enable_think))
+            self.enable_think = enable_think
+            self.prompt = self._prompts[enable_think]
+        prompt = self._prompts[enable_think]
         if sub_questions:
             final_query = f"{query}\n\n### Sub-questions ###\nThe following list is how you should consider the answer, you MUST follow these steps when responding:\n\n{sub_questions}"
         else:
             final_query = query
-        prompt_str = self.prompt.format(input=final_query, chat_history=chat_history, context=text_gen_context)
+
+        def format_prompt(context, history):
+            return prompt.format(input=final_query, chat_history=history, context=context)
+
+        # Nodes are packed by score into the token budget left by the template, the history and the answer
+        text_gen_context, chat_history, usage = packer.assemble(
+            format_prompt, chat_history, retrieved_nodes, chat_request.max_tokens, clean=self.clean_string
+        )
+        if token_usage is not None:
+            token_usage.update(usage)
+        prompt_str = format_prompt(text_gen_context, chat_history)
         return text_gen_context, prompt_str
 
     def run(self, chat_request, retrieved_nodes, node_parser_type, **kwargs):
         if self.llm() is None:
             # This could happen when User delete all LLMs through RESTful API
             raise ValueError("No LLM available, please load LLM")
-        # query transformation
+        # query transformation, the benchmark passes the prompt it already assembled
         sub_questions = kwargs.get("sub_questions", None)
-        text_gen_context, prompt_str = self.query_transform(chat_request, retrieved_nodes, sub_questions=sub_questions)
+        session = kwargs.get("session", None)
+        text_gen_context, prompt_str = kwargs.get("prompt") or self.query_transform(
+            chat_request, retrieved_nodes, sub_questions=sub_questions, session=session
+        )
         generate_kwargs = dict(
             temperature=chat_request.temperature,
             do_sample=chat_request.temperature > 0.0,
@@ -242,46 +291,66 @@ class QnAGenerator(BaseComponent):
             typical_p=chat_request.typical_p,
             repetition_penalty=chat_request.repetition_penalty,
         )
-        self.llm().generate_kwargs = generate_kwargs
-        self.llm().max_new_tokens = chat_request.max_tokens
         unstructured_str = ""
         if node_parser_type == NodeParserType.UNSTRUCTURED:
             unstructured_str = extract_unstructured_eles(retrieved_nodes, text_gen_context)
+        # Requests of all pipelines sharing the LLM are queued by its scheduler, sessions take turns
+        scheduler = self.llm().scheduler
+        session_id = session.session_id if session is not None else None
         if chat_request.stream:
+            # Reject before the response starts streaming
+            scheduler.check_capacity()
             return StreamingResponse(
-                local_stream_generator(self.lock, self.llm(), prompt_str, unstructured_str),
+                local_stream_generator(
+                    scheduler,
+                    prompt_str,
+                    generate_kwargs,
+                    chat_request.max_tokens,
+                    session_id,
+                    unstructured_str,
+                    functools.partial(self.save_answer, session),
+                ),
                 media_type="text/event-stream",
             )
         else:
-            result = self.llm().complete(prompt_str)
-            save_history(str(result.text))
+            result = scheduler.run(prompt_str, generate_kwargs, chat_request.max_tokens, session=session_id)
+            self.save_answer(session, str(result.text))
             return result
 
     def run_vllm(self, chat_request, retrieved_nodes, node_parser_type, **kwargs):
-        # query transformation
+        # query transformation, the benchmark passes the prompt it already assembled
         sub_questions = kwargs.get("sub_questions", None)
-        text_gen_context, prompt_str = self.query_transform(chat_request, retrieved_nodes, sub_questions=sub_questions)
-        llm = OpenAILike(
-            api_key="fake",
-            api_base=self.vllm_endpoint + "/v1",
-            max_tokens=chat_request.max_tokens,
+        session = kwargs.get("session", None)
+        text_gen_context, prompt_str = kwargs.get("prompt") or self.query_transform(
+            chat_request, retrieved_nodes, sub_questions=sub_questions, session=session
+        )
+        llm = get_vllm_client(self.vllm_endpoint, self.vllm_name)
+        # The sampling parameters are per request, vLLM takes the ones OpenAI does not define in the body
+        request_kwargs = dict(
             model=self.vllm_name,
-            top_p=chat_request.top_p,
-            top_k=chat_request.top_k,
+            max_tokens=chat_request.max_tokens,
             temperature=chat_request.temperature,
-            streaming=chat_request.stream,
-            repetition_penalty=chat_request.repetition_penalty,
+            top_p=chat_request.top_p,
+            extra_body={"top_k": chat_request.top_k, "repetition_penalty": chat_request.repetition_penalty},
         )
         unstructured_str = ""
         if node_parser_type == NodeParserType.UNSTRUCTURED:
             unstructured_str = extract_unstructured_eles(retrieved_nodes, text_gen_context)
         if chat_request.stream:
             return StreamingResponse(
-                stream_generator(llm, prompt_str, unstructured_str), media_type="text/event-stream"
+                stream_generator(
+                    llm,
+                    prompt_str,
+                    request_kwargs,
+                    unstructured_str,
+                    functools.partial(self.save_answer, session),
+                    usage=kwargs.get("usage"),
+                ),
+                media_type="text/event-stream",
             )
         else:
-            result = llm.complete(prompt_str)
-            save_history(str(result))
+            result = llm.complete(prompt_str, **request_kwargs)
+            self.save_answer(session, str(result))
             return result
 
     @model_serializer
@@ -1,20 +1,89 @@
 # Copyright (C) 2024 Intel Corporation
 # SPDX-License-Identifier: Apache-2.0
 
-from typing import Any
+import itertools
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Sequence
 
 import faiss
+import numpy as np
 from edgecraftrag.base import BaseComponent, CompType, IndexerType
+from edgecraftrag.components.bm25 import BM25Index, discard_pending, get_bm25_path
+from edgecraftrag.components.embedding_cache import get_embedding_cache
+from edgecraftrag.components.faiss_index import FAISS_ANN_TYPES, FaissANNVectorStore, FaissIDMapVectorStore
+from edgecraftrag.components.milvus_store import drop_milvus_collection, get_milvus_vector_store
 from edgecraftrag.context import ctx
 from llama_index.core import StorageContext, VectorStoreIndex
-from llama_index.vector_stores.faiss import FaissVectorStore
-from llama_index.vector_stores.milvus import MilvusVectorStore
+from llama_index.core.schema import BaseNode, MetadataMode
+from llama_index.core.vector_stores.types import FilterCondition, FilterOperator, MetadataFilter, MetadataFilters
 from pydantic import model_serializer
 
+# Process wide, so a reinitialized indexer never reuses the version of its previous knowledge base
+_kb_versions = itertools.count(1)
+# Attributes holding the indexed knowledge base, swapped when switching between resident knowledge bases
+_KB_STATE_ATTRS = (
+    "kb_name",
+    "_storage_context",
+    "_docstore",
+    "_vector_store",
+    "_graph_store",
+    "_index_struct",
+    "_bm25_index",
+    "_version",
+)
+
+
+class KBStateLock:
+    # Retrievals read the indexed knowledge base concurrently, swapping it waits until they are done.
+    # A waiting swap holds off new retrievals so it is not starved.
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writing = False
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writing:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            while self._writing:
+                self._cond.wait()
+            self._writing = True
+            while self._readers:
+                self._cond.wait()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+
 
 class VectorIndexer(BaseComponent, VectorStoreIndex):
 
-    def __init__(self, embed_model, vector_type, milvus_uri="http://localhost:19530", kb_name="default_kb"):
+    def __init__(
+        self,
+        embed_model,
+        vector_type,
+        milvus_uri="http://localhost:19530",
+        kb_name="default_kb",
+        index_params: Optional[Dict[str, Any]] = None,
+    ):
         BaseComponent.__init__(
             self,
             comp_type=CompType.INDEXER,
@@ -27,46 +96,231 @@ class VectorIndexer(BaseComponent, VectorStoreIndex):
 
             Settings.embed_model = None
         self.milvus_uri = milvus_uri
+        self.index_params = index_params or {}
+        self._kb_lock = KBStateLock()
         self._initialize_indexer(embed_model, vector_type, milvus_uri, kb_name)
 
     def _initialize_indexer(self, embed_model, vector_type, milvus_uri, kb_name):
-        # get active name
-        pl = ctx.get_pipeline_mgr().get_active_pipeline()
-        plname = pl.name if pl else ""
         if embed_model:
             self.d = embed_model._model.request.outputs[0].get_partial_shape()[2].get_length()
         else:
             self.d = 128
+        self.kb_name = kb_name
+        self.bump_version()
+        self._embedding_cache = get_embedding_cache(embed_model.model_id, self.d) if embed_model else None
+        store_name = self.get_store_name(kb_name)
+        # BM25 postings follow the nodes of this indexer, see insert_nodes()/delete_nodes().
+        # Milvus keeps its nodes across restarts, so its postings are restored per collection.
+        self._bm25_index = BM25Index(store_name, restore_postings=vector_type == IndexerType.MILVUS_VECTOR)
         match vector_type:
             case IndexerType.DEFAULT_VECTOR:
                 VectorStoreIndex.__init__(self, embed_model=embed_model, nodes=[])
             case IndexerType.FAISS_VECTOR:
-                faiss_index = faiss.IndexFlatL2(self.d)
-                faiss_store = StorageContext.from_defaults(vector_store=FaissVectorStore(faiss_index=faiss_index))
+                # IDMap2 allows removing vectors by node id
+                faiss_index = faiss.IndexIDMap2(faiss.IndexFlatL2(self.d))
+                faiss_store = StorageContext.from_defaults(vector_store=FaissIDMapVectorStore(faiss_index=faiss_index))
+                VectorStoreIndex.__init__(self, embed_model=embed_model, nodes=[], storage_context=faiss_store)
+            case vector_type if vector_type in FAISS_ANN_TYPES:
+                ann_store = FaissANNVectorStore(vector_type, self.d, self.index_params)
+                faiss_store = StorageContext.from_defaults(vector_store=ann_store)
                 VectorStoreIndex.__init__(self, embed_model=embed_model, nodes=[], storage_context=faiss_store)
             case IndexerType.MILVUS_VECTOR:
-                milvus_vector_store = MilvusVectorStore(
-                    uri=milvus_uri,
-                    dim=self.d,
-                    collection_name=kb_name + plname + str(self.d),
-                    overwrite=False,
-                )
+                # Cached per collection, reinitializing for a knowledge base reuses its clients
+                milvus_vector_store = get_milvus_vector_store(milvus_uri, store_name, self.d)
                 milvus_store = StorageContext.from_defaults(vector_store=milvus_vector_store)
                 VectorStoreIndex.__init__(self, embed_model=embed_model, nodes=[], storage_context=milvus_store)
 
+    # Milvus collection and BM25 file of a knowledge base, per active pipeline and embedding dimension
+    def get_store_name(self, kb_name: str) -> str:
+        pl = ctx.get_pipeline_mgr().get_active_pipeline()
+        plname = pl.name if pl else ""
+        return kb_name + plname + str(self.d)
+
     def reinitialize_indexer(self, kb_name="default_kb"):
         self._initialize_indexer(self.model, self.comp_subtype, self.milvus_uri, kb_name)
 
+    # Detach the indexed knowledge base, attach_kb_state() switches back to it without reindexing
+    def detach_kb_state(self) -> Dict[str, Any]:
+        return {attr: getattr(self, attr) for attr in _KB_STATE_ATTRS}
+
+    def attach_kb_state(self, state: Dict[str, Any]):
+        for attr, value in state.items():
+            setattr(self, attr, value)
+
+    # Rough memory held by the indexed knowledge base
+    def memory_bytes(self) -> int:
+        vector_store = self.vector_store
+        if isinstance(vector_store, FaissIDMapVectorStore):
+            vector_bytes = vector_store.memory_bytes()
+        elif self.comp_subtype == IndexerType.DEFAULT_VECTOR:
+            # Embeddings are kept as lists of python floats, restored ones as rows of a memory map
+            vector_bytes = sum(
+                self.d * (4 if isinstance(embedding, np.ndarray) else 32)
+                for embedding in vector_store.data.embedding_dict.values()
+            )
+        else:
+            vector_bytes = 0
+        # Node texts, plus about as much again for their BM25 postings
+        text_bytes = sum(len(getattr(node, "text", "") or "") for node in self.docstore.docs.values())
+        return vector_bytes + 2 * text_bytes
+
+    # Held by retrievals while they read the indexed knowledge base
+    def reading(self):
+        return self._kb_lock.read()
+
+    # Held while the indexed knowledge base is swapped for another one
+    def swapping(self):
+        return self._kb_lock.write()
+
+    @property
+    def bm25_index(self) -> BM25Index:
+        return self._bm25_index
+
+    # Version of the indexed knowledge base, changes with every insert, delete and reinitialization
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def bump_version(self):
+        self._version = next(_kb_versions)
+
+    # With flush=False the vector store writes are flushed by the next flush(), e.g. once per ingestion job
+    def insert_nodes(self, nodes: Sequence[BaseNode], flush: bool = True, **insert_kwargs: Any) -> None:
+        VectorStoreIndex.insert_nodes(self, nodes, **insert_kwargs)
+        self._bm25_index.add_nodes(nodes)
+        self.bump_version()
+        if flush:
+            # Outside of ingestion jobs, e.g. text uploads, the nodes are written before returning
+            # and a failed background insert is raised here
+            self.flush()
+
+    # Nodes by id, read from the docstore or, for the ones missing there, from a vector store keeping text
+    def get_nodes_by_id(self, node_ids: List[str]) -> Dict[str, BaseNode]:
+        docstore = self.docstore
+        nodes = {}
+        for node_id in node_ids:
+            # get_nodes(raise_error=False) still raises on missing ids
+            node = docstore.get_document(node_id, raise_error=False)
+            if node is not None:
+                nodes[node_id] = node
+        missing = [node_id for node_id in node_ids if node_id not in nodes]
+        if missing and self.vector_store.stores_text:
+            # Milvus does not populate the docstore, all missing nodes are read in one query
+            nodes.update((node.node_id, node) for node in self.vector_store.get_nodes(node_ids=missing))
+        return nodes
+
+    # Waits for the writes of vector stores inserting in the background, see MilvusBulkVectorStore.
+    # BM25 changes are saved periodically, see BM25Index.
+    def flush(self):
+        flush = getattr(self.vector_store, "flush", None)
+        if flush is not None:
+            flush()
+
+    def _get_node_with_embedding(self, nodes: Sequence[BaseNode], show_progress: bool = False) -> List[BaseNode]:
+        # Look chunk embeddings up in the embedding cache, only embed the misses
+        if self._embedding_cache is None:
+            return VectorStoreIndex._get_node_with_embedding(self, nodes, show_progress)
+        texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+        results = [node.model_copy() for node in nodes]
+        missing = []
+        for i, embedding in enumerate(self._embedding_cache.get_many(texts)):
+            if embedding is not None:
+                results[i].embedding = embedding
+            elif results[i].embedding is None:
+                missing.append(i)
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            embeddings = self._embed_model.get_text_embedding_batch(missing_texts, show_progress=show_progress)
+            for i, embedding in zip(missing, embeddings):
+                results[i].embedding = embedding
+            self._embedding_cache.put_many(missing_texts, embeddings)
+        return results
+
+    # Vector store state for snapshots, see SnapshotMgr
+    def save_vector_store(self, directory: str) -> Dict[str, Any]:
+        if isinstance(self.vector_store, FaissIDMapVectorStore):
+            return {"format": "faiss", **self.vector_store.save_state(directory)}
+        # Default in-memory store, its vectors are read back through a memory map on restore
+        embedding_dict = self.vector_store.data.embedding_dict
+        node_ids = list(embedding_dict)
+        vectors = np.array([embedding_dict[node_id] for node_id in node_ids], dtype=np.float32)
+        np.save(os.path.join(directory, "vectors.npy"), vectors.reshape(len(node_ids), self.d))
+        return {"format": "npy", "node_ids": node_ids}
+
+    def load_vector_store(self, directory: str, state: Dict[str, Any], nodes: List[BaseNode]):
+        # Nodes come without embeddings, they are added to the docstore and index struct as insert_nodes() does
+        if state["format"] == "faiss":
+            self.vector_store.load_state(directory, state)
+        else:
+            vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode="r")
+            rows = {node_id: row for row, node_id in enumerate(state["node_ids"])}
+            embedded = [node for node in nodes if node.node_id in rows]
+            # Node embeddings are validated into lists, so the store gets placeholders and then the
+            # rows of the memory map, which are paged in on demand instead of copied
+            for node in embedded:
+                node.embedding = []
+            self.vector_store.add(embedded)
+            embedding_dict = self.vector_store.data.embedding_dict
+            for node in embedded:
+                embedding_dict[node.node_id] = vectors[rows[node.node_id]]
+                node.embedding = None
+        for node in nodes:
+            self.index_struct.add_node(node, text_id=node.node_id)
+        self.docstore.add_documents(nodes, allow_update=True)
+        self.storage_context.index_store.add_index_struct(self.index_struct)
+        self._bm25_index.add_nodes(nodes)
+        self.bump_version()
+
+    def delete_nodes(self, node_ids: List[str], delete_from_docstore: bool = False, **delete_kwargs: Any) -> None:
+        if not self.vector_store.stores_text:
+            # index_struct.delete() raises on unknown ids, e.g. nodes already dropped by a reinitialization
+            node_ids = [node_id for node_id in node_ids if node_id in self.index_struct.nodes_dict]
+        if not node_ids:
+            return
+        VectorStoreIndex.delete_nodes(self, node_ids, delete_from_docstore=delete_from_docstore, **delete_kwargs)
+        self._bm25_index.delete_nodes(node_ids)
+        self.bump_version()
+
+    # Node ids of files, keyed as NodeMgr does: file path, or source document id for text uploads
+    def get_file_node_ids(self, file_keys: List[str]) -> List[str]:
+        keys = set(file_keys)
+        if not keys:
+            return []
+        node_ids = []
+        # Every node, hierarchical parents included, is listed under its source document
+        for doc_id, ref_doc_info in (self.docstore.get_all_ref_doc_info() or {}).items():
+            if doc_id in keys or ref_doc_info.metadata.get("file_path") in keys:
+                node_ids.extend(ref_doc_info.node_ids)
+        if self.vector_store.stores_text:
+            # Milvus does not populate the docstore, its rows carry the same keys
+            filters = MetadataFilters(
+                filters=[
+                    MetadataFilter(key="file_path", value=list(keys), operator=FilterOperator.IN),
+                    MetadataFilter(key="ref_doc_id", value=list(keys), operator=FilterOperator.IN),
+                ],
+                condition=FilterCondition.OR,
+            )
+            node_ids.extend(node.node_id for node in self.vector_store.get_nodes(filters=filters))
+        return list(dict.fromkeys(node_ids))
+
+    def delete_file_nodes(self, file_keys: List[str], node_ids: List[str] = None) -> List[str]:
+        # Node ids tracked by NodeMgr may miss nodes, e.g. the ones Milvus kept across
+        # restarts, so the ones the indexer itself holds for the files are added
+        node_ids = list(dict.fromkeys((node_ids or []) + self.get_file_node_ids(file_keys)))
+        if node_ids:
+            self.delete_nodes(node_ids, delete_from_docstore=True)
+        return node_ids
+
     def clear_milvus_collection(self, kb_name="default_kb"):
-        # get active name
-        pl = ctx.get_pipeline_mgr().get_active_pipeline()
-        plname = pl.name if pl else ""
-        milvus_vector_store = MilvusVectorStore(
-            uri=self.milvus_uri,
-            collection_name=kb_name + plname + str(self.d),
-            overwrite=False,
-        )
-        milvus_vector_store.clear()
+        store_name = self.get_store_name(kb_name)
+        drop_milvus_collection(self.milvus_uri, store_name)
+        # Changes of the dropped collection not saved yet are not saved anymore
+        discard_pending(get_bm25_path(store_name))
+        bm25_index = BM25Index(store_name)
+        bm25_index.persist()
+        if self.kb_name == kb_name:
+            self._bm25_index.clear()
+            self.bump_version()
 
     def run(self, **kwargs) -> Any:
         pass
@@ -74,4 +328,7 @@ class VectorIndexer(BaseComponent, VectorStoreIndex):
     @model_serializer
     def ser_model(self):
         set = {"idx": self.idx, "indexer_type": self.comp_subtype, "model": self.model}
+        if isinstance(self.vector_store, FaissANNVectorStore):
+            set["index_params"] = self.vector_store.index_params
+            set["trained"] = self.vector_store.trained
         return set
@@ -0,0 +1,132 @@
+# Copyright (C) 2025 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.utils import iter_batch
+from llama_index.core.vector_stores.utils import node_to_metadata_dict
+from llama_index.vector_stores.milvus import MilvusVectorStore
+
+# Rows sent to Milvus in one insert request
+MILVUS_INSERT_BATCH_SIZE = int(os.getenv("MILVUS_INSERT_BATCH_SIZE", "512"))
+# Insert requests in flight per collection, and in total
+MILVUS_INSERT_CONCURRENCY = int(os.getenv("MILVUS_INSERT_CONCURRENCY", "4"))
+MILVUS_ID_FIELD = "id"
+
+_insert_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_insert_executor() -> ThreadPoolExecutor:
+    global _insert_executor
+    with _executor_lock:
+        if _insert_executor is None:
+            _insert_executor = ThreadPoolExecutor(
+                max_workers=max(1, MILVUS_INSERT_CONCURRENCY), thread_name_prefix="ecrag-milvus"
+            )
+        return _insert_executor
+
+
+class MilvusBulkVectorStore(MilvusVectorStore):
+    # add() hands its rows to insert requests running in the background, at most
+    # MILVUS_INSERT_CONCURRENCY of them in flight, so the next batch of nodes is
+    # embedded while the previous one is written. flush() waits for them, then
+    # flushes the collection and builds its index once for the ingestion job.
+    # Deletes and reads wait for the pending inserts first.
+
+    _pending: List[Future] = PrivateAttr(default_factory=list)
+    _pending_lock: Any = PrivateAttr(default_factory=threading.Lock)
+    _slots: Any = PrivateAttr(default_factory=lambda: threading.BoundedSemaphore(max(1, MILVUS_INSERT_CONCURRENCY)))
+
+    def _insert(self, rows: List[Dict[str, Any]]):
+        try:
+            self.client.insert(self.collection_name, rows)
+        finally:
+            self._slots.release()
+
+    def add(self, nodes: List[BaseNode], **add_kwargs: Any) -> List[str]:
+        if self.enable_sparse:
+            return super().add(nodes, **add_kwargs)
+        rows = []
+        for node in nodes:
+            row = node_to_metadata_dict(node, remove_text=True, text_field=self.text_key)
+            row[self.text_key] = getattr(node, self.text_key, "")
+            row[MILVUS_ID_FIELD] = node.node_id
+            row[self.embedding_field] = node.embedding
+            rows.append(row)
+        for batch in iter_batch(rows, MILVUS_INSERT_BATCH_SIZE):
+            self._slots.acquire()
+            try:
+                future = get_insert_executor().submit(self._insert, batch)
+            except Exception:
+                self._slots.release()
+                raise
+            with self._pending_lock:
+                self._pending.append(future)
+        if add_kwargs.get("force_flush", False):
+            self.flush()
+        return [node.node_id for node in nodes]
+
+    def wait(self):
+        # Raises the first error of the pending inserts
+        with self._pending_lock:
+            pending, self._pending = self._pending, []
+        error = None
+        for future in pending:
+            try:
+                future.result()
+            except Exception as e:
+                error = error or e
+        if error is not None:
+            raise error
+
+    def flush(self):
+        self.wait()
+        self.client.flush(self.collection_name)
+        self._create_index_if_required()
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        self.wait()
+        super().delete(ref_doc_id, **delete_kwargs)
+
+    def delete_nodes(self, node_ids: Optional[List[str]] = None, filters=None, **delete_kwargs: Any) -> None:
+        self.wait()
+        super().delete_nodes(node_ids, filters, **delete_kwargs)
+
+    def get_nodes(self, node_ids: Optional[List[str]] = None, filters=None) -> List[BaseNode]:
+        self.wait()
+        return super().get_nodes(node_ids, filters)
+
+    def clear(self) -> None:
+        self.wait()
+        super().clear()
+
+
+# Vector store per collection, i.e. per knowledge base, so its clients and
+# collection handle are reused across reinitializations of the indexer
+_vector_stores: Dict[Tuple[str, str], MilvusBulkVectorStore] = {}
+_vector_stores_lock = threading.Lock()
+
+
+def get_milvus_vector_store(uri: str, collection_name: str, dim: Optional[int] = None) -> MilvusBulkVectorStore:
+    key = (uri, collection_name)
+    with _vector_stores_lock:
+        vector_store = _vector_stores.get(key)
+        if vector_store is None:
+            vector_store = MilvusBulkVectorStore(uri=uri, dim=dim, collection_name=collection_name, overwrite=False)
+            _vector_stores[key] = vector_store
+        return vector_store
+
+
+def drop_milvus_collection(uri: str, collection_name: str):
+    # The collection is created again by the next get_milvus_vector_store()
+    with _vector_stores_lock:
+        vector_store = _vector_stores.pop((uri, collection_name), None)
+    if vector_store is None:
+        vector_store = MilvusBulkVectorStore(uri=uri, collection_name=collection_name, overwrite=False)
+    vector_store.clear()
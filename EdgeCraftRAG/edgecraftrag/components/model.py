@@ -1,15 +1,40 @@
 # Copyright (C) 2024 Intel Corporation
 # SPDX-License-Identifier: Apache-2.0
 
+import os
+import re
 from pathlib import Path
-from typing import Any, Optional
+from typing import Any, List, Optional, Tuple
 
+import numpy as np
 from edgecraftrag.base import BaseComponent, CompType, ModelType
+from edgecraftrag.components.batching import DynamicBatcher, register_batcher, unregister_batcher
+from edgecraftrag.components.generation_scheduler import GenerationScheduler, register_scheduler, unregister_scheduler
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+from llama_index.embeddings.huggingface.utils import format_query, format_text
 from llama_index.embeddings.huggingface_openvino import OpenVINOEmbedding
 from llama_index.llms.openvino import OpenVINOLLM
 from llama_index.postprocessor.openvino_rerank import OpenVINORerank
 from pydantic import Field, model_serializer
 
+# Maximum number of texts embedded in one embedding model inference
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+# Milliseconds the embedding model waits to coalesce texts of concurrent requests into one batch
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv("EMBEDDING_BATCH_WINDOW_MS", "5"))
+# Maximum number of query/passage pairs scored in one reranker inference
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "32"))
+# Milliseconds the reranker waits to coalesce pairs of concurrent requests into one batch
+RERANK_BATCH_WINDOW_MS = float(os.getenv("RERANK_BATCH_WINDOW_MS", "5"))
+# Token budget of a query/passage pair, longer passages are truncated
+RERANK_MAX_TOKENS = int(os.getenv("RERANK_MAX_TOKENS", "512"))
+# Directory of the compiled model blobs kept by OpenVINO across restarts, empty disables the cache
+MODEL_CACHE_DIR = os.getenv(
+    "MODEL_CACHE_DIR", os.path.join(os.getenv("TMPFILE_PATH", "/home/user/ui_cache"), "ov_cache")
+)
+# Run one inference after loading a model so the first query does not pay for it
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "true").lower() == "true"
+_WARMUP_TEXT = "warmup"
+
 
 def model_exist(model_path):
     model_dir = Path(model_path)
@@ -20,6 +45,14 @@ def model_exist(model_path):
     )
 
 
+def get_ov_config(model_path, device) -> dict:
+    # Compiled blobs are cached per model and device
+    if not MODEL_CACHE_DIR:
+        return {}
+    model_key = re.sub(r"[^\w.-]+", "_", str(model_path).strip("/")) or "model"
+    return {"CACHE_DIR": os.path.join(MODEL_CACHE_DIR, model_key, str(device).lower())}
+
+
 class BaseModelComponent(BaseComponent):
 
     model_id: Optional[str] = Field(default="")
@@ -30,6 +63,12 @@ class BaseModelComponent(BaseComponent):
     def run(self, **kwargs) -> Any:
         pass
 
+    def release(self):
+        pass
+
+    def warmup(self):
+        pass
+
     @model_serializer
     def ser_model(self):
         set = {
@@ -48,13 +87,59 @@ class OpenVINOEmbeddingModel(BaseModelComponent, OpenVINOEmbedding):
     def __init__(self, model_id, model_path, device, weight):
         if not model_exist(model_path):
             OpenVINOEmbedding.create_and_save_openvino_model(model_id, model_path)
-        OpenVINOEmbedding.__init__(self, model_id_or_path=model_path, device=device)
+        OpenVINOEmbedding.__init__(
+            self,
+            model_id_or_path=model_path,
+            device=device,
+            model_kwargs={"ov_config": get_ov_config(model_path, device)},
+        )
         self.comp_type = CompType.MODEL
         self.comp_subtype = ModelType.EMBEDDING
         self.model_id = model_id
         self.model_path = model_path
         self.device = device
         self.weight = ""
+        # A single batcher thread owns the tokenizer and compiled model, query and
+        # document texts of concurrent requests are embedded together
+        self._batcher = DynamicBatcher(model_id, self._embed_texts, EMBEDDING_BATCH_SIZE, EMBEDDING_BATCH_WINDOW_MS)
+        register_batcher(ModelType.EMBEDDING, self.idx, self._batcher)
+
+    def release(self):
+        unregister_batcher(ModelType.EMBEDDING, self.idx)
+        self._batcher.close()
+
+    def warmup(self):
+        self._batcher.run([_WARMUP_TEXT])
+
+    def _embed_texts(self, texts: List[str]) -> List[List[float]]:
+        # Texts of similar length share a batch so little compute goes to padding
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        embeddings = [None] * len(texts)
+        batch_size = self._batcher.max_batch_size
+        for start in range(0, len(order), batch_size):
+            bucket = order[start : start + batch_size]
+            for i, embedding in zip(bucket, self._embed([texts[i] for i in bucket])):
+                embeddings[i] = embedding
+        return embeddings
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        query = format_query(query, self.model_name, self.query_instruction)
+        return self._batcher.run([query])[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        query = format_query(query, self.model_name, self.query_instruction)
+        return (await self._batcher.arun([query]))[0]
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        text = format_text(text, self.model_name, self.text_instruction)
+        return (await self._batcher.arun([text]))[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        texts = [format_text(text, self.model_name, self.text_instruction) for text in texts]
+        return self._batcher.run(texts)
 
 
 class OpenVINORerankModel(BaseModelComponent, OpenVINORerank):
@@ -66,6 +151,7 @@ class OpenVINORerankModel(BaseModelComponent, OpenVINORerank):
             self,
             model_id_or_path=model_path,
             device=device,
+            model_kwargs={"ov_config": get_ov_config(model_path, device)},
         )
         self.comp_type = CompType.MODEL
         self.comp_subtype = ModelType.RERANKER
@@ -73,6 +159,70 @@ class OpenVINORerankModel(BaseModelComponent, OpenVINORerank):
         self.model_path = model_path
         self.device = device
         self.weight = ""
+        # A single batcher thread owns the tokenizer and compiled model, pairs of
+        # concurrent requests are scored together
+        self._batcher = DynamicBatcher(model_id, self._score_pairs, RERANK_BATCH_SIZE, RERANK_BATCH_WINDOW_MS)
+        register_batcher(ModelType.RERANKER, self.idx, self._batcher)
+
+    def release(self):
+        unregister_batcher(ModelType.RERANKER, self.idx)
+        self._batcher.close()
+
+    def warmup(self):
+        self._batcher.run([(_WARMUP_TEXT, _WARMUP_TEXT)])
+
+    def _score_pairs(self, pairs: List[Tuple[str, str]]) -> List[float]:
+        length = self._model.request.inputs[0].get_partial_shape()[1]
+        static_length = None if length.is_dynamic else length.get_length()
+        max_length = min(RERANK_MAX_TOKENS, static_length or RERANK_MAX_TOKENS)
+        queries, texts = [query for query, _ in pairs], [text for _, text in pairs]
+        try:
+            # Only the passages are cut, the query is kept whole
+            encodings = self._tokenizer(queries, texts, truncation="only_second", max_length=max_length)
+        except Exception:
+            # A query longer than max_length alone leaves nothing to cut from the passage
+            encodings = self._tokenizer(queries, texts, truncation=True, max_length=max_length)
+        features = [{key: value[i] for key, value in encodings.items()} for i in range(len(pairs))]
+
+        # Sort by token length so pairs of similar length share a batch and little compute goes to padding
+        order = sorted(range(len(pairs)), key=lambda i: len(features[i]["input_ids"]))
+        scores = [0.0] * len(pairs)
+        batch_size = self._batcher.max_batch_size
+        for start in range(0, len(order), batch_size):
+            bucket = order[start : start + batch_size]
+            if static_length is None:
+                padding = {"padding": "longest"}
+            else:
+                padding = {"padding": "max_length", "max_length": static_length}
+            input_tensors = self._tokenizer.pad([features[i] for i in bucket], return_tensors="pt", **padding)
+            outputs = self._model(**input_tensors, return_dict=True)
+            logits = np.asarray(outputs[0], dtype=np.float32)
+            if logits.shape[1] == 1:
+                bucket_scores = 1 / (1 + np.exp(-logits.flatten()))
+            else:
+                exp_logits = np.exp(logits)
+                bucket_scores = exp_logits[:, 1] / np.sum(exp_logits, axis=1)
+            for i, score in zip(bucket, bucket_scores):
+                scores[i] = float(score)
+        return scores
+
+    def rerank(self, nodes: List[NodeWithScore], query_str: str, top_n: int) -> List[NodeWithScore]:
+        if len(nodes) == 0:
+            return []
+        texts = [str(node.node.get_content(metadata_mode=MetadataMode.EMBED)) for node in nodes]
+        scores = self._batcher.run([(query_str, text) for text in texts])
+        for node, score in zip(nodes, scores):
+            if self.keep_retrieval_score:
+                node.node.metadata["retrieval_score"] = node.score
+            node.score = score
+        return sorted(nodes, key=lambda x: -x.score if x.score else 0)[:top_n]
+
+    def _postprocess_nodes(
+        self, nodes: List[NodeWithScore], query_bundle: Optional[QueryBundle] = None
+    ) -> List[NodeWithScore]:
+        if query_bundle is None:
+            raise ValueError("Missing query bundle in extra info.")
+        return self.rerank(nodes, query_bundle.query_str, self.top_n)
 
 
 class OpenVINOLLMModel(BaseModelComponent, OpenVINOLLM):
@@ -83,6 +233,7 @@ class OpenVINOLLMModel(BaseModelComponent, OpenVINOLLM):
             model_id_or_path=model_path,
             model=model,
             device_map=device,
+            model_kwargs={"ov_config": get_ov_config(model_path, device)},
         )
         self.comp_type = CompType.MODEL
         self.comp_subtype = ModelType.LLM
@@ -90,3 +241,17 @@ class OpenVINOLLMModel(BaseModelComponent, OpenVINOLLM):
         self.model_path = model_path
         self.device = device
         self.weight = weight
+        self._scheduler = GenerationScheduler(model_id, self)
+        register_scheduler(self.idx, self._scheduler)
+
+    @property
+    def scheduler(self) -> GenerationScheduler:
+        return self._scheduler
+
+    def release(self):
+        unregister_scheduler(self.idx)
+        self._scheduler.close()
+
+    def warmup(self):
+        inputs = self._tokenizer(_WARMUP_TEXT, return_tensors="pt")
+        self._model.generate(**inputs, max_new_tokens=4)
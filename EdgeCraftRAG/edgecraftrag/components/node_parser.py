@@ -1,14 +1,57 @@
 # Copyright (C) 2024 Intel Corporation
 # SPDX-License-Identifier: Apache-2.0
 
+import json
 from typing import Any
 
 from edgecraftrag.base import BaseComponent, CompType, NodeParserType
+from edgecraftrag.components.url_validator import find_urls
 from edgecraftrag.utils import IMG_OUTPUT_DIR, DocxParagraphPicturePartitioner
 from llama_index.core.node_parser import HierarchicalNodeParser, SentenceSplitter, SentenceWindowNodeParser
 from llama_index.readers.file import UnstructuredReader
 from pydantic import model_serializer
 from unstructured.partition.docx import register_picture_partitioner
+from unstructured.staging.base import elements_from_base64_gzipped_json
+
+# Metadata keys of the references shown with an answer, precomputed when a file is parsed
+REF_LABEL_KEY = "ref_label"
+REF_IMAGES_KEY = "ref_images"
+REF_LINKS_KEY = "ref_links"
+REF_METADATA_KEYS = [REF_LABEL_KEY, REF_IMAGES_KEY, REF_LINKS_KEY]
+
+
+def get_unstructured_refs(metadata, text: str = ""):
+    # Returns the reference label, image paths and links of a chunk parsed by unstructured
+    label = None
+    if "filename" in metadata:
+        label = metadata["filename"]
+        if "page_number" in metadata:
+            label += " --page" + str(metadata["page_number"])
+    image_paths = []
+    if "orig_elements" in metadata:
+        for element in elements_from_base64_gzipped_json(metadata["orig_elements"]):
+            if element.metadata.image_path:
+                image_paths.append(element.metadata.image_path)
+    links = []
+    if isinstance(metadata.get("link_urls"), str):
+        try:
+            links.extend(json.loads(metadata["link_urls"]))
+        except json.JSONDecodeError:
+            print("link_urls is not a valid JSON string.")
+    links.extend(find_urls(text))
+    return label, image_paths, list(dict.fromkeys(links))
+
+
+def add_unstructured_refs(node):
+    label, image_paths, links = get_unstructured_refs(node.metadata, node.get_content())
+    if label is not None:
+        node.metadata[REF_LABEL_KEY] = label
+    # Lists are stored as JSON strings like link_urls, the serialized elements are not needed anymore
+    node.metadata[REF_IMAGES_KEY] = json.dumps(image_paths)
+    node.metadata[REF_LINKS_KEY] = json.dumps(links)
+    node.metadata.pop("orig_elements", None)
+    node.excluded_embed_metadata_keys = list(node.excluded_embed_metadata_keys) + REF_METADATA_KEYS
+    node.excluded_llm_metadata_keys = list(node.excluded_llm_metadata_keys) + REF_METADATA_KEYS
 
 
 class SimpleNodeParser(BaseComponent, SentenceSplitter):
@@ -118,8 +161,9 @@ class UnstructedNodeParser(BaseComponent, UnstructuredReader):
             "last_modified_date",
             "last_accessed_date",
             "orig_elements",
+            "file_path",
         ]
-        self._excluded_llm_metadata_keys = ["orig_elements"]
+        self._excluded_llm_metadata_keys = ["orig_elements", "file_path"]
         # PDF image extraction parameters
         self._extract_images_in_pdf = True
         self._image_output_dir = IMG_OUTPUT_DIR
@@ -148,11 +192,15 @@ class UnstructedNodeParser(BaseComponent, UnstructuredReader):
                                 "overlap": self.chunk_overlap,
                             },
                             split_documents=True,
+                            # file_path maps the nodes back to their file for node-level deletion
+                            extra_info={"file_path": file_path},
                             document_kwargs={
                                 "excluded_embed_metadata_keys": self._excluded_embed_metadata_keys,
                                 "excluded_llm_metadata_keys": self._excluded_llm_metadata_keys,
                             },
                         )
+                        for node in nodes:
+                            add_unstructured_refs(node)
                         nodelist += nodes
                         processed_paths.add(file_path)
                 return nodelist
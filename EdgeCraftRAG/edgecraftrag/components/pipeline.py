@@ -1,18 +1,22 @@
 # Copyright (C) 2024 Intel Corporation
 # SPDX-License-Identifier: Apache-2.0
 
-import asyncio
 import json
 import os
 import time
-from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Callable, List, Optional
 
 from comps.cores.proto.api_protocol import ChatCompletionRequest
 from edgecraftrag.base import BaseComponent, CallbackType, CompType, InferenceType, RetrieverType
 from edgecraftrag.components.postprocessor import RerankProcessor
 from edgecraftrag.components.query_preprocess import query_search
-from edgecraftrag.components.retriever import AutoMergeRetriever, SimpleBM25Retriever, VectorSimRetriever
+from edgecraftrag.components.retrieval_cache import get_retrieval_cache, normalize_query
+from edgecraftrag.components.retriever import (
+    AutoMergeRetriever,
+    HybridRetriever,
+    SimpleBM25Retriever,
+    VectorSimRetriever,
+)
 from fastapi.responses import StreamingResponse
 from llama_index.core.schema import Document, QueryBundle
 from pydantic import BaseModel, Field, model_serializer
@@ -111,9 +115,24 @@ class Pipeline(BaseComponent):
                 case RetrieverType.VECTORSIMILARITY:
                     new_retriever = VectorSimRetriever(self.indexer, similarity_top_k=similarity_top_k)
                 case RetrieverType.AUTOMERGE:
-                    new_retriever = AutoMergeRetriever(self.indexer, similarity_top_k=similarity_top_k)
+                    new_retriever = AutoMergeRetriever(
+                        self.indexer,
+                        simple_ratio_thresh=old_retriever.simple_ratio_thresh,
+                        similarity_top_k=similarity_top_k,
+                    )
                 case RetrieverType.BM25:
                     new_retriever = SimpleBM25Retriever(self.indexer, similarity_top_k=similarity_top_k)
+                case RetrieverType.HYBRID:
+                    new_retriever = HybridRetriever(
+                        self.indexer,
+                        similarity_top_k,
+                        vector_topk=old_retriever.vector_topk,
+                        bm25_topk=old_retriever.bm25_topk,
+                        fusion_mode=old_retriever.fusion_mode,
+                        vector_weight=old_retriever.vector_weight,
+                        bm25_weight=old_retriever.bm25_weight,
+                        rrf_k=old_retriever.rrf_k,
+                    )
                 case _:
                     new_retriever = old_retriever
 
@@ -127,12 +146,20 @@ class Pipeline(BaseComponent):
             if kwargs["cbtype"] == CallbackType.DATAPREP:
                 if "docs" in kwargs:
                     return self.run_data_prepare_cb(self, docs=kwargs["docs"])
+            # Retrieve and pipeline callbacks are coroutines running their stages through stage_mgr
             if kwargs["cbtype"] == CallbackType.RETRIEVE:
                 if "chat_request" in kwargs:
-                    return self.run_retriever_cb(self, chat_request=kwargs["chat_request"])
+                    return self.run_retriever_cb(
+                        self, chat_request=kwargs["chat_request"], stage_mgr=kwargs.get("stage_mgr")
+                    )
             if kwargs["cbtype"] == CallbackType.PIPELINE:
                 if "chat_request" in kwargs:
-                    return self.run_pipeline_cb(self, chat_request=kwargs["chat_request"])
+                    return self.run_pipeline_cb(
+                        self,
+                        chat_request=kwargs["chat_request"],
+                        stage_mgr=kwargs.get("stage_mgr"),
+                        session=kwargs.get("session"),
+                    )
 
     def update(self, node_parser=None, indexer=None, retriever=None, postprocessor=None, generator=None):
         if node_parser is not None:
@@ -181,22 +208,133 @@ class Pipeline(BaseComponent):
         return False
 
 
-# Test callback to retrieve nodes from query
-def run_retrieve(pl: Pipeline, chat_request: ChatCompletionRequest) -> Any:
-    query = chat_request.messages
-    contexts = {}
-    retri_res = pl.retriever.run(query=query)
-    contexts[CompType.RETRIEVER] = retri_res
-    query_bundle = QueryBundle(query)
+# Run a blocking stage in the stage executor, or inline when no executor is given
+async def run_stage(stage_mgr, stage, func, *args, **kwargs):
+    if stage_mgr is None:
+        return func(*args, **kwargs)
+    return await stage_mgr.run(stage, func, *args, **kwargs)
+
+
+def run_postprocessors(pl: Pipeline, chat_request: ChatCompletionRequest, retri_res, query_bundle, contexts):
     if pl.postprocessor:
+        top_n = None
+        if chat_request.top_n != ChatCompletionRequest.model_fields["top_n"].default:
+            top_n = chat_request.top_n
         for processor in pl.postprocessor:
-            if (
-                isinstance(processor, RerankProcessor)
-                and chat_request.top_n != ChatCompletionRequest.model_fields["top_n"].default
-            ):
-                processor.top_n = chat_request.top_n
-            retri_res = processor.run(retri_res=retri_res, query_bundle=query_bundle)
+            if isinstance(processor, RerankProcessor):
+                retri_res = processor.run(retri_res=retri_res, query_bundle=query_bundle, top_n=top_n)
+            else:
+                retri_res = processor.run(retri_res=retri_res, query_bundle=query_bundle)
             contexts[CompType.POSTPROCESSOR] = retri_res
+    return retri_res
+
+
+def get_retrieval_cache_key(pl: Pipeline, chat_request: ChatCompletionRequest, query):
+    if pl.indexer is None or pl.retriever is None or not get_retrieval_cache().enabled:
+        return None
+    components = [pl.retriever.idx]
+    top_n = None
+    for processor in pl.postprocessor or []:
+        components.append(processor.idx)
+        if isinstance(processor, RerankProcessor):
+            if chat_request.top_n != ChatCompletionRequest.model_fields["top_n"].default:
+                top_n = chat_request.top_n
+            else:
+                top_n = processor.top_n
+    # The indexer version changes with every insert, delete or reindex of the knowledge base
+    return (
+        pl.idx,
+        pl.indexer.kb_name,
+        pl.indexer.version,
+        tuple(components),
+        normalize_query(query),
+        pl.retriever.topk,
+        top_n,
+    )
+
+
+# Switching the knowledge base of the indexer waits for running retrievals, and they for it
+def retrieve(pl: Pipeline, **kwargs):
+    if pl.indexer is None:
+        return pl.retriever.run(**kwargs)
+    with pl.indexer.reading():
+        return pl.retriever.run(**kwargs)
+
+
+# Retrieve and postprocess the nodes of a query, cached results skip both stages
+async def run_retrieval(
+    pl: Pipeline, chat_request: ChatCompletionRequest, query, stage_mgr=None, benchmark_data=None, start=None
+):
+    cache = get_retrieval_cache()
+    key = get_retrieval_cache_key(pl, chat_request, query)
+    start = start or time.perf_counter()
+    cached = cache.get(key) if key is not None else None
+    if benchmark_data is not None and key is not None:
+        benchmark_data["retrieval_cache"] = "hit" if cached is not None else "miss"
+        pl.benchmark.insert_retrieval_cache_data(cached is not None)
+    if cached is not None:
+        retri_res, contexts = cached
+        if benchmark_data is not None:
+            benchmark_data[CompType.RETRIEVER] = time.perf_counter() - start
+            benchmark_data[CompType.POSTPROCESSOR] = 0.0
+        return retri_res, dict(contexts)
+
+    contexts = {}
+    retrieve_kwargs = {"query": query}
+    if benchmark_data is not None and isinstance(pl.retriever, HybridRetriever):
+        # Latency of each branch of the hybrid retriever
+        retrieve_kwargs["latency"] = {}
+    retri_res = await run_stage(stage_mgr, CompType.RETRIEVER, retrieve, pl, **retrieve_kwargs)
+    contexts[CompType.RETRIEVER] = retri_res
+    if benchmark_data is not None:
+        benchmark_data[CompType.RETRIEVER] = time.perf_counter() - start
+        for branch, latency in retrieve_kwargs.get("latency", {}).items():
+            benchmark_data[f"retriever_{branch}"] = latency
+        start = time.perf_counter()
+
+    query_bundle = QueryBundle(query)
+    retri_res = await run_stage(
+        stage_mgr, CompType.POSTPROCESSOR, run_postprocessors, pl, chat_request, retri_res, query_bundle, contexts
+    )
+    if benchmark_data is not None:
+        benchmark_data[CompType.POSTPROCESSOR] = time.perf_counter() - start
+    if key is not None:
+        cache.put(key, (retri_res, dict(contexts)))
+    return retri_res, contexts
+
+
+# query_search is a coroutine and runs on the server event loop
+async def run_query_search(pl: Pipeline, query):
+    UI_DIRECTORY = os.getenv("TMPFILE_PATH", "/home/user/ui_cache")
+    search_config_path = os.path.join(UI_DIRECTORY, "configs/search_config.yaml")
+    search_dir = os.path.join(UI_DIRECTORY, "configs/search_dir")
+    return await query_search(query, search_config_path, search_dir, pl)
+
+
+def run_generate(
+    pl: Pipeline,
+    chat_request: ChatCompletionRequest,
+    retri_res,
+    sub_questions=None,
+    prompt=None,
+    session=None,
+    usage=None,
+):
+    np_type = pl.node_parser.comp_subtype
+    if pl.generator.inference_type == InferenceType.LOCAL:
+        return pl.generator.run(chat_request, retri_res, np_type, prompt=prompt, session=session)
+    elif pl.generator.inference_type == InferenceType.VLLM:
+        return pl.generator.run_vllm(
+            chat_request, retri_res, np_type, sub_questions=sub_questions, prompt=prompt, session=session, usage=usage
+        )
+    else:
+        raise ValueError("LLM inference_type not supported")
+
+
+# Test callback to retrieve nodes from query
+async def run_retrieve(pl: Pipeline, chat_request: ChatCompletionRequest, stage_mgr=None) -> Any:
+    query = chat_request.messages
+    retri_res, contexts = await run_retrieval(pl, chat_request, query, stage_mgr)
     return contexts
 
 
@@ -208,15 +346,33 @@ def run_simple_doc(pl: Pipeline, docs: List[Document]) -> Any:
     return n
 
 
-def benchmark_response(ret, benchmark, benchmark_index, benchmark_data, input_token_size, start):
+def benchmark_response(ret, benchmark, benchmark_index, benchmark_data, input_token_size, start, usage=None):
+    # usage holds the token counts of a vLLM stream once it ends, see stream_generator()
     if isinstance(ret, StreamingResponse):
         original_body_iterator = ret.body_iterator
 
         async def timing_wrapper():
+            first_chunk = None
             async for chunk in original_body_iterator:
+                if first_chunk is None:
+                    first_chunk = time.perf_counter()
                 yield chunk
-            benchmark_data[CompType.GENERATOR] = time.perf_counter() - start
-            benchmark.insert_llm_data(benchmark_index, input_token_size)
+            end = time.perf_counter()
+            benchmark_data[CompType.GENERATOR] = end - start
+            ttft = first_chunk - start if first_chunk is not None else None
+            generation_time = end - first_chunk if first_chunk is not None else None
+            output_tokens = None
+            if usage:
+                output_tokens = usage.get("completion_tokens")
+                if output_tokens is None:
+                    output_tokens = benchmark.cal_output_token_size(usage.get("completion_text", ""))
+            benchmark.insert_llm_data(
+                benchmark_index,
+                input_token_size,
+                ttft=ttft,
+                output_tokens=output_tokens,
+                generation_time=generation_time,
+            )
             benchmark.insert_benchmark_data(benchmark_data)
 
         ret.body_iterator = timing_wrapper()
@@ -225,65 +381,48 @@ def benchmark_response(ret, benchmark, benchmark_index, benchmark_data, input_to
         return ret
 
 
-def run_generator_ben(pl: Pipeline, chat_request: ChatCompletionRequest) -> Any:
+async def run_generator_ben(pl: Pipeline, chat_request: ChatCompletionRequest, stage_mgr=None, session=None) -> Any:
     benchmark_index, benchmark_data = pl.benchmark.init_benchmark_data()
-    contexts = {}
     start = time.perf_counter()
     query = chat_request.messages
+    sub_questionss_result = None
     if pl.generator.inference_type == InferenceType.VLLM:
-        UI_DIRECTORY = os.getenv("TMPFILE_PATH", "/home/user/ui_cache")
-        search_config_path = os.path.join(UI_DIRECTORY, "configs/search_config.yaml")
-        search_dir = os.path.join(UI_DIRECTORY, "configs/search_dir")
-
-        def run_async_query_search():
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                return loop.run_until_complete(query_search(query, search_config_path, search_dir, pl))
-            finally:
-                loop.close()
-
-        with ThreadPoolExecutor(max_workers=1) as executor:
-            future = executor.submit(run_async_query_search)
-            top1_issue, sub_questionss_result = future.result()
+        top1_issue, sub_questionss_result = await run_query_search(pl, query)
         if sub_questionss_result:
             query = query + sub_questionss_result
 
-    retri_res = pl.retriever.run(query=query)
-    query_bundle = QueryBundle(query)
-    benchmark_data[CompType.RETRIEVER] = time.perf_counter() - start
-    contexts[CompType.RETRIEVER] = retri_res
-
-    start = time.perf_counter()
-    if pl.postprocessor:
-        for processor in pl.postprocessor:
-            if (
-                isinstance(processor, RerankProcessor)
-                and chat_request.top_n != ChatCompletionRequest.model_fields["top_n"].default
-            ):
-                processor.top_n = chat_request.top_n
-            retri_res = processor.run(retri_res=retri_res, query_bundle=query_bundle)
-            contexts[CompType.POSTPROCESSOR] = retri_res
-    benchmark_data[CompType.POSTPROCESSOR] = time.perf_counter() - start
+    retri_res, contexts = await run_retrieval(pl, chat_request, query, stage_mgr, benchmark_data, start)
 
     if pl.generator is None:
         raise ValueError("No Generator Specified")
 
-    text_gen_context, prompt_str = pl.generator.query_transform(chat_request, retri_res)
-    input_token_size = pl.benchmark.cal_input_token_size(prompt_str)
+    # The prompt is assembled once, its token breakdown goes to the benchmark data
+    token_usage = {}
+    prompt = pl.generator.query_transform(
+        chat_request, retri_res, sub_questions=sub_questionss_result, token_usage=token_usage, session=session
+    )
+    benchmark_data["prompt_tokens"] = token_usage
+    input_token_size = pl.benchmark.cal_input_token_size(prompt[1])
 
-    np_type = pl.node_parser.comp_subtype
     start = time.perf_counter()
-    if pl.generator.inference_type == InferenceType.LOCAL:
-        ret = pl.generator.run(chat_request, retri_res, np_type)
-    elif pl.generator.inference_type == InferenceType.VLLM:
-        ret = pl.generator.run_vllm(chat_request, retri_res, np_type, sub_questions=sub_questionss_result)
-    else:
-        raise ValueError("LLM inference_type not supported")
+    # Filled with the output token count vLLM reports, the streamed chunks are not tokens
+    usage = {}
+    ret = await run_stage(
+        stage_mgr,
+        CompType.GENERATOR,
+        run_generate,
+        pl,
+        chat_request,
+        retri_res,
+        sub_questions=sub_questionss_result,
+        prompt=prompt,
+        session=session,
+        usage=usage,
+    )
     end = time.perf_counter()
 
     if isinstance(ret, StreamingResponse):
-        ret = benchmark_response(ret, pl.benchmark, benchmark_index, benchmark_data, input_token_size, start)
+        ret = benchmark_response(ret, pl.benchmark, benchmark_index, benchmark_data, input_token_size, start, usage)
     else:
         benchmark_data[CompType.GENERATOR] = end - start
         pl.benchmark.insert_llm_data(benchmark_index, input_token_size)
@@ -291,48 +430,25 @@ def run_generator_ben(pl: Pipeline, chat_request: ChatCompletionRequest) -> Any:
     return ret, contexts
 
 
-def run_generator(pl: Pipeline, chat_request: ChatCompletionRequest) -> Any:
+async def run_generator(pl: Pipeline, chat_request: ChatCompletionRequest, stage_mgr=None, session=None) -> Any:
     query = chat_request.messages
-    contexts = {}
+    sub_questionss_result = None
     if pl.generator.inference_type == InferenceType.VLLM:
-        UI_DIRECTORY = os.getenv("TMPFILE_PATH", "/home/user/ui_cache")
-        search_config_path = os.path.join(UI_DIRECTORY, "configs/search_config.yaml")
-        search_dir = os.path.join(UI_DIRECTORY, "configs/search_dir")
-
-        def run_async_query_search():
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                return loop.run_until_complete(query_search(query, search_config_path, search_dir, pl))
-            finally:
-                loop.close()
-
-        with ThreadPoolExecutor(max_workers=1) as executor:
-            future = executor.submit(run_async_query_search)
-            top1_issue, sub_questionss_result = future.result()
+        top1_issue, sub_questionss_result = await run_query_search(pl, query)
         if sub_questionss_result:
             query = query + sub_questionss_result
-    retri_res = pl.retriever.run(query=query)
-    contexts[CompType.RETRIEVER] = retri_res
-    query_bundle = QueryBundle(query)
-
-    if pl.postprocessor:
-        for processor in pl.postprocessor:
-            if (
-                isinstance(processor, RerankProcessor)
-                and chat_request.top_n != ChatCompletionRequest.model_fields["top_n"].default
-            ):
-                processor.top_n = chat_request.top_n
-            retri_res = processor.run(retri_res=retri_res, query_bundle=query_bundle)
-            contexts[CompType.POSTPROCESSOR] = retri_res
+    retri_res, contexts = await run_retrieval(pl, chat_request, query, stage_mgr)
 
     if pl.generator is None:
         raise ValueError("No Generator Specified")
-    np_type = pl.node_parser.comp_subtype
-    if pl.generator.inference_type == InferenceType.LOCAL:
-        ret = pl.generator.run(chat_request, retri_res, np_type)
-    elif pl.generator.inference_type == InferenceType.VLLM:
-        ret = pl.generator.run_vllm(chat_request, retri_res, np_type, sub_questions=sub_questionss_result)
-    else:
-        raise ValueError("LLM inference_type not supported")
+    ret = await run_stage(
+        stage_mgr,
+        CompType.GENERATOR,
+        run_generate,
+        pl,
+        chat_request,
+        retri_res,
+        sub_questions=sub_questionss_result,
+        session=session,
+    )
     return ret, contexts
@@ -20,7 +20,6 @@ class RerankProcessor(BaseComponent):
         self.top_n = top_n
 
     def run(self, **kwargs) -> Any:
-        self.model.top_n = self.top_n
         query_bundle = None
         query_str = None
         if "retri_res" in kwargs:
@@ -29,7 +28,13 @@ class RerankProcessor(BaseComponent):
             query_bundle = kwargs["query_bundle"]
         if "query_str" in kwargs:
             query_str = kwargs["query_str"]
-        return self.model.postprocess_nodes(nodes, query_bundle=query_bundle, query_str=query_str)
+        if query_bundle is not None:
+            query_str = query_bundle.query_str
+        if query_str is None:
+            raise ValueError("Missing query bundle in extra info.")
+        # A per request top_n is passed in instead of set on the processor, which concurrent requests share
+        top_n = kwargs.get("top_n") or self.top_n
+        return self.model.rerank(nodes, query_str, top_n)
 
     @model_serializer
     def ser_model(self):
@@ -2,14 +2,23 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import asyncio
+import copy
 import json
 import os
 from abc import ABC
+from collections import OrderedDict
 
 import aiohttp
 import numpy
+from edgecraftrag.components.bm25 import BM25Index
+from llama_index.core.schema import TextNode
 from omegaconf import OmegaConf
 
+# Maximum number of in-flight issue scoring requests to vLLM
+QUERY_SEARCH_CONCURRENCY = 200
+# Number of shortlisted issues scored by the LLM, 0 scores every issue
+DEFAULT_SHORTLIST_TOP_M = 50
+
 
 class _BaseEstimator(ABC):
     """Base class for LLM-based estimators.
@@ -87,6 +96,7 @@ class LogitsEstimatorJSON(LogitsEstimator):
         json_levels=["Low", "High"],
         temperature=1.0,
         API_BASE=None,
+        batch_size=32,
         **kwargs,
     ):
         """Initialize the LLM-based relevance estimator."""
@@ -106,26 +116,30 @@ class LogitsEstimatorJSON(LogitsEstimator):
         self.json_key = json_key
         self.json_levels = json_levels
         self.API_BASE = API_BASE
+        # Number of prompts sent in one completions request
+        self.batch_size = max(1, int(batch_size))
 
     async def invoke_vllm(self, input_texts):
+        """Score a list of prompts with a single completions request, vLLM accepts a prompt array.
+
+        Returns one (text, top logprobs of the first token) pair per prompt.
+        """
         headers = {"Content-Type": "application/json"}
         payload = {
-            "prompt": input_texts[0],
+            "prompt": input_texts if len(input_texts) > 1 else input_texts[0],
             "max_tokens": 1,
             "logprobs": 15,
         }
 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(self.API_BASE, headers=headers, json=payload) as response:
-                response.raise_for_status()
-                results = await response.json()
-
-        output_texts = results["choices"][0]["text"]
-        output_logits = results["choices"][0]["logprobs"]["top_logprobs"][0]
+        session = get_http_session()
+        async with session.post(self.API_BASE, headers=headers, json=payload) as response:
+            response.raise_for_status()
+            results = await response.json()
 
-        return output_texts, output_logits
+        choices = sorted(results["choices"], key=lambda choice: choice.get("index", 0))
+        return [(choice["text"], choice["logprobs"]["top_logprobs"][0]) for choice in choices]
 
-    async def _calculate_logits_score(self, user_input, issue):
+    def build_prompt(self, user_input, issue):
         query_and_chunk = self.input_template.format(user_input, issue)
         output_instructions = self.output_template.format(
             json_key=f'"{self.json_key}"',
@@ -145,8 +159,11 @@ class LogitsEstimatorJSON(LogitsEstimator):
             elif msg["role"] == "assistant":
                 input_text += "assistant\n" + msg["content"] + "\n"
         input_text += "assistant\n<think>\n</think>\nanswer:\n"
-        outputs = await self.invoke_vllm([input_text])
-        score = self._calculate_token_score_vllm(outputs)
+        return input_text
+
+    async def _calculate_logits_score(self, user_input, issue):
+        outputs = await self.invoke_vllm([self.build_prompt(user_input, issue)])
+        score = self._calculate_token_score_vllm(outputs[0])
 
         return score
 
@@ -171,10 +188,62 @@ class LogitsEstimatorJSON(LogitsEstimator):
     async def compute_score(self, input_pair):
         return await self._calculate_logits_score(*input_pair)
 
+    async def compute_scores(self, user_input, issues, max_concurrency=None):
+        """Score the user input against every issue, batch_size prompts per request."""
+        prompts = [self.build_prompt(user_input, issue) for issue in issues]
+        batches = [prompts[i : i + self.batch_size] for i in range(0, len(prompts), self.batch_size)]
+        semaphore = asyncio.Semaphore(max_concurrency or QUERY_SEARCH_CONCURRENCY)
+
+        async def score_batch(batch):
+            async with semaphore:
+                outputs = await self.invoke_vllm(batch)
+            return [self._calculate_token_score_vllm(output) for output in outputs]
+
+        results = await asyncio.gather(*[score_batch(batch) for batch in batches])
+        return [score for batch_scores in results for score in batch_scores]
+
+
+class IssueShortlist:
+    """Cheap candidate selection ahead of the LLM judge.
+
+    Issues are ranked by cosine similarity with the query when an embedding
+    model is available, otherwise by BM25, and only the top M are scored.
+    """
+
+    def __init__(self, issues, embed_model=None):
+        self.issues = issues
+        self._embed_model = embed_model
+        self._embeddings = None
+        self._bm25 = None
+
+    def _embed_issues(self):
+        if self._embeddings is None:
+            embeddings = numpy.asarray(self._embed_model.get_text_embedding_batch(self.issues), dtype=numpy.float32)
+            norms = numpy.linalg.norm(embeddings, axis=1, keepdims=True)
+            self._embeddings = embeddings / numpy.maximum(norms, 1e-12)
+        return self._embeddings
+
+    def _bm25_index(self):
+        if self._bm25 is None:
+            bm25 = BM25Index(persist_dir=None)
+            bm25.add_nodes([TextNode(id_=str(i), text=issue) for i, issue in enumerate(self.issues)])
+            self._bm25 = bm25
+        return self._bm25
+
+    def top(self, query, top_m):
+        if self._embed_model is not None:
+            embeddings = self._embed_issues()
+            query_embedding = numpy.asarray(self._embed_model.get_query_embedding(query), dtype=numpy.float32)
+            scores = embeddings @ (query_embedding / max(numpy.linalg.norm(query_embedding), 1e-12))
+            top_idx = numpy.argsort(-scores)[:top_m]
+        else:
+            top_idx = [int(node_id) for node_id, _ in self._bm25_index().search(query, top_m)]
+        return [self.issues[i] for i in top_idx]
+
 
 def read_json_files(directory: str) -> dict:
     result = {}
-    for filename in os.listdir(directory):
+    for filename in sorted(os.listdir(directory)):
         if filename.endswith(".json"):
             file_path = os.path.join(directory, filename)
             if os.path.isfile(file_path):
@@ -187,6 +256,86 @@ def read_json_files(directory: str) -> dict:
     return result
 
 
+def _files_signature(paths) -> tuple:
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            signature.append((path, stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            signature.append((path, None, None))
+    return tuple(signature)
+
+
+# path -> (files signature, loaded content), reloaded only when a file changes
+_search_data_cache = {}
+_search_config_cache = {}
+
+
+def load_search_data(directory: str) -> dict:
+    json_files = [os.path.join(directory, f) for f in sorted(os.listdir(directory)) if f.endswith(".json")]
+    signature = _files_signature([directory] + json_files)
+    cached = _search_data_cache.get(directory)
+    if cached is None or cached[0] != signature:
+        cached = (signature, read_json_files(directory))
+        _search_data_cache[directory] = cached
+    return cached[1]
+
+
+# Shortlists of the last issue sets and embedding models, least recently used first
+SHORTLIST_CACHE_SIZE = 4
+_shortlist_cache: "OrderedDict[tuple, IssueShortlist]" = OrderedDict()
+
+
+def get_issue_shortlist(issues, embed_model=None) -> IssueShortlist:
+    # The issue embeddings are computed once per issue set and embedding model
+    model_id = None
+    if embed_model is not None:
+        model_id = getattr(embed_model, "model_id", None) or embed_model.model_name
+    key = (model_id, tuple(issues))
+    shortlist = _shortlist_cache.get(key)
+    if shortlist is None:
+        shortlist = IssueShortlist(issues, embed_model)
+        _shortlist_cache[key] = shortlist
+        while len(_shortlist_cache) > SHORTLIST_CACHE_SIZE:
+            _shortlist_cache.popitem(last=False)
+    else:
+        _shortlist_cache.move_to_end(key)
+    return shortlist
+
+
+def load_search_config(config_path: str):
+    signature = _files_signature([config_path])
+    cached = _search_config_cache.get(config_path)
+    if cached is None or cached[0] != signature:
+        cached = (signature, OmegaConf.load(config_path))
+        _search_config_cache[config_path] = cached
+    # Callers fill in the model and endpoint, keep the cached config untouched
+    return copy.deepcopy(cached[1])
+
+
+# Keep-alive HTTP session shared by all query search requests of the event loop
+_http_session = None
+_http_session_loop = None
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    global _http_session, _http_session_loop
+    loop = asyncio.get_running_loop()
+    if _http_session is None or _http_session.closed or _http_session_loop is not loop:
+        connector = aiohttp.TCPConnector(limit=QUERY_SEARCH_CONCURRENCY, keepalive_timeout=60)
+        _http_session = aiohttp.ClientSession(connector=connector)
+        _http_session_loop = loop
+    return _http_session
+
+
+async def close_http_session():
+    global _http_session
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
+
+
 async def query_search(user_input, search_config_path, search_dir, pl):
 
     top1_issue = None
@@ -197,23 +346,24 @@ async def query_search(user_input, search_config_path, search_dir, pl):
     model_id = pl.generator.model_id
     vllm_endpoint = pl.generator.vllm_endpoint
 
-    cfg = OmegaConf.load(search_config_path)
+    cfg = load_search_config(search_config_path)
     cfg.query_matcher.model_id = model_id
     cfg.query_matcher.API_BASE = os.path.join(vllm_endpoint, "v1/completions")
+    shortlist_top_m = int(cfg.query_matcher.pop("shortlist_top_m", DEFAULT_SHORTLIST_TOP_M) or 0)
     query_matcher = LogitsEstimatorJSON(**cfg.query_matcher)
-    maintenance_data = read_json_files(search_dir)
+    maintenance_data = load_search_data(search_dir)
     issues = list(maintenance_data.keys())
     if not issues:
         return top1_issue, sub_questionss_result
 
-    semaphore = asyncio.Semaphore(200)
-
-    async def limited_compute_score(query_matcher, user_input, issue):
-        async with semaphore:
-            return await query_matcher.compute_score((user_input, issue))
+    # Only the top M candidates of the shortlist go to the LLM judge
+    if shortlist_top_m > 0 and len(issues) > shortlist_top_m:
+        embed_model = getattr(pl.indexer, "_embed_model", None) if pl.indexer is not None else None
+        shortlist = get_issue_shortlist(issues, embed_model)
+        # BM25 finds nothing when no query word occurs in the issues, all of them are scored then
+        issues = await asyncio.to_thread(shortlist.top, user_input, shortlist_top_m) or issues
 
-    tasks = [limited_compute_score(query_matcher, user_input, issue) for issue in issues]
-    scores = await asyncio.gather(*tasks)
+    scores = await query_matcher.compute_scores(user_input, issues)
     match_scores = list(zip(issues, scores))
     match_scores.sort(key=lambda x: x[1], reverse=True)
 
@@ -1,15 +1,22 @@
 # Copyright (C) 2024 Intel Corporation
 # SPDX-License-Identifier: Apache-2.0
 
-from typing import Any, List, cast
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
 
-from edgecraftrag.base import BaseComponent, CompType, RetrieverType
+from edgecraftrag.base import BaseComponent, CompType, FusionMode, RetrieverType
 from llama_index.core.indices.vector_store.retrievers import VectorIndexRetriever
 from llama_index.core.retrievers import AutoMergingRetriever
-from llama_index.core.schema import BaseNode
-from llama_index.retrievers.bm25 import BM25Retriever
+from llama_index.core.schema import BaseNode, NodeWithScore, QueryBundle
 from pydantic import model_serializer
 
+# Docstore nodes cached by an auto merging retriever
+_NODE_CACHE_SIZE = 4096
+
 
 class VectorSimRetriever(BaseComponent, VectorIndexRetriever):
 
@@ -55,7 +62,7 @@ class VectorSimRetriever(BaseComponent, VectorIndexRetriever):
 
 class AutoMergeRetriever(BaseComponent, AutoMergingRetriever):
 
-    def __init__(self, indexer, **kwargs):
+    def __init__(self, indexer, simple_ratio_thresh: float = 0.5, **kwargs):
         BaseComponent.__init__(
             self,
             comp_type=CompType.RETRIEVER,
@@ -63,20 +70,94 @@ class AutoMergeRetriever(BaseComponent, AutoMergingRetriever):
         )
         self._index = indexer
         self.topk = kwargs["similarity_top_k"]
+        self.simple_ratio_thresh = simple_ratio_thresh
+        # Parent and next nodes read from the docstore, valid for one version of the indexer
+        self._node_cache: Dict[str, BaseNode] = {}
+        self._node_cache_version = None
+        self._node_cache_lock = threading.Lock()
 
+        # Built once, the pipeline creates a new retriever when the indexer is reinitialized
         AutoMergingRetriever.__init__(
             self,
-            vector_retriever=indexer.as_retriever(**kwargs),
+            vector_retriever=self._build_vector_retriever(),
             storage_context=indexer._storage_context,
+            simple_ratio_thresh=simple_ratio_thresh,
             object_map=indexer._object_map,
             callback_manager=indexer._callback_manager,
         )
 
+    def _build_vector_retriever(self):
+        vector_retriever = self._index.as_retriever(similarity_top_k=self.topk)
+        # Same as VectorSimRetriever, the retriever must not be limited to the
+        # node ids that exist at its creation
+        vector_retriever._node_ids = None
+        return vector_retriever
+
+    def _get_nodes(self, node_ids: List[str]) -> Dict[str, BaseNode]:
+        # Nodes missing from the cache are read in one batch, ids no longer indexed are left out
+        node_ids = list(dict.fromkeys(node_ids))
+        with self._node_cache_lock:
+            if self._node_cache_version != self._index.version or len(self._node_cache) > _NODE_CACHE_SIZE:
+                self._node_cache = {}
+                self._node_cache_version = self._index.version
+            nodes = {node_id: self._node_cache[node_id] for node_id in node_ids if node_id in self._node_cache}
+        missing = [node_id for node_id in node_ids if node_id not in nodes]
+        if missing:
+            fetched = self._index.get_nodes_by_id(missing)
+            with self._node_cache_lock:
+                self._node_cache.update(fetched)
+            nodes.update(fetched)
+        return nodes
+
+    def _get_parents_and_merge(self, nodes: List[NodeWithScore]) -> Tuple[List[NodeWithScore], bool]:
+        parent_cur_children: Dict[str, List[NodeWithScore]] = defaultdict(list)
+        for node in nodes:
+            if node.node.parent_node is not None:
+                parent_cur_children[node.node.parent_node.node_id].append(node)
+        parent_nodes = self._get_nodes(list(parent_cur_children))
+
+        # Children are replaced by their parent once enough of them are retrieved
+        node_ids_to_delete = set()
+        nodes_to_add: Dict[str, NodeWithScore] = {}
+        for parent_node_id, parent_node in parent_nodes.items():
+            children = parent_cur_children[parent_node_id]
+            parent_num_children = len(parent_node.child_nodes) if parent_node.child_nodes else 1
+            if len(children) / parent_num_children > self._simple_ratio_thresh:
+                node_ids_to_delete.update(n.node.node_id for n in children)
+                avg_score = sum(n.get_score() or 0.0 for n in children) / len(children)
+                nodes_to_add[parent_node_id] = NodeWithScore(node=parent_node, score=avg_score)
+
+        new_nodes = [n for n in nodes if n.node.node_id not in node_ids_to_delete]
+        new_nodes.extend(nodes_to_add.values())
+        return new_nodes, len(node_ids_to_delete) > 0
+
+    def _fill_in_nodes(self, nodes: List[NodeWithScore]) -> Tuple[List[NodeWithScore], bool]:
+        # The node between two retrieved neighbours is added as well
+        gaps = {}
+        for idx in range(len(nodes) - 1):
+            cur_node = nodes[idx].node
+            if cur_node.next_node is not None and cur_node.next_node == nodes[idx + 1].node.prev_node:
+                gaps[idx] = cur_node.next_node.node_id
+        if not gaps:
+            return nodes, False
+        next_nodes = self._get_nodes(list(gaps.values()))
+
+        new_nodes = []
+        for idx, node in enumerate(nodes):
+            new_nodes.append(node)
+            next_node = next_nodes.get(gaps.get(idx))
+            if next_node is not None:
+                avg_score = (node.get_score() + nodes[idx + 1].get_score()) / 2
+                new_nodes.append(NodeWithScore(node=next_node, score=avg_score))
+        return new_nodes, len(new_nodes) > len(nodes)
+
     def run(self, **kwargs) -> Any:
         for k, v in kwargs.items():
             if k == "query":
-                # vector_retriever needs to be updated
-                self._vector_retriever = self._index.as_retriever(similarity_top_k=self.topk)
+                if self._storage_context is not self._index._storage_context:
+                    # The knowledge base of the indexer was swapped without updating the retriever
+                    self._vector_retriever = self._build_vector_retriever()
+                    self._storage_context = self._index._storage_context
                 return self.retrieve(v)
 
         return None
@@ -87,14 +168,15 @@ class AutoMergeRetriever(BaseComponent, AutoMergingRetriever):
             "idx": self.idx,
             "retriever_type": self.comp_subtype,
             "retrieve_topk": self.topk,
+            "simple_ratio_thresh": self.simple_ratio_thresh,
         }
         return set
 
 
 class SimpleBM25Retriever(BaseComponent):
-    # The nodes parameter in BM25Retriever is not from index,
-    # nodes in BM25Retriever can not be updated through 'indexer.insert_nodes()',
-    # which means nodes should be passed to BM25Retriever after data preparation stage, not init stage
+    # Scores queries against the indexer's incremental BM25 index, which is
+    # updated through 'indexer.insert_nodes()'/'indexer.delete_nodes()',
+    # so nothing is rebuilt or re-tokenized on the query path
 
     def __init__(self, indexer, **kwargs):
         BaseComponent.__init__(
@@ -102,16 +184,128 @@ class SimpleBM25Retriever(BaseComponent):
             comp_type=CompType.RETRIEVER,
             comp_subtype=RetrieverType.BM25,
         )
-        self._docstore = indexer._docstore
+        self._index = indexer
         self.topk = kwargs["similarity_top_k"]
 
+    def retrieve(self, query) -> List[NodeWithScore]:
+        query_str = query.query_str if isinstance(query, QueryBundle) else query
+        hits = self._index.bm25_index.search(query_str, self.topk)
+        if not hits:
+            return []
+        nodes = self._index.get_nodes_by_id([node_id for node_id, _ in hits])
+        return [NodeWithScore(node=nodes[node_id], score=score) for node_id, score in hits if node_id in nodes]
+
+    def run(self, **kwargs) -> Any:
+        for k, v in kwargs.items():
+            if k == "query":
+                return self.retrieve(v)
+
+        return None
+
+    @model_serializer
+    def ser_model(self):
+        set = {
+            "idx": self.idx,
+            "retriever_type": self.comp_subtype,
+            "retrieve_topk": self.topk,
+        }
+        return set
+
+
+# Threads running the vector branch of hybrid retrievers, the BM25 branch runs in the calling thread
+HYBRID_RETRIEVER_WORKERS = int(os.getenv("HYBRID_RETRIEVER_WORKERS", str(min(8, os.cpu_count() or 1))))
+_hybrid_executor = None
+
+
+def get_hybrid_executor() -> ThreadPoolExecutor:
+    global _hybrid_executor
+    if _hybrid_executor is None:
+        _hybrid_executor = ThreadPoolExecutor(
+            max_workers=max(1, HYBRID_RETRIEVER_WORKERS), thread_name_prefix="ecrag-hybrid"
+        )
+    return _hybrid_executor
+
+
+def _timed_retrieve(retriever, query):
+    start = time.perf_counter()
+    return retriever.retrieve(query), time.perf_counter() - start
+
+
+def fuse_results(
+    branches: List[List[NodeWithScore]],
+    weights: List[float],
+    fusion_mode: str = FusionMode.RRF,
+    rrf_k: int = 60,
+) -> List[NodeWithScore]:
+    # Results of the branches, deduplicated by node id and sorted by fused score
+    fused: Dict[str, NodeWithScore] = {}
+    scores: Dict[str, float] = {}
+    for results, weight in zip(branches, weights):
+        if fusion_mode == FusionMode.WEIGHTED:
+            # Min-max normalized, BM25 and similarity scores are not on the same scale
+            raw = [node.score or 0.0 for node in results]
+            low, high = (min(raw), max(raw)) if raw else (0.0, 0.0)
+            branch_scores = [(score - low) / (high - low) if high > low else 1.0 for score in raw]
+        else:
+            branch_scores = [1.0 / (rrf_k + rank) for rank in range(1, len(results) + 1)]
+        for node, score in zip(results, branch_scores):
+            node_id = node.node.node_id
+            fused.setdefault(node_id, node)
+            scores[node_id] = scores.get(node_id, 0.0) + weight * score
+    ordered = sorted(scores, key=scores.get, reverse=True)
+    return [NodeWithScore(node=fused[node_id].node, score=scores[node_id]) for node_id in ordered]
+
+
+class HybridRetriever(BaseComponent):
+    # Runs the vector and the BM25 retriever concurrently and fuses their results
+    # with reciprocal rank fusion or weighted normalized scores
+
+    def __init__(
+        self,
+        indexer,
+        similarity_top_k: int,
+        vector_topk: Optional[int] = None,
+        bm25_topk: Optional[int] = None,
+        fusion_mode: str = FusionMode.RRF,
+        vector_weight: float = 1.0,
+        bm25_weight: float = 1.0,
+        rrf_k: int = 60,
+    ):
+        BaseComponent.__init__(
+            self,
+            comp_type=CompType.RETRIEVER,
+            comp_subtype=RetrieverType.HYBRID,
+        )
+        if fusion_mode not in (FusionMode.RRF, FusionMode.WEIGHTED):
+            raise ValueError(f"Unsupported fusion mode: {fusion_mode}")
+        self._index = indexer
+        self.topk = similarity_top_k
+        self.vector_topk = vector_topk or similarity_top_k
+        self.bm25_topk = bm25_topk or similarity_top_k
+        self.fusion_mode = FusionMode(fusion_mode)
+        self.vector_weight = vector_weight
+        self.bm25_weight = bm25_weight
+        self.rrf_k = rrf_k
+        self._vector_retriever = VectorSimRetriever(indexer, similarity_top_k=self.vector_topk)
+        self._bm25_retriever = SimpleBM25Retriever(indexer, similarity_top_k=self.bm25_topk)
+
+    def retrieve(self, query, latency: Optional[Dict[str, float]] = None) -> List[NodeWithScore]:
+        # The vector branch embeds the query and searches with the GIL released, BM25 scores meanwhile
+        vector_future = get_hybrid_executor().submit(_timed_retrieve, self._vector_retriever, query)
+        bm25_results, bm25_latency = _timed_retrieve(self._bm25_retriever, query)
+        vector_results, vector_latency = vector_future.result()
+        if latency is not None:
+            latency["vector"] = vector_latency
+            latency["bm25"] = bm25_latency
+        fused = fuse_results(
+            [vector_results, bm25_results], [self.vector_weight, self.bm25_weight], self.fusion_mode, self.rrf_k
+        )
+        return fused[: self.topk]
+
     def run(self, **kwargs) -> Any:
         for k, v in kwargs.items():
             if k == "query":
-                nodes = cast(List[BaseNode], list(self._docstore.docs.values()))
-                similarity_top_k = min(len(nodes), self.topk)
-                bm25_retr = BM25Retriever.from_defaults(nodes=nodes, similarity_top_k=similarity_top_k)
-                return bm25_retr.retrieve(v)
+                return self.retrieve(v, kwargs.get("latency"))
 
         return None
 
@@ -121,5 +315,11 @@ class SimpleBM25Retriever(BaseComponent):
             "idx": self.idx,
             "retriever_type": self.comp_subtype,
             "retrieve_topk": self.topk,
+            "vector_topk": self.vector_topk,
+            "bm25_topk": self.bm25_topk,
+            "fusion_mode": self.fusion_mode,
+            "vector_weight": self.vector_weight,
+            "bm25_weight": self.bm25_weight,
+            "rrf_k": self.rrf_k,
         }
         return set
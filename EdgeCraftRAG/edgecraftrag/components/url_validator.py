@@ -0,0 +1,123 @@
+# Copyright (C) 2025 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import aiohttp
+
+# Seconds an answer waits for the links it references to be checked
+URL_CHECK_TIMEOUT = float(os.getenv("URL_CHECK_TIMEOUT", "2"))
+# Seconds a checked link is trusted before it is checked again
+URL_CHECK_TTL = float(os.getenv("URL_CHECK_TTL", "3600"))
+# Links checked at the same time
+URL_CHECK_CONCURRENCY = int(os.getenv("URL_CHECK_CONCURRENCY", "16"))
+
+
+def find_urls(text: str) -> List[str]:
+    urls = []
+    for word in text.split():
+        parsed_url = urlparse(word)
+        if parsed_url.scheme in ("http", "https") and parsed_url.netloc:
+            urls.append(parsed_url.geturl())
+    return urls
+
+
+class URLValidator:
+    """Checks whether links respond, caching the result per link.
+
+    Checks run concurrently on an event loop of their own thread, so callers
+    in any thread only submit links and wait for at most timeout seconds.
+    Links checked within ttl seconds are answered from the cache without
+    any request, links still unchecked after the timeout are left out and
+    their check completes in the background for the next answer.
+    """
+
+    def __init__(self, timeout: float = URL_CHECK_TIMEOUT, ttl: float = URL_CHECK_TTL):
+        self.timeout = timeout
+        self.ttl = ttl
+        # url -> (alive, checked at)
+        self._cache: Dict[str, Tuple[bool, float]] = {}
+        # url -> running check
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._lock = threading.Lock()
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="url-validator", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def _cached(self, url: str) -> Optional[bool]:
+        cached = self._cache.get(url)
+        if cached is None or time.monotonic() - cached[1] > self.ttl:
+            return None
+        return cached[0]
+
+    async def _fetch(self, url: str) -> bool:
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.timeout * 5),
+                connector=aiohttp.TCPConnector(limit=max(1, URL_CHECK_CONCURRENCY)),
+            )
+            self._semaphore = asyncio.Semaphore(max(1, URL_CHECK_CONCURRENCY))
+        async with self._semaphore:
+            try:
+                async with self._session.get(url, allow_redirects=True) as response:
+                    return response.status == 200
+            except Exception:
+                return False
+
+    async def _check(self, url: str) -> bool:
+        try:
+            alive = await self._fetch(url)
+            self._cache[url] = (alive, time.monotonic())
+            return alive
+        finally:
+            self._pending.pop(url, None)
+
+    async def _check_all(self, urls: List[str]):
+        checks = []
+        for url in urls:
+            # Concurrent answers referencing the same link share its check
+            check = self._pending.get(url)
+            if check is None:
+                check = self._pending[url] = asyncio.ensure_future(self._check(url))
+            checks.append(check)
+        await asyncio.gather(*checks)
+
+    def prefetch(self, urls: Iterable[str]):
+        unchecked = [url for url in dict.fromkeys(urls) if self._cached(url) is None]
+        if unchecked:
+            asyncio.run_coroutine_threadsafe(self._check_all(unchecked), self._get_loop())
+
+    def filter(self, urls: Iterable[str]) -> List[str]:
+        urls = list(dict.fromkeys(urls))
+        unchecked = [url for url in urls if self._cached(url) is None]
+        if unchecked:
+            check = asyncio.run_coroutine_threadsafe(self._check_all(unchecked), self._get_loop())
+            try:
+                check.result(timeout=self.timeout)
+            except FutureTimeoutError:
+                pass
+        return [url for url in urls if self._cached(url)]
+
+
+_url_validator = None
+
+
+def get_url_validator() -> URLValidator:
+    global _url_validator
+    if _url_validator is None:
+        _url_validator = URLValidator()
+    return _url_validator
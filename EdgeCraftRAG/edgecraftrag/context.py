@@ -3,16 +3,23 @@
 
 from edgecraftrag.controllers.compmgr import GeneratorMgr, IndexerMgr, NodeParserMgr, PostProcessorMgr, RetrieverMgr
 from edgecraftrag.controllers.filemgr import FilelMgr
+from edgecraftrag.controllers.ingestmgr import IngestMgr
 from edgecraftrag.controllers.knowledge_basemgr import KnowledgeManager
 from edgecraftrag.controllers.modelmgr import ModelMgr
 from edgecraftrag.controllers.nodemgr import NodeMgr
 from edgecraftrag.controllers.pipelinemgr import PipelineMgr
+from edgecraftrag.controllers.residentmgr import ResidentIndexMgr
+from edgecraftrag.controllers.sessionmgr import SessionMgr
+from edgecraftrag.controllers.snapshotmgr import SnapshotMgr
+from edgecraftrag.controllers.stagemgr import StageMgr
+from edgecraftrag.controllers.systemsampler import SystemSampler
 
 
 class Context:
 
     def __init__(self):
-        self.plmgr = PipelineMgr()
+        self.stagemgr = StageMgr()
+        self.plmgr = PipelineMgr(self.stagemgr)
         self.nodemgr = NodeMgr()
         self.npmgr = NodeParserMgr()
         self.idxmgr = IndexerMgr()
@@ -22,6 +29,11 @@ class Context:
         self.genmgr = GeneratorMgr()
         self.filemgr = FilelMgr()
         self.knowledgemgr = KnowledgeManager()
+        self.ingestmgr = IngestMgr()
+        self.snapshotmgr = SnapshotMgr(self.plmgr, self.filemgr, self.nodemgr, self.ingestmgr)
+        self.residentmgr = ResidentIndexMgr(self.nodemgr, self.snapshotmgr, self.ingestmgr)
+        self.sessionmgr = SessionMgr()
+        self.systemsampler = SystemSampler()
 
     def get_pipeline_mgr(self):
         return self.plmgr
@@ -53,5 +65,23 @@ class Context:
     def get_knowledge_mgr(self):
         return self.knowledgemgr
 
+    def get_ingest_mgr(self):
+        return self.ingestmgr
+
+    def get_snapshot_mgr(self):
+        return self.snapshotmgr
+
+    def get_resident_index_mgr(self):
+        return self.residentmgr
+
+    def get_stage_mgr(self):
+        return self.stagemgr
+
+    def get_session_mgr(self):
+        return self.sessionmgr
+
+    def get_system_sampler(self):
+        return self.systemsampler
+
 
 ctx = Context()
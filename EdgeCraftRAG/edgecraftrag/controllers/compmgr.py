@@ -3,6 +3,7 @@
 
 from edgecraftrag.api_schema import IndexerIn, ModelIn, NodeParserIn
 from edgecraftrag.base import BaseComponent, BaseMgr, CallbackType, ModelType, NodeParserType
+from edgecraftrag.components.faiss_index import FAISS_INDEX_PARAMS
 
 
 class NodeParserMgr(BaseMgr):
@@ -43,6 +44,8 @@ class IndexerMgr(BaseMgr):
                         (v.model.model_id_or_path == indin.embedding_model.model_id)
                         or (v.model.model_id_or_path == indin.embedding_model.model_path)
                     )
+                    and getattr(v, "index_params", {})
+                    == indin.model_dump(include=set(FAISS_INDEX_PARAMS), exclude_none=True)
                 ):
                     return v
         return None
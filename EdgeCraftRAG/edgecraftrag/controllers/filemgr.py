@@ -20,38 +20,55 @@ class FilelMgr(BaseMgr):
         self.add(file)
         return file.documents
 
-    def add_files(self, docs: Any):
+    # Expand the given files and directories into a list of file paths
+    @staticmethod
+    def list_files(docs: Any) -> List[str]:
         if not isinstance(docs, list):
             docs = [docs]
 
-        input_docs = []
+        file_paths = []
         for doc in docs:
             if not os.path.exists(doc):
                 continue
 
             if os.path.isfile(doc):
-                files = [doc]
+                file_paths.append(doc)
             elif os.path.isdir(doc):
-                files = [os.path.join(root, f) for root, _, files in os.walk(doc) for f in files]
-            else:
-                continue
+                file_paths.extend(os.path.join(root, f) for root, _, files in os.walk(doc) for f in files)
+        return file_paths
 
-            if not files:
-                continue
-
-            for file_path in files:
-                file = File(file_path=file_path)
-                self.add(file)
-                input_docs.extend(file.documents)
+    def add_files(self, docs: Any):
+        input_docs = []
+        for file_path in self.list_files(docs):
+            file = File(file_path=file_path)
+            self.add(file)
+            input_docs.extend(file.documents)
 
         return input_docs
 
+    def add_loaded_file(self, file_path: str, documents: List[Document]):
+        file = File(file_path=file_path, documents=documents)
+        self.add(file)
+        return file
+
     def get_file_by_name_or_id(self, name: str):
         for _, file in self.components.items():
             if file.name == name or file.idx == name:
                 return file
         return None
 
+    # Files registered under a file path or below a directory path
+    def get_files_by_path(self, path: str):
+        path = os.path.normpath(path)
+        files = []
+        for _, file in self.components.items():
+            if not file.file_path:
+                continue
+            file_path = os.path.normpath(str(file.file_path))
+            if file_path == path or file_path.startswith(path + os.sep):
+                files.append(file)
+        return files
+
     def get_files(self):
         return [file for _, file in self.components.items()]
 
@@ -0,0 +1,245 @@
+# Copyright (C) 2025 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from edgecraftrag.base import BaseComponent, NodeParserType
+from edgecraftrag.components.data import convert_file_to_documents
+from llama_index.core.schema import BaseNode, Document
+from pydantic import BaseModel, model_serializer
+
+# Number of worker processes loading and parsing files, 0 parses in a thread of the server process
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Number of nodes inserted into the indexer at once
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))
+_MAX_JOBS = 20
+
+
+def get_parser_config(node_parser: BaseComponent) -> Optional[Dict[str, Any]]:
+    # Node parsers hold tokenizers and split functions that cannot be pickled,
+    # worker processes rebuild them from their settings instead
+    match node_parser.comp_subtype:
+        case NodeParserType.SIMPLE | NodeParserType.UNSTRUCTURED:
+            return {
+                "parser_type": node_parser.comp_subtype,
+                "chunk_size": node_parser.chunk_size,
+                "chunk_overlap": node_parser.chunk_overlap,
+            }
+        case NodeParserType.HIERARCHY:
+            sub_parser = next(iter(node_parser.node_parser_map.values()), None)
+            return {
+                "parser_type": node_parser.comp_subtype,
+                "chunk_sizes": node_parser.chunk_sizes,
+                "chunk_overlap": getattr(sub_parser, "chunk_overlap", None),
+            }
+        case NodeParserType.SENTENCEWINDOW:
+            return {"parser_type": node_parser.comp_subtype, "window_size": node_parser.window_size}
+    return None
+
+
+def build_node_parser(config: Dict[str, Any]) -> BaseComponent:
+    from edgecraftrag.components.node_parser import (
+        HierarchyNodeParser,
+        SimpleNodeParser,
+        SWindowNodeParser,
+        UnstructedNodeParser,
+    )
+
+    match config["parser_type"]:
+        case NodeParserType.SIMPLE:
+            return SimpleNodeParser(chunk_size=config["chunk_size"], chunk_overlap=config["chunk_overlap"])
+        case NodeParserType.HIERARCHY:
+            kwargs = {"chunk_sizes": config["chunk_sizes"]}
+            if config["chunk_overlap"] is not None:
+                kwargs["chunk_overlap"] = config["chunk_overlap"]
+            return HierarchyNodeParser.from_defaults(**kwargs)
+        case NodeParserType.SENTENCEWINDOW:
+            return SWindowNodeParser.from_defaults(window_size=config["window_size"])
+        case NodeParserType.UNSTRUCTURED:
+            return UnstructedNodeParser(chunk_size=config["chunk_size"], chunk_overlap=config["chunk_overlap"])
+    raise ValueError(f"Unsupported node parser type: {config['parser_type']}")
+
+
+# Node parsers of a worker process, built on first use
+_worker_parsers: Dict[Tuple, BaseComponent] = {}
+
+
+def load_and_parse_file(file_path: str, parser_config: Dict[str, Any]) -> Tuple[List[Document], List[BaseNode]]:
+    # Runs in a worker process
+    key = tuple(sorted((k, str(v)) for k, v in parser_config.items()))
+    node_parser = _worker_parsers.get(key)
+    if node_parser is None:
+        node_parser = build_node_parser(parser_config)
+        _worker_parsers[key] = node_parser
+    return parse_file(file_path, node_parser)
+
+
+def parse_file(file_path: str, node_parser: BaseComponent) -> Tuple[List[Document], List[BaseNode]]:
+    docs = convert_file_to_documents(Path(file_path))
+    nodes = node_parser.run(docs=docs) if docs else []
+    return docs, nodes or []
+
+
+def prefetch_ref_links(nodes: List[BaseNode]):
+    # Runs in the main process, the links shown with answers are checked before they are retrieved
+    from edgecraftrag.components.node_parser import REF_LINKS_KEY
+    from edgecraftrag.components.url_validator import get_url_validator
+
+    links = []
+    for node in nodes:
+        if REF_LINKS_KEY in node.metadata:
+            try:
+                links.extend(json.loads(node.metadata[REF_LINKS_KEY]))
+            except json.JSONDecodeError:
+                continue
+    if links:
+        get_url_validator().prefetch(links)
+
+
+class IngestJob(BaseModel):
+    job_id: str
+    status: str = "running"
+    total_files: int = 0
+    parsed_files: int = 0
+    failed_files: int = 0
+    total_nodes: int = 0
+    indexed_nodes: int = 0
+    start_time: float = 0.0
+    end_time: Optional[float] = None
+    errors: List[str] = []
+
+    @model_serializer
+    def ser_model(self):
+        elapsed = (self.end_time or time.time()) - self.start_time
+        set = {
+            "job_id": self.job_id,
+            "status": self.status,
+            "total_files": self.total_files,
+            "parsed_files": self.parsed_files,
+            "failed_files": self.failed_files,
+            "total_nodes": self.total_nodes,
+            "indexed_nodes": self.indexed_nodes,
+            "elapsed_sec": round(elapsed, 3),
+            "files_per_sec": round(self.parsed_files / elapsed, 3) if elapsed > 0 else 0.0,
+            "nodes_per_sec": round(self.indexed_nodes / elapsed, 3) if elapsed > 0 else 0.0,
+            "errors": self.errors,
+        }
+        return set
+
+
+class IngestMgr:
+    """Loads and parses files in a pool of worker processes.
+
+    Nodes are inserted into the indexer of the pipeline in batches of
+    INGEST_BATCH_SIZE while the remaining files are still being parsed.
+    Indexer writes run in a thread and are serialized across jobs so the
+    event loop stays responsive during large ingestions.
+    """
+
+    def __init__(self, workers: int = INGEST_WORKERS, batch_size: int = INGEST_BATCH_SIZE):
+        self.workers = workers
+        self.batch_size = max(1, batch_size)
+        self._pool = None
+        self._lock = asyncio.Lock()
+        self.jobs: "OrderedDict[str, IngestJob]" = OrderedDict()
+
+    def _get_pool(self):
+        if self._pool is None and self.workers > 0:
+            # spawn avoids forking the OpenVINO and event loop threads of the server
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def _new_job(self, total_files: int) -> IngestJob:
+        job = IngestJob(job_id=str(uuid.uuid4()), total_files=total_files, start_time=time.time())
+        self.jobs[job.job_id] = job
+        while len(self.jobs) > _MAX_JOBS:
+            self.jobs.popitem(last=False)
+        return job
+
+    # Held while nodes are written to an indexer, snapshots take it to see a consistent knowledge base
+    @property
+    def lock(self) -> asyncio.Lock:
+        return self._lock
+
+    def get_jobs(self) -> List[IngestJob]:
+        return list(self.jobs.values())
+
+    def get_job(self, job_id: str) -> Optional[IngestJob]:
+        return self.jobs.get(job_id)
+
+    async def ingest_files(self, pl, file_paths: List[str], file_mgr, node_mgr) -> List[BaseNode]:
+        job = self._new_job(len(file_paths))
+        loop = asyncio.get_running_loop()
+        parser_config = get_parser_config(pl.node_parser)
+        pool = self._get_pool() if parser_config is not None else None
+
+        def submit(file_path):
+            if pool is not None:
+                return loop.run_in_executor(pool, load_and_parse_file, file_path, parser_config)
+            return loop.run_in_executor(None, parse_file, file_path, pl.node_parser)
+
+        async def run(file_path):
+            try:
+                return file_path, await submit(file_path), None
+            except Exception as e:
+                return file_path, None, e
+
+        nodelist = []
+        batch = []
+        async with self._lock:
+            try:
+                for next_result in asyncio.as_completed([run(file_path) for file_path in file_paths]):
+                    file_path, result, error = await next_result
+                    if error is not None:
+                        print(f"Error parsing file {file_path}: {error}")
+                        job.failed_files += 1
+                        job.errors.append(f"{file_path}: {error}")
+                        continue
+                    docs, nodes = result
+                    file_mgr.add_loaded_file(file_path, docs)
+                    job.parsed_files += 1
+                    job.total_nodes += len(nodes)
+                    batch.extend(nodes)
+                    try:
+                        prefetch_ref_links(nodes)
+                    except Exception as e:
+                        print(f"Error checking links of file {file_path}: {e}")
+                    if len(batch) >= self.batch_size:
+                        await self._insert_batch(pl, batch, node_mgr, job)
+                        nodelist.extend(batch)
+                        batch = []
+                if batch:
+                    await self._insert_batch(pl, batch, node_mgr, job)
+                    nodelist.extend(batch)
+                # Once per job, vector stores may still be writing the last batches
+                if pl.indexer is not None:
+                    await asyncio.to_thread(pl.indexer.flush)
+                job.status = "completed"
+            except Exception as e:
+                job.status = "failed"
+                job.errors.append(str(e))
+                if pl.indexer is not None:
+                    try:
+                        await asyncio.to_thread(pl.indexer.flush)
+                    except Exception as flush_error:
+                        print(f"Error flushing indexer: {flush_error}")
+                raise
+            finally:
+                job.end_time = time.time()
+        return nodelist
+
+    async def _insert_batch(self, pl, nodes: List[BaseNode], node_mgr, job: IngestJob):
+        if pl.indexer is not None:
+            # Vector store writes are flushed once at the end of the job
+            await asyncio.to_thread(pl.indexer.insert_nodes, nodes, flush=False)
+        node_mgr.add_nodes(pl.node_parser.idx, nodes)
+        job.indexed_nodes += len(nodes)
@@ -2,22 +2,85 @@
 # SPDX-License-Identifier: Apache-2.0
 
 import asyncio
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
 
 from edgecraftrag.api_schema import ModelIn
 from edgecraftrag.base import BaseComponent, BaseMgr, CompType, ModelType
 from edgecraftrag.components.model import (
+    MODEL_WARMUP,
     BaseModelComponent,
     OpenVINOEmbeddingModel,
     OpenVINOLLMModel,
     OpenVINORerankModel,
+    get_ov_config,
 )
+from pydantic import BaseModel, model_serializer
+
+# Number of models converted and compiled at the same time
+MODEL_LOAD_WORKERS = int(os.getenv("MODEL_LOAD_WORKERS", "1"))
+_MAX_JOBS = 20
+
+
+class LoadJob(BaseModel):
+    job_id: str
+    model_id: Optional[str] = None
+    model_type: Optional[str] = None
+    device: Optional[str] = None
+    weight: Optional[str] = None
+    status: str = "pending"
+    error: Optional[str] = None
+    start_time: float = 0.0
+    load_time: Optional[float] = None
+    end_time: Optional[float] = None
+
+    @model_serializer
+    def ser_model(self):
+        elapsed = (self.end_time or time.time()) - self.start_time
+        set = {
+            "job_id": self.job_id,
+            "model_id": self.model_id,
+            "model_type": self.model_type,
+            "device": self.device,
+            "weight": self.weight,
+            "status": self.status,
+            "error": self.error,
+            "elapsed_sec": round(elapsed, 3),
+            "load_sec": round(self.load_time - self.start_time, 3) if self.load_time else None,
+        }
+        return set
+
+
+def get_load_key(model_para: ModelIn, benchmark: bool = False) -> Tuple:
+    # A benchmark load is of its own, its benchmark hook is attached to the model it loads
+    key = (model_para.model_type, model_para.model_id, model_para.model_path, model_para.device, model_para.weight)
+    return key + ("benchmark",) if benchmark else key
 
 
 class ModelMgr(BaseMgr):
+    """Loaded models, and the jobs loading them in the background.
 
-    def __init__(self):
+    Loads run in a pool of MODEL_LOAD_WORKERS threads so converting and
+    compiling a model does not block the API, their progress is polled
+    through the jobs. Loads of the same model, device and weight requested
+    while one is running share it.
+    """
+
+    def __init__(self, workers: int = MODEL_LOAD_WORKERS):
         self._lock = asyncio.Lock()
         super().__init__()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="ecrag-model-load")
+        self._jobs_lock = threading.Lock()
+        self.jobs: "OrderedDict[str, LoadJob]" = OrderedDict()
+        # load key -> (job, future) of the running loads
+        self._running: Dict[Tuple, Tuple[LoadJob, Future]] = {}
+        # load key -> (tokenizer, bench_hook) of the models loaded for benchmarking
+        self._bench_tools: Dict[Tuple, Tuple[Any, Any]] = {}
 
     def get_model_by_name(self, name: str):
         for _, v in self.components.items():
@@ -70,10 +133,93 @@ class ModelMgr(BaseMgr):
     def del_model_by_name(self, name: str):
         for key, v in self.components.items():
             if v and v.model_id == name:
+                v.release()
                 self.remove(key)
                 return "Model deleted"
         return "Model not found"
 
+    def _new_job(self, model_para: ModelIn) -> LoadJob:
+        job = LoadJob(
+            job_id=str(uuid.uuid4()),
+            model_id=model_para.model_id,
+            model_type=model_para.model_type,
+            device=model_para.device,
+            weight=model_para.weight,
+            start_time=time.time(),
+        )
+        self.jobs[job.job_id] = job
+        while len(self.jobs) > _MAX_JOBS:
+            self.jobs.popitem(last=False)
+        return job
+
+    def get_jobs(self) -> List[LoadJob]:
+        return list(self.jobs.values())
+
+    def get_job(self, job_id: str) -> Optional[LoadJob]:
+        return self.jobs.get(job_id)
+
+    def _run_load(self, key: Tuple, job: LoadJob, model_para: ModelIn, benchmark: bool) -> BaseComponent:
+        try:
+            job.status = "loading"
+            if benchmark:
+                model, tokenizer, bench_hook = self.load_model_ben(model_para)
+            else:
+                model = self.load_model(model_para)
+            job.load_time = time.time()
+            if MODEL_WARMUP:
+                job.status = "warming"
+                model.warmup()
+            if benchmark:
+                if bench_hook is not None:
+                    # The warmup is not a benchmarked request
+                    bench_hook.clear_time_list()
+                    bench_hook.clear_time_infer_list()
+                self._bench_tools[key] = (tokenizer, bench_hook)
+            self.add(model)
+            job.status = "ready"
+            return model
+        except Exception as e:
+            print(f"Error loading model {model_para.model_id}: {e}")
+            job.status = "failed"
+            job.error = str(e)
+            raise
+        finally:
+            job.end_time = time.time()
+            with self._jobs_lock:
+                self._running.pop(key, None)
+
+    def submit_load(self, model_para: ModelIn, benchmark: bool = False) -> Tuple[LoadJob, Future]:
+        # Returns the job and future of the model, a loaded model gets a job that is already done.
+        # A benchmark load also keeps the tokenizer and benchmark hook of the model, see get_bench_tools().
+        key = get_load_key(model_para, benchmark)
+        with self._jobs_lock:
+            running = self._running.get(key)
+            if running is not None:
+                return running
+            job = self._new_job(model_para)
+            model = self.search_model(model_para)
+            if model is not None and (not benchmark or key in self._bench_tools):
+                job.status = "ready"
+                job.end_time = job.start_time
+                future = Future()
+                future.set_result(model)
+                return job, future
+            future = self._executor.submit(self._run_load, key, job, model_para, benchmark)
+            self._running[key] = (job, future)
+            return job, future
+
+    def get_or_load_model(self, model_para: ModelIn, benchmark: bool = False) -> BaseComponent:
+        _, future = self.submit_load(model_para, benchmark)
+        return future.result()
+
+    async def aget_or_load_model(self, model_para: ModelIn, benchmark: bool = False) -> BaseComponent:
+        _, future = self.submit_load(model_para, benchmark)
+        return await asyncio.wrap_future(future)
+
+    # Tokenizer and benchmark hook of a model loaded with benchmark=True
+    def get_bench_tools(self, model_para: ModelIn) -> Tuple[Any, Any]:
+        return self._bench_tools.get(get_load_key(model_para, True), (None, None))
+
     @staticmethod
     def load_model(model_para: ModelIn):
         model = None
@@ -119,6 +265,7 @@ class ModelMgr(BaseMgr):
                     model_para.model_path,
                     device=model_para.device,
                     weight=model_para.weight,
+                    ov_config=get_ov_config(model_para.model_path, model_para.device),
                 )
                 from llm_bench_utils.hook_common import get_bench_hook
 
@@ -1,35 +1,87 @@
 # Copyright (C) 2024 Intel Corporation
 # SPDX-License-Identifier: Apache-2.0
 
-from typing import List
+from typing import Dict, Iterable, List, Tuple
 
 from edgecraftrag.api_schema import IndexerIn, ModelIn, NodeParserIn
 from edgecraftrag.base import BaseComponent, BaseMgr, CallbackType, ModelType
 from llama_index.core.schema import BaseNode
 
 
+def get_node_file_key(node: BaseNode) -> str:
+    # Nodes parsed from files carry their path, text uploads fall back to the source document id
+    return node.metadata.get("file_path") or node.ref_doc_id or node.node_id
+
+
 class NodeMgr:
 
     def __init__(self):
+        # np_idx -> {node_id: node}, insertion ordered
         self.nodes = {}
+        # np_idx -> {file key: [node_id]}
+        self.file_nodes = {}
 
     # idx: index of node_parser
     def add_nodes(self, np_idx, nodes):
-        if np_idx in self.nodes:
-            self.nodes[np_idx].extend(nodes)
-        else:
-            self.nodes[np_idx] = nodes
+        np_nodes = self.nodes.setdefault(np_idx, {})
+        np_files = self.file_nodes.setdefault(np_idx, {})
+        for node in nodes:
+            if node.node_id not in np_nodes:
+                np_files.setdefault(get_node_file_key(node), []).append(node.node_id)
+            np_nodes[node.node_id] = node
+
+    def del_nodes(self, np_idx, node_ids: Iterable[str]) -> List[str]:
+        np_nodes = self.nodes.get(np_idx, {})
+        np_files = self.file_nodes.get(np_idx, {})
+        removed = []
+        for node_id in node_ids:
+            node = np_nodes.pop(node_id, None)
+            if node is None:
+                continue
+            key = get_node_file_key(node)
+            if node_id in np_files.get(key, []):
+                np_files[key].remove(node_id)
+                if not np_files[key]:
+                    del np_files[key]
+            removed.append(node_id)
+        return removed
 
-    # TODO: to be implemented
-    def del_nodes(self, nodes):
-        pass
+    # Remove the nodes of the given files from every node parser,
+    # return the removed node ids grouped by node parser
+    def del_nodes_by_file(self, file_keys: Iterable[str]) -> Dict[str, List[str]]:
+        removed = {}
+        for np_idx, np_files in self.file_nodes.items():
+            np_nodes = self.nodes.get(np_idx, {})
+            node_ids = []
+            for key in file_keys:
+                for node_id in np_files.pop(key, []):
+                    if np_nodes.pop(node_id, None) is not None:
+                        node_ids.append(node_id)
+            if node_ids:
+                removed[np_idx] = node_ids
+        return removed
 
     def del_nodes_by_np_idx(self, np_idx):
         if np_idx in self.nodes:
             del self.nodes[np_idx]
+        if np_idx in self.file_nodes:
+            del self.file_nodes[np_idx]
+
+    # Take the nodes of a node parser out, attach_nodes() puts them back when switching knowledge bases
+    def detach_nodes(self, np_idx) -> Tuple[Dict[str, BaseNode], Dict[str, List[str]]]:
+        return self.nodes.pop(np_idx, {}), self.file_nodes.pop(np_idx, {})
+
+    def attach_nodes(self, np_idx, state: Tuple[Dict[str, BaseNode], Dict[str, List[str]]]):
+        self.nodes[np_idx], self.file_nodes[np_idx] = state
+
+    def get_file_keys(self, np_idx) -> List[str]:
+        return list(self.file_nodes.get(np_idx, {}))
 
     def get_nodes(self, np_idx) -> List[BaseNode]:
         if np_idx in self.nodes:
-            return self.nodes[np_idx]
+            return list(self.nodes[np_idx].values())
         else:
             return []
+
+    def get_node_ids_by_file(self, np_idx, file_key) -> List[str]:
+        return list(self.file_nodes.get(np_idx, {}).get(file_key, []))
@@ -9,14 +9,16 @@ from comps.cores.proto.api_protocol import ChatCompletionRequest
 from edgecraftrag.base import BaseMgr, CallbackType
 from edgecraftrag.components.pipeline import Pipeline
 from edgecraftrag.controllers.nodemgr import NodeMgr
+from edgecraftrag.controllers.stagemgr import StageMgr
 from llama_index.core.schema import Document
 
 
 class PipelineMgr(BaseMgr):
 
-    def __init__(self):
+    def __init__(self, stage_mgr: StageMgr = None):
         self._active_pipeline = None
         self._lock = asyncio.Lock()
+        self._stage_mgr = stage_mgr
         super().__init__()
 
     def create_pipeline(self, name: str, origin_json: str):
@@ -83,19 +85,21 @@ class PipelineMgr(BaseMgr):
         for _, pl in self.components.items():
             pl.set_node_change()
 
-    def run_pipeline(self, chat_request: ChatCompletionRequest) -> Any:
+    async def run_pipeline(self, chat_request: ChatCompletionRequest, session=None) -> Any:
         ap = self.get_active_pipeline()
         out = None
         if ap is not None:
-            out = ap.run(cbtype=CallbackType.PIPELINE, chat_request=chat_request)
+            out = await ap.run(
+                cbtype=CallbackType.PIPELINE, chat_request=chat_request, stage_mgr=self._stage_mgr, session=session
+            )
             return out
         return -1
 
-    def run_retrieve(self, chat_request: ChatCompletionRequest) -> Any:
+    async def run_retrieve(self, chat_request: ChatCompletionRequest) -> Any:
         ap = self.get_active_pipeline()
         out = None
         if ap is not None:
-            out = ap.run(cbtype=CallbackType.RETRIEVE, chat_request=chat_request)
+            out = await ap.run(cbtype=CallbackType.RETRIEVE, chat_request=chat_request, stage_mgr=self._stage_mgr)
             return out
         return -1
 
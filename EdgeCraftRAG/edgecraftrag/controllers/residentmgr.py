@@ -0,0 +1,156 @@
+# Copyright (C) 2025 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Tuple
+
+from edgecraftrag.base import IndexerType
+
+# Memory budget of the knowledge base indexes kept in RAM, including the attached ones
+RESIDENT_KB_MEMORY_MB = int(os.getenv("RESIDENT_KB_MEMORY_MB", "2048"))
+
+
+class ResidentIndex:
+
+    __slots__ = ("kb_state", "node_state", "memory_bytes", "last_used")
+
+    def __init__(self, kb_state: Dict[str, Any], node_state, memory_bytes: int):
+        self.kb_state = kb_state
+        self.node_state = node_state
+        self.memory_bytes = memory_bytes
+        self.last_used = time.time()
+
+
+class ResidentIndexMgr:
+    """Keeps the indexes of recently used knowledge bases in memory.
+
+    Switching the knowledge base of an indexer detaches the indexed state of
+    the current one (vector store, docstore, BM25 postings and the nodes in
+    NodeMgr) and parks it, a parked knowledge base is switched back to by
+    attaching its state again. Parked indexes are evicted least recently used
+    first once they exceed the memory budget, an evicted knowledge base is
+    restored from its latest snapshot instead of being reindexed. Milvus
+    indexers keep their collections in Milvus and are switched as before.
+    """
+
+    def __init__(self, node_mgr, snapshot_mgr, ingest_mgr, memory_budget_mb: int = RESIDENT_KB_MEMORY_MB):
+        self._node_mgr = node_mgr
+        self._snapshot_mgr = snapshot_mgr
+        self._ingest_mgr = ingest_mgr
+        self.memory_budget = max(0, memory_budget_mb) * 1024**2
+        # (indexer idx, knowledge base name) -> parked index, least recently used first
+        self._parked: "OrderedDict[Tuple[str, str], ResidentIndex]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.last_switch_sec = 0.0
+
+    @staticmethod
+    def supported(pl) -> bool:
+        return (
+            pl is not None
+            and pl.indexer is not None
+            and pl.node_parser is not None
+            and pl.indexer.comp_subtype != IndexerType.MILVUS_VECTOR
+        )
+
+    def _in_sync(self, pl) -> bool:
+        # The nodes known to NodeMgr must be the ones in the indexer, e.g. not after a node parser change
+        return len(pl.indexer.index_struct.nodes_dict) == len(self._node_mgr.nodes.get(pl.node_parser.idx, {}))
+
+    def _parkable(self, pl) -> bool:
+        return bool(pl.indexer.index_struct.nodes_dict) and self._in_sync(pl)
+
+    def _save_snapshot(self, pl):
+        # A snapshot of the parked knowledge base lets it be evicted without reindexing,
+        # one taken since its last change is still current
+        indexer = pl.indexer
+        if not self._parkable(pl) or not self._snapshot_mgr.supported(pl):
+            return
+        if self._snapshot_mgr.is_saved(pl, indexer.kb_name):
+            return
+        try:
+            self._snapshot_mgr.save(pl, indexer.kb_name)
+        except Exception as e:
+            print(f"Error saving snapshot: {e}")
+
+    def _park(self, pl):
+        indexer = pl.indexer
+        if not self._parkable(pl):
+            self._node_mgr.detach_nodes(pl.node_parser.idx)
+            return
+        parked = ResidentIndex(
+            indexer.detach_kb_state(), self._node_mgr.detach_nodes(pl.node_parser.idx), indexer.memory_bytes()
+        )
+        self._parked[(indexer.idx, indexer.kb_name)] = parked
+
+    def _evict(self, attached_bytes: int):
+        used = attached_bytes + sum(parked.memory_bytes for parked in self._parked.values())
+        while self._parked and used > self.memory_budget:
+            (_, kb_name), parked = self._parked.popitem(last=False)
+            used -= parked.memory_bytes
+            self.evictions += 1
+            print(f"Evicted resident index of knowledge base {kb_name}, {parked.memory_bytes / 1024**2:.1f} MB")
+
+    def switch(self, pl, kb_name: str, file_paths: List[str]) -> Tuple[List[str], List[str]]:
+        # Returns the files still to be ingested and the indexed files no longer in the knowledge base
+        start = time.perf_counter()
+        indexer = pl.indexer
+        np_idx = pl.node_parser.idx
+        if indexer.kb_name != kb_name or not self._in_sync(pl):
+            if indexer.kb_name != kb_name:
+                # Retrievals keep reading the current knowledge base meanwhile
+                self._save_snapshot(pl)
+            # Retrievals running in the stage threads finish first, new ones wait for the swap
+            with indexer.swapping():
+                if indexer.kb_name != kb_name:
+                    self._park(pl)
+                else:
+                    self._node_mgr.detach_nodes(np_idx)
+                parked = self._parked.pop((indexer.idx, kb_name), None)
+                if parked is not None:
+                    # Pointer swap, nothing is reloaded
+                    indexer.attach_kb_state(parked.kb_state)
+                    self._node_mgr.attach_nodes(np_idx, parked.node_state)
+                    self.hits += 1
+                else:
+                    indexer.reinitialize_indexer(kb_name)
+                    self._snapshot_mgr.restore(pl, kb_name, file_paths)
+                    self.misses += 1
+                pl.update_indexer_to_retriever()
+            self._evict(indexer.memory_bytes())
+        indexed = set(self._node_mgr.get_file_keys(np_idx))
+        targets = set(file_paths)
+        self.last_switch_sec = round(time.perf_counter() - start, 3)
+        return [path for path in file_paths if path not in indexed], [key for key in indexed if key not in targets]
+
+    async def switch_knowledge_base(self, pl, kb_name: str, file_paths: List[str]) -> Tuple[List[str], List[str]]:
+        # Ingestion jobs and snapshots do not run while the indexer state is swapped
+        async with self._ingest_mgr.lock:
+            return await asyncio.to_thread(self.switch, pl, kb_name, file_paths)
+
+    def drop(self, kb_name: str):
+        for key in [key for key in self._parked if key[1] == kb_name]:
+            del self._parked[key]
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "memory_budget_mb": self.memory_budget / 1024**2,
+            "parked_memory_mb": round(sum(parked.memory_bytes for parked in self._parked.values()) / 1024**2, 2),
+            "parked": [
+                {
+                    "indexer": indexer_idx,
+                    "knowledge_base": kb_name,
+                    "memory_mb": round(parked.memory_bytes / 1024**2, 2),
+                    "last_used": parked.last_used,
+                }
+                for (indexer_idx, kb_name), parked in self._parked.items()
+            ],
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "last_switch_sec": self.last_switch_sec,
+        }
@@ -0,0 +1,227 @@
+# Copyright (C) 2025 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, Optional
+
+# Rounds of chat history put into the prompt, 0 disables the history
+CHAT_HISTORY_ROUND = int(os.getenv("CHAT_HISTORY_ROUND", "0"))
+# Turns kept per session, older ones are dropped
+SESSION_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "32"))
+# Seconds after which an unused session is evicted from memory
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", "3600"))
+# Memory budget of the histories of all sessions
+SESSION_MEMORY_MB = float(os.getenv("SESSION_MEMORY_MB", "64"))
+# "memory", or "sqlite" to keep the histories in SESSION_DB_PATH across restarts
+SESSION_STORE = os.getenv("SESSION_STORE", "memory")
+SESSION_DB_PATH = os.getenv(
+    "SESSION_DB_PATH", os.path.join(os.getenv("TMPFILE_PATH", "/home/user/ui_cache"), "sessions.db")
+)
+DEFAULT_SESSION = "default_session"
+
+# Estimated bookkeeping bytes of a turn and of a session besides their text
+_TURN_OVERHEAD = 120
+_SESSION_OVERHEAD = 800
+
+
+class Turn:
+
+    __slots__ = ("role", "text", "tokens")
+
+    def __init__(self, role: str, text: str, tokens: int):
+        self.role = role
+        self.text = text
+        self.tokens = tokens
+
+    def render(self) -> str:
+        return f"{self.role}: {self.text}\n"
+
+    def memory_bytes(self) -> int:
+        return sys.getsizeof(self.text) + _TURN_OVERHEAD
+
+
+class SessionHistory:
+
+    __slots__ = ("turns", "memory_bytes", "last_used")
+
+    def __init__(self, max_turns: int):
+        # Ring buffer, the oldest turn is dropped when a turn is added to a full one
+        self.turns: deque = deque(maxlen=max_turns)
+        self.memory_bytes = _SESSION_OVERHEAD
+        self.last_used = time.monotonic()
+
+
+class SessionContext:
+    """Handle of the session of a request, passed along with the request."""
+
+    __slots__ = ("_mgr", "session_id")
+
+    def __init__(self, mgr: "SessionMgr", session_id: str):
+        self._mgr = mgr
+        self.session_id = session_id
+
+    def get_history(self, token_budget: Optional[int] = None) -> str:
+        return self._mgr.get_history(self.session_id, token_budget)
+
+    def add_turn(self, role: str, text: str, tokens: int = 0):
+        self._mgr.add_turn(self.session_id, role, text, tokens)
+
+    def clear(self):
+        self._mgr.clear(self.session_id)
+
+
+class SessionMgr:
+    """Chat histories of the sessions, kept as bounded ring buffers of turns.
+
+    Each turn keeps its token count, counted once when it is added, so the
+    history of a prompt is selected by budget without tokenizing it again.
+    Sessions are evicted least recently used first once they are idle for
+    idle_ttl seconds or the histories exceed the memory budget. With the
+    sqlite store every turn is also written to disk, an evicted or restarted
+    session is loaded back on its next request.
+    """
+
+    def __init__(
+        self,
+        history_rounds: int = CHAT_HISTORY_ROUND,
+        max_turns: int = SESSION_MAX_TURNS,
+        idle_ttl: float = SESSION_IDLE_TTL,
+        memory_budget_mb: float = SESSION_MEMORY_MB,
+        store: str = SESSION_STORE,
+        db_path: str = SESSION_DB_PATH,
+    ):
+        self.history_rounds = max(0, history_rounds)
+        self.max_turns = max(2, max_turns)
+        self.idle_ttl = idle_ttl
+        self.memory_budget = memory_budget_mb * 1024**2
+        # session id -> history, least recently used first
+        self._sessions: "OrderedDict[str, SessionHistory]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.store = store
+        self._db = None
+        if store == "sqlite":
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS turns (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "session TEXT NOT NULL, role TEXT NOT NULL, text TEXT NOT NULL, tokens INTEGER NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS turns_session ON turns (session, id)")
+            self._db.commit()
+
+    def get_session(self, session_id: Optional[str]) -> SessionContext:
+        if session_id in (None, "", "None"):
+            session_id = DEFAULT_SESSION
+        return SessionContext(self, session_id)
+
+    def _load(self, session_id: str) -> SessionHistory:
+        history = SessionHistory(self.max_turns)
+        if self._db is not None:
+            rows = self._db.execute(
+                "SELECT role, text, tokens FROM turns WHERE session = ? ORDER BY id DESC LIMIT ?",
+                (session_id, self.max_turns),
+            ).fetchall()
+            for role, text, tokens in reversed(rows):
+                turn = Turn(role, text, tokens)
+                history.turns.append(turn)
+                history.memory_bytes += turn.memory_bytes()
+        return history
+
+    def _get(self, session_id: str, create: bool) -> Optional[SessionHistory]:
+        # Called with the lock held
+        now = time.monotonic()
+        history = self._sessions.get(session_id)
+        if history is None:
+            if not create and self._db is None:
+                return None
+            history = self._load(session_id)
+            self._sessions[session_id] = history
+            self._memory_bytes += history.memory_bytes
+        else:
+            self._sessions.move_to_end(session_id)
+        history.last_used = now
+        self._evict(now)
+        return history
+
+    def _evict(self, now: float):
+        # The most recently used session is never evicted, it is the one of the running request
+        while len(self._sessions) > 1:
+            session_id, oldest = next(iter(self._sessions.items()))
+            if now - oldest.last_used <= self.idle_ttl and self._memory_bytes <= self.memory_budget:
+                break
+            del self._sessions[session_id]
+            self._memory_bytes -= oldest.memory_bytes
+            self.evictions += 1
+
+    def get_history(self, session_id: str, token_budget: Optional[int] = None) -> str:
+        # The most recent rounds that fit into token_budget, oldest first
+        if self.history_rounds <= 0:
+            return ""
+        with self._lock:
+            history = self._get(session_id, create=False)
+            if history is None:
+                return ""
+            selected = []
+            used = 0
+            for turn in reversed(history.turns):
+                if len(selected) >= self.history_rounds * 2:
+                    break
+                if token_budget is not None and selected and used + turn.tokens > token_budget:
+                    break
+                selected.append(turn)
+                used += turn.tokens
+        return "".join(turn.render() for turn in reversed(selected))
+
+    def add_turn(self, session_id: str, role: str, text: str, tokens: int = 0):
+        turn = Turn(role, text, tokens)
+        with self._lock:
+            history = self._get(session_id, create=True)
+            if len(history.turns) == history.turns.maxlen:
+                dropped = history.turns[0].memory_bytes()
+                history.memory_bytes -= dropped
+                self._memory_bytes -= dropped
+            history.turns.append(turn)
+            history.memory_bytes += turn.memory_bytes()
+            self._memory_bytes += turn.memory_bytes()
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT INTO turns (session, role, text, tokens) VALUES (?, ?, ?, ?)",
+                    (session_id, role, text, tokens),
+                )
+                # The table keeps the same ring of turns per session as the memory
+                self._db.execute(
+                    "DELETE FROM turns WHERE session = ? AND id NOT IN "
+                    "(SELECT id FROM turns WHERE session = ? ORDER BY id DESC LIMIT ?)",
+                    (session_id, session_id, self.max_turns),
+                )
+                self._db.commit()
+            self._evict(time.monotonic())
+
+    def clear(self, session_id: str):
+        with self._lock:
+            history = self._sessions.pop(session_id, None)
+            if history is not None:
+                self._memory_bytes -= history.memory_bytes
+            if self._db is not None:
+                self._db.execute("DELETE FROM turns WHERE session = ?", (session_id,))
+                self._db.commit()
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "store": self.store,
+                "history_rounds": self.history_rounds,
+                "max_turns": self.max_turns,
+                "idle_ttl_sec": self.idle_ttl,
+                "memory_budget_mb": self.memory_budget / 1024**2,
+                "memory_mb": round(self._memory_bytes / 1024**2, 3),
+                "sessions": len(self._sessions),
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,305 @@
+# Copyright (C) 2025 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from edgecraftrag.base import IndexerType
+from edgecraftrag.controllers.ingestmgr import get_parser_config
+from edgecraftrag.controllers.nodemgr import get_node_file_key
+from llama_index.core.storage.docstore.utils import doc_to_json, json_to_doc
+
+SNAPSHOT_DIR = os.path.join(os.getenv("TMPFILE_PATH", "/home/user/ui_cache"), "snapshots")
+ENABLE_SNAPSHOT = os.getenv("ENABLE_SNAPSHOT", "true").lower() == "true"
+# Seconds between checks for knowledge base changes, 0 only snapshots at shutdown
+SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", "60"))
+# Number of snapshot versions kept per pipeline and knowledge base
+SNAPSHOT_KEEP = int(os.getenv("SNAPSHOT_KEEP", "2"))
+SNAPSHOT_FORMAT_VERSION = 1
+
+
+def _safe_name(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", str(name))
+
+
+def _write_jsonl(path: str, items):
+    with open(path, "w", encoding="utf-8") as f:
+        for item in items:
+            f.write(json.dumps(doc_to_json(item), ensure_ascii=False))
+            f.write("\n")
+
+
+def _read_jsonl(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json_to_doc(json.loads(line)) for line in f if line.strip()]
+
+
+class SnapshotMgr:
+    """Versioned on-disk snapshots of the indexed knowledge base, one series
+    per (pipeline, knowledge base).
+
+    A snapshot holds the vector store (the FAISS index file, or the vectors of
+    the default store as a .npy matrix), the docstore nodes, the
+    documents of every file and the content hash of every file. When a
+    knowledge base is loaded again, on startup or after its resident index
+    was evicted, the latest compatible snapshot is restored and only new or
+    changed files are parsed and embedded again. Versions are written to a temporary
+    directory and renamed into place, so a crash never leaves a partial one.
+    """
+
+    def __init__(
+        self,
+        pipeline_mgr,
+        file_mgr,
+        node_mgr,
+        ingest_mgr,
+        root: str = SNAPSHOT_DIR,
+        enabled: bool = ENABLE_SNAPSHOT,
+        interval: float = SNAPSHOT_INTERVAL,
+        keep: int = SNAPSHOT_KEEP,
+    ):
+        self._pipeline_mgr = pipeline_mgr
+        self._file_mgr = file_mgr
+        self._node_mgr = node_mgr
+        self._ingest_mgr = ingest_mgr
+        self.root = root
+        self.enabled = enabled
+        self.interval = interval
+        self.keep = max(1, keep)
+        # (pipeline, knowledge base) -> indexer version of the last snapshot written or restored
+        self._saved_versions: Dict[Tuple[str, str], int] = {}
+        # file path -> (mtime_ns, size, sha256)
+        self._hashes: Dict[str, Tuple[int, int, str]] = {}
+        self._lock = threading.Lock()
+        self._task = None
+        self.last_snapshot: Optional[Dict[str, Any]] = None
+        self.last_restore: Optional[Dict[str, Any]] = None
+
+    def supported(self, pl) -> bool:
+        return (
+            self.enabled
+            and pl is not None
+            and pl.indexer is not None
+            and pl.node_parser is not None
+            and pl.indexer.comp_subtype != IndexerType.MILVUS_VECTOR
+        )
+
+    def _series_dir(self, pl, kb_name: str) -> str:
+        return os.path.join(self.root, _safe_name(pl.name), _safe_name(kb_name))
+
+    @staticmethod
+    def _versions(series_dir: str) -> List[int]:
+        if not os.path.isdir(series_dir):
+            return []
+        return sorted(int(name) for name in os.listdir(series_dir) if name.isdigit())
+
+    def _file_hash(self, path: str) -> str:
+        stat = os.stat(path)
+        cached = self._hashes.get(path)
+        if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            return cached[2]
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha.update(block)
+        digest = sha.hexdigest()
+        self._hashes[path] = (stat.st_mtime_ns, stat.st_size, digest)
+        return digest
+
+    @staticmethod
+    def _signature(pl) -> Dict[str, Any]:
+        # A snapshot only fits a pipeline producing the same nodes and vectors
+        model = getattr(pl.indexer, "model", None)
+        signature = {
+            "format": SNAPSHOT_FORMAT_VERSION,
+            "indexer_type": pl.indexer.comp_subtype,
+            "dim": pl.indexer.d,
+            "embedding_model": model.model_id if model else None,
+            "index_params": getattr(pl.indexer, "index_params", {}),
+            "node_parser": get_parser_config(pl.node_parser),
+        }
+        return json.loads(json.dumps(signature))
+
+    # Whether the latest snapshot of the knowledge base is of the version indexed now
+    def is_saved(self, pl, kb_name: str) -> bool:
+        return self._saved_versions.get((pl.name, kb_name)) == pl.indexer.version
+
+    def save(self, pl, kb_name: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            indexer = pl.indexer
+            indexer_version = indexer.version
+            key = (pl.name, kb_name)
+            if self._saved_versions.get(key) == indexer_version:
+                return None
+            series_dir = self._series_dir(pl, kb_name)
+            versions = self._versions(series_dir)
+            number = versions[-1] + 1 if versions else 1
+            tmp_dir = os.path.join(series_dir, f"{number}.tmp")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            os.makedirs(tmp_dir)
+            start = time.perf_counter()
+            try:
+                nodes = list(indexer.docstore.docs.values())
+                # FileMgr holds the files of every knowledge base ingested so far, keep the indexed ones
+                file_keys = {get_node_file_key(node) for node in nodes}
+                files = {}
+                documents = []
+                for file in self._file_mgr.get_files():
+                    path = str(file.file_path) if file.file_path else ""
+                    if path not in file_keys or not os.path.isfile(path):
+                        continue
+                    files[path] = {"hash": self._file_hash(path), "doc_ids": [doc.doc_id for doc in file.documents]}
+                    documents.extend(file.documents)
+                _write_jsonl(os.path.join(tmp_dir, "nodes.jsonl"), nodes)
+                _write_jsonl(os.path.join(tmp_dir, "documents.jsonl"), documents)
+                manifest = self._signature(pl)
+                manifest.update(
+                    version=number,
+                    created=time.time(),
+                    pipeline=pl.name,
+                    knowledge_base=kb_name,
+                    node_count=len(nodes),
+                    files=files,
+                    vector_store=indexer.save_vector_store(tmp_dir),
+                )
+                # The manifest is written last, a version directory without it is incomplete
+                with open(os.path.join(tmp_dir, "manifest.json"), "w", encoding="utf-8") as f:
+                    json.dump(manifest, f, ensure_ascii=False)
+                os.rename(tmp_dir, os.path.join(series_dir, str(number)))
+            except Exception:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+                raise
+            for old in versions[: max(0, len(versions) + 1 - self.keep)]:
+                shutil.rmtree(os.path.join(series_dir, str(old)), ignore_errors=True)
+            self._saved_versions[key] = indexer_version
+            self.last_snapshot = {
+                "pipeline": pl.name,
+                "knowledge_base": kb_name,
+                "version": number,
+                "files": len(files),
+                "nodes": len(nodes),
+                "elapsed_sec": round(time.perf_counter() - start, 3),
+                "created": manifest["created"],
+            }
+            return self.last_snapshot
+
+    def _load_manifest(self, pl, kb_name: str) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        series_dir = self._series_dir(pl, kb_name)
+        for number in reversed(self._versions(series_dir)):
+            directory = os.path.join(series_dir, str(number))
+            manifest_path = os.path.join(directory, "manifest.json")
+            if not os.path.exists(manifest_path):
+                continue
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            signature = self._signature(pl)
+            if all(manifest.get(k) == v for k, v in signature.items()):
+                return directory, manifest
+            # Written by another pipeline configuration, an older version may still fit
+        return None, None
+
+    def restore(self, pl, kb_name: str, file_paths: List[str]) -> List[str]:
+        # Returns the files that still need to be ingested
+        if not self.supported(pl) or pl.indexer.index_struct.nodes_dict:
+            return list(file_paths)
+        with self._lock:
+            directory, manifest = self._load_manifest(pl, kb_name)
+            if directory is None:
+                return list(file_paths)
+            start = time.perf_counter()
+            snapshot_files = manifest["files"]
+            unchanged = set()
+            for path in file_paths:
+                if path in snapshot_files and os.path.isfile(path):
+                    if self._file_hash(path) == snapshot_files[path]["hash"]:
+                        unchanged.add(path)
+            try:
+                nodes = _read_jsonl(os.path.join(directory, "nodes.jsonl"))
+                pl.indexer.load_vector_store(directory, manifest["vector_store"], nodes)
+                stale = [node.node_id for node in nodes if get_node_file_key(node) not in unchanged]
+                if stale:
+                    pl.indexer.delete_nodes(stale, delete_from_docstore=True)
+                self._node_mgr.add_nodes(
+                    pl.node_parser.idx, [node for node in nodes if get_node_file_key(node) in unchanged]
+                )
+                documents = {doc.doc_id: doc for doc in _read_jsonl(os.path.join(directory, "documents.jsonl"))}
+                for path in unchanged:
+                    docs = [documents[doc_id] for doc_id in snapshot_files[path]["doc_ids"] if doc_id in documents]
+                    for file in self._file_mgr.get_files_by_path(path):
+                        self._file_mgr.remove(file.idx)
+                    self._file_mgr.add_loaded_file(path, docs)
+            except Exception as e:
+                print(f"Error restoring snapshot {directory}: {e}")
+                for path in unchanged:
+                    for file in self._file_mgr.get_files_by_path(path):
+                        self._file_mgr.remove(file.idx)
+                self._node_mgr.del_nodes_by_np_idx(pl.node_parser.idx)
+                pl.indexer.reinitialize_indexer(kb_name)
+                pl.update_indexer_to_retriever()
+                return list(file_paths)
+            if not stale:
+                self._saved_versions[(pl.name, kb_name)] = pl.indexer.version
+            changed = [path for path in file_paths if path not in unchanged]
+            self.last_restore = {
+                "pipeline": pl.name,
+                "knowledge_base": kb_name,
+                "version": manifest["version"],
+                "restored_files": len(unchanged),
+                "changed_files": len(changed),
+                "restored_nodes": len(nodes) - len(stale),
+                "elapsed_sec": round(time.perf_counter() - start, 3),
+            }
+            print(
+                f"Restored {len(unchanged)} files from snapshot {directory} in {self.last_restore['elapsed_sec']}s, "
+                f"{len(changed)} files changed"
+            )
+            return changed
+
+    async def save_active(self) -> Optional[Dict[str, Any]]:
+        pl = self._pipeline_mgr.get_active_pipeline()
+        if not self.supported(pl):
+            return None
+        # Ingestion jobs and knowledge base switches are not interleaved with a snapshot
+        async with self._ingest_mgr.lock:
+            return await asyncio.to_thread(self.save, pl, pl.indexer.kb_name)
+
+    async def _run_periodic(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.save_active()
+            except Exception as e:
+                print(f"Error saving snapshot: {e}")
+
+    def start(self):
+        if self.enabled and self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run_periodic())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.save_active()
+        except Exception as e:
+            print(f"Error saving snapshot: {e}")
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "interval_sec": self.interval,
+            "keep": self.keep,
+            "last_snapshot": self.last_snapshot,
+            "last_restore": self.last_restore,
+        }
@@ -0,0 +1,152 @@
+# Copyright (C) 2025 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from edgecraftrag.base import CompType
+from fastapi.responses import StreamingResponse
+
+# Threads shared by all pipeline stages
+STAGE_WORKERS = int(os.getenv("STAGE_WORKERS", "8"))
+# Number of requests running a stage at the same time, the others wait in the stage queue
+STAGE_CONCURRENCY = {
+    CompType.RETRIEVER: int(os.getenv("RETRIEVER_CONCURRENCY", "4")),
+    CompType.POSTPROCESSOR: int(os.getenv("POSTPROCESSOR_CONCURRENCY", "2")),
+    CompType.GENERATOR: int(os.getenv("GENERATOR_CONCURRENCY", "2")),
+}
+_DEFAULT_CONCURRENCY = 2
+
+
+class StageMetrics:
+
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_run = 0.0
+        # Counters are read from other threads than the event loop updating them
+        self._lock = threading.Lock()
+
+    def enqueue(self):
+        with self._lock:
+            self.queued += 1
+
+    def dequeue(self, wait: Optional[float] = None):
+        # wait is None when the request left the queue without running
+        with self._lock:
+            self.queued -= 1
+            if wait is not None:
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+                self.running += 1
+
+    def finish(self, run_time: float, failed: bool):
+        with self._lock:
+            self.running -= 1
+            self.total_run += run_time
+            if failed:
+                self.failed += 1
+            else:
+                self.completed += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            finished = self.completed + self.failed
+            return {
+                "concurrency": self.concurrency,
+                "queued": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "avg_wait_sec": round(self.total_wait / finished, 4) if finished else 0.0,
+                "max_wait_sec": round(self.max_wait, 4),
+                "avg_run_sec": round(self.total_run / finished, 4) if finished else 0.0,
+            }
+
+
+class StageMgr:
+    """Runs the blocking pipeline stages (retrieve, postprocess, generate) in a
+    dedicated thread pool so the event loop keeps serving other requests.
+
+    Each stage is bounded by its own concurrency limit, requests beyond the
+    limit wait in the stage queue. Queue length, wait and run times are
+    tracked per stage.
+    """
+
+    def __init__(self, workers: int = STAGE_WORKERS, concurrency: Dict[str, int] = STAGE_CONCURRENCY):
+        self.workers = max(1, workers)
+        self._concurrency = dict(concurrency)
+        self._executor = None
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._metrics: Dict[str, StageMetrics] = {}
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ecrag-stage")
+            return self._executor
+
+    def _get_stage(self, stage: str):
+        with self._lock:
+            if stage not in self._semaphores:
+                concurrency = max(1, self._concurrency.get(stage, _DEFAULT_CONCURRENCY))
+                self._semaphores[stage] = asyncio.Semaphore(concurrency)
+                self._metrics[stage] = StageMetrics(concurrency)
+            return self._semaphores[stage], self._metrics[stage]
+
+    async def run(self, stage: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+        semaphore, metrics = self._get_stage(stage)
+        metrics.enqueue()
+        enqueued = time.perf_counter()
+        try:
+            await semaphore.acquire()
+        except BaseException:
+            metrics.dequeue()
+            raise
+        metrics.dequeue(time.perf_counter() - enqueued)
+        start = time.perf_counter()
+        failed = True
+        streaming = False
+        try:
+            loop = asyncio.get_running_loop()
+            # Keep the context variables of the request in the worker thread
+            call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+            result = await loop.run_in_executor(self._get_executor(), call)
+            if isinstance(result, StreamingResponse):
+                # The work happens while the body is sent, the slot is held until the stream ends
+                result.body_iterator = self._hold_stage(result.body_iterator, semaphore, metrics, start)
+                streaming = True
+            failed = False
+            return result
+        finally:
+            if not streaming:
+                metrics.finish(time.perf_counter() - start, failed)
+                semaphore.release()
+
+    @staticmethod
+    async def _hold_stage(body_iterator, semaphore: asyncio.Semaphore, metrics: StageMetrics, start: float):
+        failed = True
+        try:
+            async for chunk in body_iterator:
+                yield chunk
+            failed = False
+        finally:
+            metrics.finish(time.perf_counter() - start, failed)
+            semaphore.release()
+
+    def get_metrics(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            metrics = list(self._metrics.items())
+        return {stage: stage_metrics.to_dict() for stage, stage_metrics in metrics}
@@ -0,0 +1,107 @@
+# Copyright (C) 2025 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import asyncio
+import glob
+import os
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+import psutil
+
+# Seconds between two samples of the system utilization
+SYSTEM_SAMPLE_INTERVAL = float(os.getenv("SYSTEM_SAMPLE_INTERVAL", "2"))
+# Samples kept for the history of the system info API
+SYSTEM_HISTORY_SIZE = int(os.getenv("SYSTEM_HISTORY_SIZE", "300"))
+
+
+def _read_number(path: str) -> Optional[float]:
+    try:
+        with open(path, "r") as f:
+            return float(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def find_gpu_freq_files() -> Optional[tuple]:
+    # Actual and maximum frequency of the Intel GPU, i915 and xe drivers expose them in sysfs
+    patterns = [
+        ("/sys/class/drm/card*/gt_act_freq_mhz", "gt_max_freq_mhz"),
+        ("/sys/class/drm/card*/device/tile0/gt0/freq0/act_freq", "max_freq"),
+    ]
+    for pattern, max_name in patterns:
+        for act_path in sorted(glob.glob(pattern)):
+            max_path = os.path.join(os.path.dirname(act_path), max_name)
+            if os.path.exists(max_path):
+                return act_path, max_path
+    return None
+
+
+class SystemSampler:
+    """Samples CPU, memory, disk and iGPU utilization every interval seconds.
+
+    Samples are kept in a ring buffer, so the system info API answers from
+    the latest one without blocking the event loop. CPU usage is the average
+    since the previous sample. The iGPU is reported by its current frequency
+    relative to the maximum one, where the driver exposes them.
+    """
+
+    def __init__(self, interval: float = SYSTEM_SAMPLE_INTERVAL, history_size: int = SYSTEM_HISTORY_SIZE):
+        self.interval = max(0.1, interval)
+        self._samples: deque = deque(maxlen=max(1, history_size))
+        self._gpu_freq_files = find_gpu_freq_files()
+        self._task = None
+        # The first call only sets the reference point of cpu_percent
+        psutil.cpu_percent(interval=None)
+
+    def sample(self) -> Dict[str, Any]:
+        memory_info = psutil.virtual_memory()
+        sample = {
+            "timestamp": time.time(),
+            "cpuUsage": psutil.cpu_percent(interval=None),
+            "memoryUsage": memory_info.percent,
+            "memoryUsed": memory_info.used / (1024**3),
+            "memoryTotal": memory_info.total / (1024**3),
+            "diskUsage": psutil.disk_usage("/").percent,
+        }
+        if self._gpu_freq_files is not None:
+            act_freq, max_freq = (_read_number(path) for path in self._gpu_freq_files)
+            if act_freq is not None and max_freq:
+                sample["gpuFrequency"] = act_freq
+                sample["gpuUsage"] = round(act_freq / max_freq * 100, 1)
+        self._samples.append(sample)
+        return sample
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.sample)
+            except Exception as e:
+                print(f"Error sampling system status: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get_latest(self) -> Dict[str, Any]:
+        # Sampled on demand when the background task is not running
+        if not self._samples:
+            return self.sample()
+        return self._samples[-1]
+
+    def get_history(self, count: int) -> List[Dict[str, Any]]:
+        if count <= 0:
+            return []
+        samples = list(self._samples)
+        return samples[-count:]
@@ -1,6 +1,7 @@
 # Copyright (C) 2024 Intel Corporation
 # SPDX-License-Identifier: Apache-2.0
 
+import asyncio
 import os
 
 import uvicorn
@@ -10,7 +11,11 @@ from edgecraftrag.api.v1.knowledge_base import kb_app, load_knowledge_from_file
 from edgecraftrag.api.v1.model import model_app
 from edgecraftrag.api.v1.pipeline import load_pipeline_from_file, pipeline_app
 from edgecraftrag.api.v1.prompt import prompt_app
-from edgecraftrag.api.v1.system import system_app
+from edgecraftrag.api.v1.system import get_platform_info, system_app
+from edgecraftrag.components.bm25 import flush_bm25_indexes
+from edgecraftrag.components.embedding_cache import save_embedding_caches
+from edgecraftrag.components.query_preprocess import close_http_session
+from edgecraftrag.context import ctx
 from edgecraftrag.utils import UI_DIRECTORY
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
@@ -22,7 +27,16 @@ async def lifespan(app: FastAPI):
     print("Restore pipeline configuration and knowledge base configuration...")
     load_pipeline_from_file()
     await load_knowledge_from_file()
+    ctx.get_snapshot_mgr().start()
+    ctx.get_system_sampler().start()
+    # Collected in the background, the first system info request finds it cached
+    asyncio.get_running_loop().run_in_executor(None, get_platform_info)
     yield
+    await ctx.get_system_sampler().stop()
+    await ctx.get_snapshot_mgr().stop()
+    await close_http_session()
+    save_embedding_caches()
+    flush_bm25_indexes()
 
 
 app = FastAPI(lifespan=lifespan)
@@ -1,14 +1,14 @@
 # Copyright (C) 2024 Intel Corporation
 # SPDX-License-Identifier: Apache-2.0
 
+import hashlib
 import io
 import os
+import threading
 from pathlib import Path
-from typing import Iterator, List, Optional
+from typing import Iterator
 
 from docx.text.paragraph import Paragraph
-from edgecraftrag.base import InferenceType
-from edgecraftrag.context import ctx
 from PIL import Image as Img
 from transformers import AutoTokenizer
 from unstructured.documents.elements import ElementMetadata, Image
@@ -44,6 +44,24 @@ class DocxParagraphPicturePartitioner:
             yield Image(text="IMAGE", metadata=element_metadata)
 
 
+# Process wide caches of tokenizers by model id, and of rendered chat templates
+# by (model id, sha256 of the template source, enable_think)
+_tokenizers = {}
+_prompt_templates = {}
+_tokenizers_lock = threading.Lock()
+
+
+def get_tokenizer(model_id):
+    tokenizer = _tokenizers.get(model_id)
+    if tokenizer is None:
+        with _tokenizers_lock:
+            tokenizer = _tokenizers.get(model_id)
+            if tokenizer is None:
+                tokenizer = AutoTokenizer.from_pretrained(model_id)
+                _tokenizers[model_id] = tokenizer
+    return tokenizer
+
+
 def get_prompt_template(model_id, prompt_content=None, template_path=None, enable_think=False):
     if prompt_content is not None:
         template = prompt_content
@@ -51,8 +69,11 @@ def get_prompt_template(model_id, prompt_content=None, template_path=None, enabl
         template = Path(template_path).read_text(encoding=None)
     else:
         template = DEFAULT_TEMPLATE
-    tokenizer = AutoTokenizer.from_pretrained(model_id)
-    model_id = model_id.split("/")[-1]
+    key = (model_id, hashlib.sha256(template.encode("utf-8")).hexdigest(), bool(enable_think))
+    prompt_template = _prompt_templates.get(key)
+    if prompt_template is not None:
+        return prompt_template
+    tokenizer = get_tokenizer(model_id)
     messages = [{"role": "system", "content": template}, {"role": "user", "content": "\n{input}\n"}]
     prompt_template = tokenizer.apply_chat_template(
         messages,
@@ -60,6 +81,7 @@ def get_prompt_template(model_id, prompt_content=None, template_path=None, enabl
         add_generation_prompt=True,
         enable_thinking=enable_think,  # Switches between thinking and non-thinking modes. Default is True.
     )
+    _prompt_templates[key] = prompt_template
     return prompt_template
 
 
@@ -90,58 +112,4 @@ def compare_mappings(new_dict, old_dict):
         deleted = {name: old_files[name] for name in set(old_files) - set(new_files)}
         if deleted:
             deleted_files[key] = deleted
-
-    for key in list(added_files.keys()):
-        if key in deleted_files:
-            del added_files[key]
     return added_files, deleted_files
-
-
-_history_map = {}
-_current_session_id: Optional[str] = None
-
-
-def set_current_session(session_id: str) -> None:
-    global _current_session_id
-    _current_session_id = session_id if session_id not in (None, "", "None") else "default_session"
-
-
-def get_current_session() -> Optional[str]:
-    return _current_session_id
-
-
-def clear_history() -> None:
-    session_id = get_current_session()
-    if session_id in _history_map:
-        _history_map[session_id] = []
-
-
-def save_history(message: str) -> str:
-    session_id = get_current_session()
-    _history_map.setdefault(session_id, []).append(f"content: {message}")
-    return "History appended successfully"
-
-
-def concat_history(message: str) -> str:
-    max_token = 6000
-    active_pl = ctx.get_pipeline_mgr().get_active_pipeline()
-    if active_pl.generator.inference_type == InferenceType.VLLM:
-        vllm_max_len = int(os.getenv("MAX_MODEL_LEN", "5000"))
-        if vllm_max_len > 5000:
-            max_token = vllm_max_len - 1024
-
-    history_id = get_current_session()
-    history_id_list = _history_map.get(history_id, [])
-    str_message = get_recent_chat_rounds(history_id_list)
-    _history_map.setdefault(history_id, []).append(f"user: {message}")
-    return str_message[-max_token:] if len(str_message) > max_token else str_message
-
-
-def get_recent_chat_rounds(history_id_list: List[str]) -> str:
-    history_num = int(os.getenv("CHAT_HISTORY_ROUND", "0"))
-    actual_rounds = min(history_num, len(history_id_list) // 2)
-    if actual_rounds <= 0:
-        return ""
-    start_index = max(0, len(history_id_list) - (actual_rounds * 2 + 1))
-    recent_history = history_id_list[start_index:]
-    return "".join(recent_history)
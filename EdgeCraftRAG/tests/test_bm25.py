@@ -0,0 +1,124 @@
+# Copyright (C) 2025 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import json
+import math
+
+import pytest
+from edgecraftrag.components.bm25 import BM25Index, flush_bm25_indexes, tokenize
+from llama_index.core.schema import TextNode
+
+
+def make_nodes(texts):
+    return [TextNode(id_=f"n{i}", text=text) for i, text in enumerate(texts)]
+
+
+@pytest.fixture
+def corpus():
+    return make_nodes(
+        [
+            "the arc gpu runs openvino models",
+            "milvus stores vectors for retrieval",
+            "openvino compiles models for the arc gpu and the cpu",
+        ]
+    )
+
+
+def test_tokenize_drops_stopwords_and_splits_cjk():
+    assert tokenize("The A12-3B part is in stock") == ["a12", "3b", "part", "stock"]
+    assert tokenize("向量检索") == ["向", "量", "检", "索"]
+
+
+def test_tokenize_keeps_words_of_any_script():
+    tokens = tokenize("Café Übersicht Привет мир 日本語のテキスト 한국어 naïve")
+    assert tokens[:9] == ["café", "übersicht", "привет", "мир", "日", "本", "語", "のテキスト", "한국어"]
+    # Whole, also once stemmed when PyStemmer is installed
+    assert len(tokens) == 10 and tokens[9].startswith("naïv")
+
+    index = BM25Index(persist_dir=None)
+    index.add_nodes(make_nodes(["Привет мир", "한국어 문서", "naïve café"]))
+    assert [node_id for node_id, _ in index.search("мир", 3)] == ["n0"]
+    assert [node_id for node_id, _ in index.search("한국어", 3)] == ["n1"]
+    assert [node_id for node_id, _ in index.search("Naïve", 3)] == ["n2"]
+
+
+def test_scores_match_okapi_formula(corpus):
+    index = BM25Index(persist_dir=None)
+    index.add_nodes(corpus)
+    hits = index.search("milvus", 3)
+    assert [node_id for node_id, _ in hits] == ["n1"]
+
+    n, df, k1, b = 3, 1, index.k1, index.b
+    tf, dl = 1, len(tokenize(corpus[1].text))
+    avgdl = sum(len(tokenize(node.text)) for node in corpus) / n
+    idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+    expected = idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))
+    assert hits[0][1] == pytest.approx(expected)
+
+
+def test_search_ranks_and_filters(corpus):
+    index = BM25Index(persist_dir=None)
+    index.add_nodes(corpus)
+    ranked = [node_id for node_id, _ in index.search("openvino arc gpu", 3)]
+    assert set(ranked) == {"n0", "n2"}
+    assert [node_id for node_id, _ in index.search("openvino", 3, node_ids={"n2"})] == ["n2"]
+    assert index.search("unknown", 3) == []
+    assert index.search("openvino", 0) == []
+
+
+def test_add_delete_keep_statistics(corpus):
+    index = BM25Index(persist_dir=None)
+    index.add_nodes(corpus)
+    index.delete_nodes(["n0"])
+    assert len(index) == 2 and "n0" not in index
+    assert index.avgdl == pytest.approx(sum(len(tokenize(node.text)) for node in corpus[1:]) / 2)
+    assert [node_id for node_id, _ in index.search("openvino", 3)] == ["n2"]
+
+    # Re-adding a node with new text replaces its postings
+    index.add_nodes([TextNode(id_="n2", text="milvus only")])
+    assert "openvino" not in index._postings
+    assert {node_id for node_id, _ in index.search("milvus", 3)} == {"n1", "n2"}
+
+    index.delete_nodes(["n1", "n2", "missing"])
+    assert len(index) == 0 and index.avgdl == 0.0 and index._postings == {}
+
+
+def test_persistence_round_trip(tmp_path, corpus):
+    index = BM25Index("kb", persist_dir=str(tmp_path))
+    index.add_nodes(corpus)
+    index.flush()
+    with open(tmp_path / "kb.json", encoding="utf-8") as f:
+        assert set(json.load(f)["docs"]) == {"n0", "n1", "n2"}
+
+    restored = BM25Index("kb", persist_dir=str(tmp_path), restore_postings=True)
+    assert len(restored) == 3
+    assert restored.search("openvino gpu", 3) == pytest.approx(index.search("openvino gpu", 3))
+
+    # Without restore_postings the file only warms the term frequency cache
+    warm = BM25Index("kb", persist_dir=str(tmp_path))
+    assert len(warm) == 0 and len(warm._tf_cache) == 3
+
+
+def test_changes_are_saved_periodically_not_per_write(tmp_path, corpus):
+    index = BM25Index("kb", persist_dir=str(tmp_path))
+    index.add_nodes(corpus[:2])
+    index.add_nodes(corpus[2:])
+    index.delete_nodes(["n0"])
+    assert not (tmp_path / "kb.json").exists()
+    flush_bm25_indexes()
+    assert set(BM25Index("kb", persist_dir=str(tmp_path), restore_postings=True)._doc_len) == {"n1", "n2"}
+
+
+def test_new_index_of_a_file_saves_pending_changes_first(tmp_path, corpus):
+    index = BM25Index("kb", persist_dir=str(tmp_path))
+    index.add_nodes(corpus)
+    # E.g. the indexer reinitialized for the same Milvus collection
+    assert len(BM25Index("kb", persist_dir=str(tmp_path), restore_postings=True)) == 3
+
+
+def test_tf_cache_is_bounded():
+    index = BM25Index(persist_dir=None, tf_cache_size=2)
+    index.add_nodes(make_nodes(["one", "two", "three"]))
+    assert len(index._tf_cache) == 2
+    # Evicted entries only cost a re-tokenization, the postings are unaffected
+    assert len(index) == 3 and index.search("one", 1)[0][0] == "n0"
@@ -0,0 +1,48 @@
+# Copyright (C) 2025 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import numpy as np
+from edgecraftrag.components.embedding_cache import EmbeddingCache
+
+DIM = 8
+
+
+def make_cache(path, max_entries=64):
+    return EmbeddingCache("model/a", DIM, max_entries * (DIM * 4 + 24), cache_dir=str(path))
+
+
+def vector(seed):
+    return np.random.default_rng(seed).random(DIM, dtype=np.float32).tolist()
+
+
+def test_get_put_and_reload_without_index_save(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put_many(["a", "b"], [vector(1), vector(2)])
+    assert cache.get_many(["a", "c"]) == [vector(1), None]
+    # The slot map is rebuilt from keys.bin even though index.json was never saved
+    reloaded = make_cache(tmp_path)
+    assert reloaded.get_many(["b", "a"]) == [vector(2), vector(1)]
+
+
+def test_recency_order_survives_save(tmp_path):
+    cache = make_cache(tmp_path, max_entries=2)
+    cache.put_many(["a", "b"], [vector(1), vector(2)])
+    cache.get_many(["a"])
+    cache.save()
+    reloaded = make_cache(tmp_path, max_entries=2)
+    # "b" is the least recently used and is evicted first
+    reloaded.put_many(["c"], [vector(3)])
+    assert reloaded.get_many(["a", "b", "c"]) == [vector(1), None, vector(3)]
+
+
+def test_torn_slot_is_a_miss(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put_many(["a"], [vector(1)])
+    cache.save()
+    # A crash after the vector of a reused slot was written but before its key
+    slot = cache._slots[cache.text_hash("a")]
+    cache._vectors[slot] = np.asarray(vector(2), dtype=np.float32)
+    cache._vectors.flush()
+    reloaded = make_cache(tmp_path)
+    assert reloaded.get_many(["a"]) == [None]
+    assert len(reloaded) == 0
@@ -0,0 +1,38 @@
+# Copyright (C) 2025 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import numpy as np
+from edgecraftrag.base import IndexerType
+from edgecraftrag.components import faiss_index
+from edgecraftrag.components.faiss_index import FaissANNVectorStore
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores.types import VectorStoreQuery
+
+DIM = 16
+
+
+def add_vectors(store, count, seed=0):
+    vectors = np.random.default_rng(seed).random((count, DIM), dtype=np.float32)
+    store.add([TextNode(id_=str(i), embedding=vector.tolist()) for i, vector in enumerate(vectors)])
+    return vectors
+
+
+def nearest(store, vector):
+    return store.query(VectorStoreQuery(query_embedding=vector.tolist(), similarity_top_k=1)).ids
+
+
+def test_ivf_trains_once_enough_vectors():
+    store = FaissANNVectorStore(IndexerType.FAISS_IVF_FLAT, DIM, {"nlist": 4, "nprobe": 4})
+    vectors = add_vectors(store, 4 * 39 - 1)
+    assert not store.trained
+    store.add([TextNode(id_="last", embedding=vectors[0].tolist())])
+    assert store.trained
+    assert nearest(store, vectors[5]) == ["5"]
+
+
+def test_ivf_pq_stays_exact_below_min_vectors(monkeypatch):
+    monkeypatch.setattr(faiss_index, "FAISS_PQ_MIN_VECTORS", 20000)
+    store = FaissANNVectorStore(IndexerType.FAISS_IVF_PQ, DIM, {"nlist": 4})
+    vectors = add_vectors(store, 39 * 256)
+    assert not store.trained
+    assert nearest(store, vectors[7]) == ["7"]
@@ -0,0 +1,67 @@
+# Copyright (C) 2025 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+import pytest
+
+pytest.importorskip("milvus_lite")
+
+from edgecraftrag.components import milvus_store  # noqa: E402
+from edgecraftrag.components.milvus_store import drop_milvus_collection, get_milvus_vector_store  # noqa: E402
+from llama_index.core.schema import TextNode  # noqa: E402
+from llama_index.core.vector_stores.types import VectorStoreQuery  # noqa: E402
+
+DIM = 4
+
+
+def make_nodes(count):
+    return [
+        TextNode(id_=f"n{i}", text=f"text {i}", embedding=[float(i), 1.0, 0.0, 0.0], metadata={"file_path": "a.txt"})
+        for i in range(count)
+    ]
+
+
+@pytest.fixture
+def uri(tmp_path, monkeypatch):
+    # Several insert requests per add(), so batching and the in-flight limit are exercised
+    monkeypatch.setattr(milvus_store, "MILVUS_INSERT_BATCH_SIZE", 3)
+    yield str(tmp_path / "milvus.db")
+    milvus_store._vector_stores.clear()
+
+
+def test_bulk_insert_is_visible_after_flush(uri):
+    store = get_milvus_vector_store(uri, "kb", DIM)
+    assert store.add(make_nodes(10)) == [f"n{i}" for i in range(10)]
+    store.flush()
+    nodes = store.get_nodes(node_ids=["n0", "n9"])
+    assert sorted(node.node_id for node in nodes) == ["n0", "n9"]
+    result = store.query(VectorStoreQuery(query_embedding=[9.0, 1.0, 0.0, 0.0], similarity_top_k=1))
+    assert result.ids == ["n9"]
+
+
+def test_store_is_cached_per_collection(uri):
+    store = get_milvus_vector_store(uri, "kb", DIM)
+    assert get_milvus_vector_store(uri, "kb", DIM) is store
+    assert get_milvus_vector_store(uri, "other", DIM) is not store
+
+
+def test_delete_waits_for_pending_inserts(uri):
+    store = get_milvus_vector_store(uri, "kb", DIM)
+    store.add(make_nodes(6))
+    store.delete_nodes(node_ids=["n1", "n4"])
+    store.flush()
+    assert sorted(node.node_id for node in store.get_nodes(node_ids=[f"n{i}" for i in range(6)])) == [
+        "n0",
+        "n2",
+        "n3",
+        "n5",
+    ]
+
+
+def test_drop_collection_evicts_cached_store(uri):
+    store = get_milvus_vector_store(uri, "kb", DIM)
+    store.add(make_nodes(3))
+    store.flush()
+    drop_milvus_collection(uri, "kb")
+    recreated = get_milvus_vector_store(uri, "kb", DIM)
+    assert recreated is not store
+    assert recreated.get_nodes(node_ids=["n0", "n1", "n2"]) == []
@@ -0,0 +1,116 @@
+# Copyright (C) 2025 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+"""Recall vs latency benchmark of the FAISS indexer types.
+
+Builds every FAISS vector store used by VectorIndexer on a synthetic,
+clustered corpus and compares search latency, recall@k against the exact
+flat index, build time and index size.
+
+    python tools/faiss_index_benchmark.py
+    python tools/faiss_index_benchmark.py --vectors 300000 --dim 384 --nlist 1024 --nprobe 8 16 32
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import faiss  # noqa: E402
+from edgecraftrag.base import IndexerType  # noqa: E402
+from edgecraftrag.components.faiss_index import FaissANNVectorStore, FaissIDMapVectorStore  # noqa: E402
+from llama_index.core.schema import TextNode  # noqa: E402
+from llama_index.core.vector_stores.types import VectorStoreQuery  # noqa: E402
+
+
+def make_corpus(count, dim, clusters, rng, latent_dim=32):
+    # Chunk embeddings of a knowledge base gather around topics and span far
+    # fewer directions than their dimension, draw them in a latent space first
+    rng_topics = np.random.default_rng(0)
+    centers = rng_topics.standard_normal((clusters, latent_dim))
+    projection = rng_topics.standard_normal((latent_dim, dim))
+    labels = rng.integers(0, clusters, count)
+    latent = centers[labels] + 0.5 * rng.standard_normal((count, latent_dim))
+    vectors = (latent @ projection + 0.5 * rng.standard_normal((count, dim))).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def build_store(store, vectors, batch_size=10000):
+    start = time.perf_counter()
+    for offset in range(0, len(vectors), batch_size):
+        batch = vectors[offset : offset + batch_size]
+        store.add([TextNode(id_=str(offset + i), embedding=vector.tolist()) for i, vector in enumerate(batch)])
+    return time.perf_counter() - start
+
+
+def run_queries(store, queries, top_k):
+    results = []
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        result = store.query(VectorStoreQuery(query_embedding=query.tolist(), similarity_top_k=top_k))
+        latencies.append(time.perf_counter() - start)
+        results.append(result.ids)
+    return results, np.array(latencies) * 1000
+
+
+def index_size_mb(store):
+    return faiss.serialize_index(store._faiss_index).nbytes / 1024**2
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 16, 64])
+    parser.add_argument("--m", type=int, default=None, help="HNSW neighbors / PQ sub-quantizers")
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 64, 256])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    vectors = make_corpus(args.vectors, args.dim, args.clusters, rng)
+    queries = make_corpus(args.queries, args.dim, args.clusters, rng)
+
+    # Search parameters are swept on one index per type, they need no rebuild
+    configs = [
+        ("faiss_vector", {}, "-", []),
+        (IndexerType.FAISS_HNSW, {"m": args.m}, "ef_search", args.ef_search),
+        (IndexerType.FAISS_IVF_FLAT, {"nlist": args.nlist}, "nprobe", args.nprobe),
+        (IndexerType.FAISS_IVF_SQ8, {"nlist": args.nlist}, "nprobe", args.nprobe),
+        (IndexerType.FAISS_IVF_PQ, {"nlist": args.nlist, "m": args.m}, "nprobe", args.nprobe),
+    ]
+
+    print(f"{args.vectors} vectors, dim {args.dim}, {args.queries} queries, recall@{args.top_k} against faiss_vector")
+    print(f"{'indexer':>16} {'params':>14} {'build_s':>8} {'size_mb':>8} {'p50_ms':>7} {'p99_ms':>7} {'recall':>7}")
+    truth = None
+    for vector_type, build_params, search_param, search_values in configs:
+        if vector_type == "faiss_vector":
+            store = FaissIDMapVectorStore(faiss_index=faiss.IndexIDMap2(faiss.IndexFlatL2(args.dim)))
+        else:
+            store = FaissANNVectorStore(vector_type, args.dim, build_params)
+        build_sec = build_store(store, vectors)
+        size_mb = index_size_mb(store)
+        name = getattr(vector_type, "value", vector_type)
+        for value in search_values or [None]:
+            if value is not None:
+                store.set_search_params(**{search_param: value})
+            results, latencies = run_queries(store, queries, args.top_k)
+            if truth is None:
+                truth = results
+            recall = np.mean([len(set(r) & set(t)) / len(t) for r, t in zip(results, truth)])
+            label = f"{search_param}={value}" if value is not None else "-"
+            p50, p99 = np.percentile(latencies, 50), np.percentile(latencies, 99)
+            print(f"{name:>16} {label:>14} {build_sec:>8.2f} {size_mb:>8.1f} {p50:>7.3f} {p99:>7.3f} {recall:>7.3f}")
+
+
+if __name__ == "__main__":
+    main()
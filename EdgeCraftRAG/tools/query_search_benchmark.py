@@ -0,0 +1,146 @@
+# Copyright (C) 2025 Intel Corporation
+# SPDX-License-Identifier: Apache-2.0
+
+"""End-to-end latency benchmark of query_search issue matching.
+
+Compares scoring every issue with one completions request per issue against
+batched prompt arrays, with and without the BM25/embedding shortlist, for
+100, 1k and 10k issues. By default a mock vLLM completions server simulating
+a fixed per-request overhead and a per-prompt cost is started, pass --endpoint
+to benchmark a real vLLM server instead.
+
+    python tools/query_search_benchmark.py
+    python tools/query_search_benchmark.py --endpoint http://localhost:8086 --model Qwen/Qwen3-8B
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from aiohttp import web  # noqa: E402
+from edgecraftrag.components import query_preprocess  # noqa: E402
+
+DEVICES = ["printer", "scanner", "router", "laptop", "monitor", "projector", "server", "switch", "camera", "phone"]
+SYMPTOMS = ["overheats", "reboots", "no power", "paper jam", "no signal", "slow", "noisy fan", "login fails"]
+
+MODES = {
+    "per_issue": {"batch_size": 1, "shortlist_top_m": 0},
+    "batched": {"batch_size": 32, "shortlist_top_m": 0},
+    "batched_shortlist": {"batch_size": 32, "shortlist_top_m": 50},
+}
+
+CONFIG_TEMPLATE = """query_matcher:
+  instructions: "Decide similarity of two queries. For exactly the same, mark as High, for totally different, mark as Low.\\n"
+  input_template: "<query> {{}} </query>\\n<query> {{}} </query>\\n"
+  output_template: "output from {{json_levels}}.\\n"
+  json_key: "similarity"
+  json_levels: ["Low", "Medium", "High"]
+  temperature: 3.7
+  batch_size: {batch_size}
+  shortlist_top_m: {shortlist_top_m}
+"""
+
+
+def make_issues(count):
+    return {
+        f"{random.choice(DEVICES)} {random.choice(SYMPTOMS)} error code E{i:05d}": f"Check the manual for E{i:05d}"
+        for i in range(count)
+    }
+
+
+def start_mock_vllm(port, request_ms, prompt_ms, concurrency):
+    # A request costs a fixed overhead plus a per-prompt cost, the server runs `concurrency` requests at a time
+    slots = asyncio.Semaphore(concurrency)
+    stats = {"requests": 0, "prompts": 0}
+
+    async def completions(request):
+        body = await request.json()
+        prompts = body["prompt"] if isinstance(body["prompt"], list) else [body["prompt"]]
+        async with slots:
+            await asyncio.sleep((request_ms + prompt_ms * len(prompts)) / 1000)
+        stats["requests"] += 1
+        stats["prompts"] += len(prompts)
+        choices = []
+        for index, prompt in enumerate(prompts):
+            # The query holds the exact error code of one issue, only that issue is relevant
+            query, issue = prompt.split("<query> ")[1:3]
+            code = re.search(r"E\d{5}", query).group(0)
+            logprobs = {"High": -0.01, "Low": -12.0} if code in issue else {"High": -12.0, "Low": -0.01}
+            choices.append({"index": index, "text": "High", "logprobs": {"top_logprobs": [logprobs]}})
+        return web.json_response({"choices": choices})
+
+    app = web.Application(client_max_size=64 * 1024**2)
+    app.router.add_post("/v1/completions", completions)
+    return app, stats
+
+
+async def run_benchmark(args):
+    stats = None
+    runner = None
+    endpoint = args.endpoint
+    if endpoint is None:
+        app, stats = start_mock_vllm(args.port, args.request_ms, args.prompt_ms, args.server_concurrency)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", args.port).start()
+        endpoint = f"http://127.0.0.1:{args.port}"
+
+    pl = SimpleNamespace(generator=SimpleNamespace(model_id=args.model, vllm_endpoint=endpoint), indexer=None)
+    print(f"{'issues':>8} {'mode':>18} {'latency_s':>10} {'requests':>9} {'prompts':>8}  top1")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for count in args.sizes:
+            search_dir = os.path.join(tmp_dir, f"search_dir_{count}")
+            os.makedirs(search_dir)
+            issues = make_issues(count)
+            with open(os.path.join(search_dir, "issues.json"), "w", encoding="utf-8") as f:
+                json.dump(issues, f)
+            target = random.choice(list(issues.keys()))
+            query = f"my {target.split(' error code ')[0]} shows {target.split()[-1]} ?"
+
+            for mode, settings in MODES.items():
+                config_path = os.path.join(tmp_dir, f"{mode}.yaml")
+                with open(config_path, "w", encoding="utf-8") as f:
+                    f.write(CONFIG_TEMPLATE.format(**settings))
+                # Warm up the search data, config and shortlist caches
+                await query_preprocess.query_search(query, config_path, search_dir, pl)
+                if stats is not None:
+                    stats.update(requests=0, prompts=0)
+                start = time.perf_counter()
+                top1_issue, _ = await query_preprocess.query_search(query, config_path, search_dir, pl)
+                latency = time.perf_counter() - start
+                requests = stats["requests"] if stats is not None else "-"
+                prompts = stats["prompts"] if stats is not None else "-"
+                hit = "ok" if top1_issue == target else "miss"
+                print(f"{count:>8} {mode:>18} {latency:>10.3f} {requests:>9} {prompts:>8}  {hit}")
+
+    await query_preprocess.close_http_session()
+    if runner is not None:
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoint", default=None, help="vLLM endpoint, a mock server is started if not set")
+    parser.add_argument("--model", default="Qwen/Qwen3-8B")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--port", type=int, default=18086, help="port of the mock server")
+    parser.add_argument("--request-ms", type=float, default=20.0, help="mock server overhead per request")
+    parser.add_argument("--prompt-ms", type=float, default=1.0, help="mock server cost per prompt")
+    parser.add_argument("--server-concurrency", type=int, default=16, help="requests the mock server runs at once")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    asyncio.run(run_benchmark(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -159,6 +159,7 @@ export default {
       vectorsimilarity: "retrieval according to vector similarity",
       autoMerge: "This retriever will try to merge context into parent context.",
       bm25: "A BM25 retriever that uses the BM25 algorithm to retrieve nodes.",
+      hybrid: "Runs vector similarity and BM25 retrieval concurrently and fuses their results.",
       faissVector: "Embeddings are stored within a Faiss index.",
       vector: "Vector Store Index.",
       simple: "Parse text with a preference for complete sentences.",
@@ -157,6 +157,7 @@ export default {
       vectorsimilarity: "根据向量相似性进行检索",
       autoMerge: "该检索器会尝试将上下文合并到父级上下文中",
       bm25: "使用BM25算法检索节点的BM25检索器",
+      hybrid: "同时进行向量相似性检索和BM25检索，并融合两者的结果",
       faissVector: "嵌入存储在Faiss索引中。",
       vector: "矢量存储索引",
       simple: "解析文本，优先选择完整的句子。",
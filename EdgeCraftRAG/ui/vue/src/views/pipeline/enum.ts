@@ -57,6 +57,11 @@ export const Retriever = [
     value: "bm25",
     describe: "pipeline.desc.bm25",
   },
+  {
+    name: "Hybrid",
+    value: "hybrid",
+    describe: "pipeline.desc.hybrid",
+  },
 ] as const;
 
 export const PostProcessor = [